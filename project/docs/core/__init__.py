@@ -7,17 +7,21 @@ Contains the orchestrator and utilities for PDF manipulation.
 __all__ = [
     "PDFInvoiceOrchestrator",
     "PDFUtils",
+    "DocumentTextModel",
 ]
 
 try:
     from .orchestrator import PDFInvoiceOrchestrator
     from .utils import PDFUtils
+    from .text_model import DocumentTextModel
 except ImportError:
     from orchestrator import PDFInvoiceOrchestrator
     from utils import PDFUtils
+    from text_model import DocumentTextModel
 
 __all__ = [
     "PDFInvoiceOrchestrator",
     "PDFUtils",
+    "DocumentTextModel",
 ]
 
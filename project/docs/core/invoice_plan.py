@@ -0,0 +1,153 @@
+"""
+Invoice Plan Module
+
+Compact, serializable description of the edits made to one page: the
+highlight rectangles and the corrected price texts. Plans contain only
+plain Python values so they can be built, passed between processes and
+drawn independently of the analysis.
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+Box = Tuple[float, float, float, float]
+
+
+class PagePlan:
+    """Edits for one page of an invoice."""
+
+    __slots__ = ("page_num", "label_rects", "highlights", "overlays", "price_count", "max_price")
+
+    def __init__(self, page_num: int):
+        self.page_num = page_num
+        self.label_rects: List[Box] = []                        # VAT label highlights
+        self.highlights: List[Box] = []                         # Price highlights
+        self.overlays: List[Tuple[float, float, str]] = []      # (x, y, new price text)
+        self.price_count = 0                                    # Prices found on the page
+        self.max_price: Optional[float] = None                  # Largest original price
+
+    def add_price(self, value: float) -> None:
+        """Record an original price found on the page."""
+        self.price_count += 1
+        if self.max_price is None or value > self.max_price:
+            self.max_price = value
+
+    def to_dict(self) -> Dict:
+        """
+        Convert to a plain dictionary.
+
+        Returns:
+            Dictionary with all fields (tuples as lists)
+        """
+        return {
+            "page_num": self.page_num,
+            "label_rects": [list(r) for r in self.label_rects],
+            "highlights": [list(r) for r in self.highlights],
+            "overlays": [list(o) for o in self.overlays],
+            "price_count": self.price_count,
+            "max_price": self.max_price,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "PagePlan":
+        """
+        Create a plan from a dictionary produced by ``to_dict``.
+
+        Args:
+            data: Plan dictionary
+
+        Returns:
+            PagePlan
+        """
+        plan = cls(data["page_num"])
+        plan.label_rects = [tuple(r) for r in data["label_rects"]]
+        plan.highlights = [tuple(r) for r in data["highlights"]]
+        plan.overlays = [tuple(o) for o in data["overlays"]]
+        plan.price_count = data["price_count"]
+        plan.max_price = data["max_price"]
+        return plan
+
+
+class InvoicePlan:
+    """
+    All decisions made for one invoice.
+
+    Produced once by the analysis; rendering only reads it, so the same
+    plan can be drawn in several styles, cached or sent to another process.
+    """
+
+    def __init__(self, detected_vat: float, page_count: int):
+        self.detected_vat = detected_vat
+        self.page_count = page_count
+        self.vat_amount: Optional[float] = None         # VAT amount printed on the invoice
+        self.country_code: Optional[str] = None
+        self.country_name: Optional[str] = None
+        self.prior_total: Optional[float] = None        # Invoice total including VAT
+        self.corrected_total: Optional[float] = None    # Invoice total without VAT
+        self.importer_box: Optional[Dict] = None        # Position and text of the importer box
+        self.prices_count = 0                           # Prices updated in the whole document
+        self.pages: List[PagePlan] = []
+
+    def result(self, output_paths: Optional[Dict] = None) -> Dict:
+        """
+        Build the metadata dictionary returned to callers.
+
+        Args:
+            output_paths: Rendered PDF per output style, if any
+
+        Returns:
+            Dictionary with extended metadata; 'output_path' is the first
+            rendered file
+        """
+        output_paths = dict(output_paths or {})
+        return {
+            'output_path': next(iter(output_paths.values()), None),
+            'output_paths': output_paths,
+            'detected_vat': self.detected_vat,
+            'country_code': self.country_code,
+            'country_name': self.country_name,
+            'prior_total': self.prior_total,
+            'corrected_total': self.corrected_total,
+            'prices_count': self.prices_count
+        }
+
+    def to_dict(self) -> Dict:
+        """
+        Convert to a JSON serializable dictionary.
+
+        Returns:
+            Dictionary with all fields
+        """
+        return {
+            "detected_vat": self.detected_vat,
+            "page_count": self.page_count,
+            "vat_amount": self.vat_amount,
+            "country_code": self.country_code,
+            "country_name": self.country_name,
+            "prior_total": self.prior_total,
+            "corrected_total": self.corrected_total,
+            "importer_box": dict(self.importer_box) if self.importer_box else None,
+            "prices_count": self.prices_count,
+            "pages": [page.to_dict() for page in self.pages],
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "InvoicePlan":
+        """
+        Create a plan from a dictionary produced by ``to_dict``.
+
+        Args:
+            data: Plan dictionary
+
+        Returns:
+            InvoicePlan
+        """
+        plan = cls(data["detected_vat"], data["page_count"])
+        plan.vat_amount = data["vat_amount"]
+        plan.country_code = data["country_code"]
+        plan.country_name = data["country_name"]
+        plan.prior_total = data["prior_total"]
+        plan.corrected_total = data["corrected_total"]
+        plan.importer_box = dict(data["importer_box"]) if data["importer_box"] else None
+        plan.prices_count = data["prices_count"]
+        plan.pages = [PagePlan.from_dict(page) for page in data["pages"]]
+        return plan
@@ -0,0 +1,279 @@
+"""
+Layout Templates Module
+
+Recognises invoices from the same supplier layout by a cheap first-page
+fingerprint and remembers the price columns of that layout, so a layout
+that changes behind an unchanged fingerprint is noticed. Templates only
+describe documents; the analysis of an invoice does not depend on them.
+A store given a file keeps its templates across restarts and shares them
+between processes using the same file.
+"""
+
+import contextlib
+import hashlib
+import json
+import os
+import re
+import tempfile
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows - saves from several processes are not serialised
+    fcntl = None
+
+# Blocks of the first page taken into the fingerprint
+FINGERPRINT_LABELS = 8
+# Longest first line still treated as a fixed label
+FINGERPRINT_LABEL_LENGTH = 40
+# Position rounding of label blocks (points)
+FINGERPRINT_GRID = 2.0
+# Price column positions are compared on this grid (points)
+PRICE_COLUMN_GRID = 5.0
+# Templates kept in memory (least recently used are dropped)
+MAX_TEMPLATES = 500
+
+Band = Tuple[float, float, float, float]
+
+_DIGITS = re.compile(r'\d')
+
+
+def layout_fingerprint(page_text) -> str:
+    """
+    Fingerprint the layout of a document from its first page.
+
+    Uses the page size and the position of the first fixed labels: the
+    first line of a text block counts as a label if it is short and has no
+    digits, so customer numbers, dates and amounts do not change the result.
+
+    Args:
+        page_text: PageText of the first page
+
+    Returns:
+        Hex digest identifying the layout
+    """
+    rect = page_text.page.rect
+    labels = []
+    for block in page_text.text_blocks:
+        first_line = block[4].split("\n", 1)[0].strip()
+        if not first_line or len(first_line) > FINGERPRINT_LABEL_LENGTH or _DIGITS.search(first_line):
+            continue
+        labels.append((round(block[1] / FINGERPRINT_GRID), round(block[0] / FINGERPRINT_GRID), first_line))
+    labels.sort()
+    signature = [f"{round(rect.width)}x{round(rect.height)}"]
+    signature.extend(f"{y},{x},{text}" for y, x, text in labels[:FINGERPRINT_LABELS])
+    return hashlib.sha1("\n".join(signature).encode("utf-8")).hexdigest()[:16]
+
+
+def price_columns(highlights: List[Band]) -> List[float]:
+    """
+    Right edges of the price highlights, snapped to PRICE_COLUMN_GRID.
+
+    Args:
+        highlights: Price highlight rectangles of a document
+
+    Returns:
+        Sorted distinct column positions
+    """
+    return sorted({round(h[2] / PRICE_COLUMN_GRID) * PRICE_COLUMN_GRID for h in highlights})
+
+
+class LayoutTemplate:
+    """
+    Anchors learned for one layout fingerprint.
+    """
+
+    __slots__ = ("fingerprint", "price_columns", "uses")
+
+    def __init__(self, fingerprint: str):
+        self.fingerprint = fingerprint
+        self.price_columns: List[float] = []            # Right edges of price highlights
+        self.uses = 0                                   # Documents processed with this template
+
+    def anchors(self) -> Dict:
+        """Learned anchors - ``to_dict`` without the use counter."""
+        anchors = self.to_dict()
+        del anchors["uses"]
+        return anchors
+
+    @property
+    def learned(self) -> bool:
+        """True once any anchor is known."""
+        return bool(self.price_columns)
+
+    def check_price_columns(self, columns: List[float]) -> bool:
+        """
+        Compare the price columns of a document with the learned ones.
+
+        A layout that kept its fingerprint but moved all of its price
+        columns has changed; the template is then reset and learned again.
+
+        Args:
+            columns: Result of price_columns for the document
+
+        Returns:
+            True if the columns overlap (or nothing was learned yet)
+        """
+        if not self.price_columns or not columns:
+            self.price_columns = columns or self.price_columns
+            return True
+        if set(columns) & set(self.price_columns):
+            self.price_columns = sorted(set(columns) | set(self.price_columns))
+            return True
+        self.price_columns = columns
+        return False
+
+    def to_dict(self) -> Dict:
+        """
+        Convert to a JSON serializable dictionary.
+
+        Returns:
+            Dictionary with all fields
+        """
+        return {
+            "fingerprint": self.fingerprint,
+            "price_columns": list(self.price_columns),
+            "uses": self.uses,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "LayoutTemplate":
+        """
+        Create a template from a dictionary produced by ``to_dict``.
+
+        Args:
+            data: Template dictionary
+
+        Returns:
+            LayoutTemplate
+        """
+        template = cls(data["fingerprint"])
+        template.price_columns = list(data["price_columns"])
+        template.uses = data["uses"]
+        return template
+
+
+@contextlib.contextmanager
+def _file_lock(path: Path) -> Iterator[None]:
+    """Hold an exclusive lock on ``<path>.lock`` across processes."""
+    with open(path.with_name(path.name + ".lock"), "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class TemplateStore:
+    """Layout templates by fingerprint, least recently used dropped first."""
+
+    def __init__(self, max_templates: int = MAX_TEMPLATES, path: Optional[Path] = None):
+        """
+        Initialize the store, loading the templates of its file if it exists.
+
+        Args:
+            max_templates: Maximum number of templates kept
+            path: JSON file the templates are kept in (None = memory only)
+        """
+        self.max_templates = max_templates
+        self.path = Path(path) if path else None
+        self._templates: "OrderedDict[str, LayoutTemplate]" = OrderedDict()
+        if self.path is not None and self.path.exists():
+            try:
+                self.load(self.path)
+            except (OSError, ValueError, KeyError) as e:
+                print(f"[WARNING] Could not load layout templates from {self.path}: {e}")
+
+    def __len__(self) -> int:
+        return len(self._templates)
+
+    @property
+    def version(self) -> str:
+        """Identifier of the saved templates; changes with the file ("none" without one)."""
+        try:
+            stat = os.stat(self.path) if self.path is not None else None
+        except OSError:
+            stat = None
+        if stat is None:
+            return "none"
+        return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+    def get(self, fingerprint: str) -> LayoutTemplate:
+        """
+        Get the template of a fingerprint, creating an empty one if unknown.
+
+        Args:
+            fingerprint: Result of layout_fingerprint
+
+        Returns:
+            LayoutTemplate (``learned`` is False for a new layout)
+        """
+        template = self._templates.get(fingerprint)
+        if template is None:
+            template = LayoutTemplate(fingerprint)
+            self._templates[fingerprint] = template
+            while len(self._templates) > self.max_templates:
+                self._templates.popitem(last=False)
+        else:
+            self._templates.move_to_end(fingerprint)
+        return template
+
+    def save(self, path: Optional[Path] = None) -> None:
+        """
+        Write all templates to a JSON file.
+
+        Templates another process added to the file since it was loaded are
+        taken over first, so processes sharing a file do not drop each
+        other's layouts. Reading, merging and replacing the file happen
+        under a lock file, and the file is replaced atomically.
+
+        Args:
+            path: Output file (default: the file of the store)
+        """
+        path = Path(path) if path else self.path
+        if path is None:
+            raise ValueError("TemplateStore has no file to save to")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with _file_lock(path):
+            if path.exists():
+                try:
+                    for item in json.loads(path.read_text(encoding="utf-8")):
+                        if item["fingerprint"] not in self._templates:
+                            self._templates[item["fingerprint"]] = LayoutTemplate.from_dict(item)
+                            self._templates.move_to_end(item["fingerprint"], last=False)
+                except (OSError, ValueError, KeyError):
+                    pass    # Unreadable file - overwritten with the templates in memory
+                while len(self._templates) > self.max_templates:
+                    self._templates.popitem(last=False)
+
+            data = [template.to_dict() for template in self._templates.values()]
+            fd, temp_name = tempfile.mkstemp(suffix=".tmp", dir=path.parent)
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(data, f, indent=2)
+                os.replace(temp_name, path)
+            except BaseException:
+                os.unlink(temp_name)
+                raise
+
+    def load(self, path: Path) -> int:
+        """
+        Add the templates of a JSON file written by ``save``.
+
+        Args:
+            path: Input file
+
+        Returns:
+            Number of templates loaded
+        """
+        data = json.loads(Path(path).read_text(encoding="utf-8"))
+        for item in data:
+            template = LayoutTemplate.from_dict(item)
+            self._templates[template.fingerprint] = template
+        while len(self._templates) > self.max_templates:
+            self._templates.popitem(last=False)
+        return len(data)
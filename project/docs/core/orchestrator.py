@@ -120,28 +120,31 @@ class PDFInvoiceOrchestrator:
             print(f"[WARNING] Text '{search_text}' not found in PDF")
             return 0
         
-        # Apply update at each found position
-        update_count = 0
+        # Highlight all occurrences first - one batched drawing per page
+        rects_by_page: Dict[int, List[pymupdf.Rect]] = {}
+        for page_num, pos, rect in positions:
+            rects_by_page.setdefault(page_num, []).append(rect)
+        for page_num, rects in rects_by_page.items():
+            drawn = PDFUtils.highlight_rects(self.doc[page_num], rects)
+            print(f"[INFO] Applied yellow highlight on page {page_num + 1} ({len(rects)} occurrence(s), {drawn} rectangle(s))")
+        
+        # Collect the text overlays per page, then write each page once
+        texts_by_page: Dict[int, List[tuple]] = {}
         for idx, (page_num, pos, rect) in enumerate(positions):
             print(f"  [{idx+1}/{len(positions)}] Processing occurrence on page {page_num + 1}")
             print(f"      Position: ({pos[0]:.2f}, {pos[1]:.2f})")
             print(f"      Rectangle: ({rect.x0:.2f}, {rect.y0:.2f}) -> ({rect.x1:.2f}, {rect.y1:.2f})")
             
-            # Apply highlight
-            PDFUtils.highlight_rect(self.doc[page_num], rect)
-            print(f"      [DONE] Applied yellow highlight")
-            
             # Apply text overlay with offset
             adjusted_pos = (pos[0] + offset[0], pos[1] + offset[1])
-            print(f"      Inserting text '{replace_text}' at adjusted position: ({adjusted_pos[0]:.2f}, {adjusted_pos[1]:.2f})")
-            PDFUtils.insert_text(
-                self.doc[page_num],
-                adjusted_pos,
-                replace_text,
-                font_size=font_size
-            )
-            print(f"      [DONE] Text overlay complete")
-            update_count += 1
+            print(f"      Queued text '{replace_text}' at adjusted position: ({adjusted_pos[0]:.2f}, {adjusted_pos[1]:.2f})")
+            texts_by_page.setdefault(page_num, []).append(
+                (adjusted_pos[0], adjusted_pos[1], replace_text))
+        
+        update_count = 0
+        for page_num, items in texts_by_page.items():
+            update_count += PDFUtils.insert_texts(self.doc[page_num], items, font_size=font_size)
+            print(f"[INFO] Inserted {len(items)} text overlay(s) on page {page_num + 1}")
         
         print(f"[SUCCESS] Update complete: {update_count} position(s) modified")
         return update_count
@@ -197,14 +200,9 @@ class PDFInvoiceOrchestrator:
         print(f"\n{'='*80}")
         print(f"[INFO] Detecting VAT percentage in document...")
         
-        # Extract text from all pages
-        full_text = ""
-        for page_num, page in enumerate(self.doc):
-            page_text = page.get_text()
-            full_text += page_text
-        
-        # Detect VAT
-        detected_vat = PDFUtils.detect_vat_percentage(full_text)
+        # Detect VAT - pages are extracted one by one until VAT is found
+        page_texts = (page.get_text() for page in self.doc)
+        detected_vat = PDFUtils.detect_vat_percentage(page_texts)
         
         if detected_vat is not None:
             print(f"[SUCCESS] Identified VAT Percentage: {detected_vat}%")
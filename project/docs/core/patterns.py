@@ -0,0 +1,251 @@
+"""
+Pattern Registry Module
+
+Central registry of all regular expressions used for VAT, price, total,
+country and layout detection. Patterns are compiled once at import time;
+patterns that depend on the detected VAT percentage are compiled once per
+document. Every rule counts its calls, matches and time spent.
+"""
+
+from typing import Dict, Iterator, List, Optional
+import re
+import time
+
+
+class RuleStats:
+    """Call, match and timing counters for one rule."""
+
+    __slots__ = ("calls", "matches", "seconds")
+
+    def __init__(self):
+        self.calls = 0
+        self.matches = 0
+        self.seconds = 0.0
+
+
+class Rule:
+    """
+    A compiled pattern that records how often and how long it runs.
+
+    Mirrors the ``re.Pattern`` methods used in the code base.
+    """
+
+    def __init__(self, name: str, regex: "re.Pattern", stats: RuleStats):
+        self.name = name
+        self.regex = regex
+        self.stats = stats
+
+    @property
+    def pattern(self) -> str:
+        """Source string of the regular expression."""
+        return self.regex.pattern
+
+    def _record(self, started: float, found: int) -> None:
+        self.stats.calls += 1
+        self.stats.matches += found
+        self.stats.seconds += time.perf_counter() - started
+
+    def search(self, text: str, pos: int = 0) -> Optional["re.Match"]:
+        """Scan text for the first match (``re.Pattern.search``)."""
+        started = time.perf_counter()
+        match = self.regex.search(text, pos)
+        self._record(started, match is not None)
+        return match
+
+    def match(self, text: str, pos: int = 0) -> Optional["re.Match"]:
+        """Match at the given position only (``re.Pattern.match``)."""
+        started = time.perf_counter()
+        match = self.regex.match(text, pos)
+        self._record(started, match is not None)
+        return match
+
+    def finditer(self, text: str) -> Iterator["re.Match"]:
+        """Iterate over all matches (``re.Pattern.finditer``)."""
+        started = time.perf_counter()
+        matches = list(self.regex.finditer(text))
+        self._record(started, len(matches))
+        return iter(matches)
+
+
+class VatRules:
+    """Patterns built from the VAT percentage detected in one document."""
+
+    def __init__(self, registry: "PatternRegistry", detected_vat: float):
+        # Reason: the VAT value is inserted unescaped on purpose - the "." in
+        # "8.1" acts as a wildcard and matches the "," in "(8,10 % VAT"
+        vat = f"{detected_vat}"
+        self.detected_vat = detected_vat
+        # "(8,10 % VAT: 240,31)" -> captures the VAT amount
+        self.amount = registry.compile_rule(
+            "vat_amount", rf'\({vat}.*?%\s*VAT[:\s]*(\d[\d.,]+)', re.IGNORECASE)
+        # VAT percentage anywhere in a piece of text
+        self.value = registry.compile_rule("vat_value", rf'{vat}')
+        # Complete VAT line "(10,00 % VAT: 172,55)"
+        self.line = registry.compile_rule(
+            "vat_line", rf'\([^\s]*{vat}[^\s]*\s*%\s*VAT[:\s]*[\d.,]+\)', re.IGNORECASE)
+        # Percentage followed by a VAT label on the same line
+        self.label = registry.compile_rule(
+            "vat_label", rf'{vat}.*?%.*?VAT', re.IGNORECASE)
+
+
+class PatternRegistry:
+    """Registry of named, precompiled rules with usage statistics."""
+
+    def __init__(self):
+        self._rules: Dict[str, Rule] = {}
+        self._stats: Dict[str, RuleStats] = {}
+        self._vat_rules: Dict[float, VatRules] = {}
+
+    def compile_rule(self, name: str, pattern: str, flags: int = 0) -> Rule:
+        """
+        Compile a rule whose statistics are collected under a name.
+
+        Rules compiled under the same name share one statistics record,
+        e.g. the per-document VAT rules.
+
+        Args:
+            name: Rule name used in the statistics
+            pattern: Regular expression source
+            flags: ``re`` flags
+
+        Returns:
+            Compiled rule
+        """
+        stats = self._stats.setdefault(name, RuleStats())
+        return Rule(name, re.compile(pattern, flags), stats)
+
+    def register(self, name: str, pattern: str, flags: int = 0) -> Rule:
+        """
+        Compile and register a named rule.
+
+        Args:
+            name: Unique rule name
+            pattern: Regular expression source
+            flags: ``re`` flags
+
+        Returns:
+            Compiled rule
+        """
+        if name in self._rules:
+            raise ValueError(f"Pattern already registered: {name}")
+        rule = self.compile_rule(name, pattern, flags)
+        self._rules[name] = rule
+        return rule
+
+    def __getitem__(self, name: str) -> Rule:
+        return self._rules[name]
+
+    def group(self, prefix: str) -> List[Rule]:
+        """
+        Get all rules whose name starts with a prefix, in registration order.
+
+        Args:
+            prefix: Name prefix, e.g. "total."
+
+        Returns:
+            List of rules
+        """
+        return [rule for name, rule in self._rules.items() if name.startswith(prefix)]
+
+    def for_vat(self, detected_vat: float) -> VatRules:
+        """
+        Get the document-specific VAT rules, compiling them once per value.
+
+        Args:
+            detected_vat: Detected VAT percentage
+
+        Returns:
+            VatRules for the percentage
+        """
+        rules = self._vat_rules.get(detected_vat)
+        if rules is None:
+            rules = VatRules(self, detected_vat)
+            self._vat_rules[detected_vat] = rules
+        return rules
+
+    def stats(self) -> Dict[str, Dict]:
+        """
+        Get usage statistics per rule name.
+
+        Returns:
+            Dictionary: name -> {'calls', 'matches', 'seconds'}
+        """
+        return {
+            name: {'calls': s.calls, 'matches': s.matches, 'seconds': s.seconds}
+            for name, s in self._stats.items()
+        }
+
+    def reset_stats(self) -> None:
+        """Reset all usage statistics."""
+        for stats in self._stats.values():
+            stats.calls = 0
+            stats.matches = 0
+            stats.seconds = 0.0
+
+    def report(self) -> str:
+        """
+        Format usage statistics, most expensive rule first.
+
+        Returns:
+            Multi-line report
+        """
+        lines = [f"{'Pattern':<28}{'Calls':>8}{'Matches':>9}{'Time (ms)':>11}"]
+        ordered = sorted(self._stats.items(), key=lambda item: item[1].seconds, reverse=True)
+        for name, s in ordered:
+            if s.calls:
+                lines.append(f"{name:<28}{s.calls:>8}{s.matches:>9}{s.seconds * 1000:>11.3f}")
+        return "\n".join(lines)
+
+
+PATTERNS = PatternRegistry()
+
+# Prices and price filters
+PATTERNS.register("price", r'\d{1,3}(?:\.\d{3})*,\d{2}')  # "1.540,00" or "1540,00"
+PATTERNS.register("trailing", r',\d{2}\)|,\d{4}\)')  # ",72)" after a price
+
+# Percentage and discount indicators around price candidates
+PATTERNS.register("discount.percent", r'%')
+PATTERNS.register("discount.before", r'rabatt|discount|reduktion|reduction|-', re.IGNORECASE)  # Before the price
+PATTERNS.register("discount.marker", r'%|rabatt|discount|- ', re.IGNORECASE)  # Anywhere in the context
+
+# VAT percentage detection, in priority order
+PATTERNS.register("vat.percent_vat", r'(\d+(?:[,\.]\d+)?)\s*%\s*VAT', re.IGNORECASE)  # "8.10 % VAT" or "8,10 % VAT"
+PATTERNS.register("vat.vat", r'VAT[:\s]*(\d+(?:[,\.]\d+)?)', re.IGNORECASE)  # "VAT: 19" or "VAT 19"
+PATTERNS.register("vat.mwst", r'MwSt[:\s]*(\d+(?:[,\.]\d+)?)', re.IGNORECASE)  # "MwSt: 19"
+PATTERNS.register("vat.mehrwertsteuer", r'Mehrwertsteuer[:\s]*(\d+(?:[,\.]\d+)?)', re.IGNORECASE)  # "Mehrwertsteuer: 19"
+PATTERNS.register("vat.ust", r'USt[:\s]*(\d+(?:[,\.]\d+)?)', re.IGNORECASE)  # "USt: 19"
+PATTERNS.register("vat.gst", r'GST[:\s]*\((\d+(?:[,\.]\d+)?)', re.IGNORECASE)  # "GST(9%)"
+PATTERNS.register("vat.tva", r'TVA[:\s]*(\d+(?:[,\.]\d+)?)', re.IGNORECASE)  # "TVA: 19" (French)
+PATTERNS.register("vat.iva", r'IVA[:\s]*(\d+(?:[,\.]\d+)?)', re.IGNORECASE)  # "IVA: 19" (Italian/Spanish)
+PATTERNS.register("vat_keyword", r'VAT', re.IGNORECASE)
+
+# Combined VAT scanner: one pass finds every position where one of the VAT
+# rules above can start. Keywords map to the rules after "vat.percent_vat".
+VAT_SCAN_KEYWORDS = ("vat", "mwst", "mehrwertsteuer", "ust", "gst", "tva", "iva")
+VAT_SCAN_MARGIN = 64  # Characters kept back when more pages may follow
+# Characters a VAT match can run on with after its keyword, and the longest keyword:
+# a page ending in these may have its match continue on the next page
+VAT_SCAN_TAIL_CHARS = "0123456789,.:%( \t\r\n\f\v"
+VAT_SCAN_KEYWORD_LENGTH = max(len(keyword) for keyword in VAT_SCAN_KEYWORDS)
+PATTERNS.register(
+    "vat_scan",
+    r'(?P<percent>\d+(?:[,\.]\d+)?\s*%\s*VAT)|(?P<keyword>'
+    + "|".join(VAT_SCAN_KEYWORDS) + ")",
+    re.IGNORECASE,
+)
+
+# Invoice totals, in priority order - avoid matching VAT amounts
+PATTERNS.register("total.sum_gross_value", r'Sum-Gross-Value\s*:\s*(\d{1,3}(?:\.\d{3})*,\d{2})', re.IGNORECASE)  # Most reliable, matches 1.540,00
+PATTERNS.register("total.total_value_eol", r'Total\s+Value\s*:\s*(\d{1,3}(?:\.\d{3})*,\d{2})\s*\n', re.IGNORECASE)  # Not followed by VAT line
+PATTERNS.register("total.total_value_after_qty", r'Total\s+Qty\.\s*:\s*\d+[\s\S]*?Total\s+Value\s*:\s*(\d{1,3}(?:\.\d{3})*,\d{2})', re.IGNORECASE)  # Match in context
+PATTERNS.register("total.sum_net_value", r'SUM-Net-Value[:\s]+(\d{1,3}(?:\.\d{3})*,\d{2})', re.IGNORECASE)
+PATTERNS.register("total.betrag", r'Betrag[:\s]+(\d{1,3}(?:\.\d{3})*,\d{2})(?!\s*(?:%|MwSt|VAT))', re.IGNORECASE)  # German total not followed by VAT
+PATTERNS.register("total.gesamt", r'Gesamt[:\s]+(\d{1,3}(?:\.\d{3})*,\d{2})(?!\s*(?:%|MwSt|VAT))', re.IGNORECASE)  # German alternative
+
+# Country codes, in priority order
+PATTERNS.register("country.postal", r'\b([A-Z]{2,3})[-\s]\d')  # "CH-6900" or "DE 12345"
+PATTERNS.register("country.standalone", r'\b([A-Z]{2,3})\b')  # Standalone country code (less reliable)
+
+# Importer box anchors
+PATTERNS.register("anchor.shipping_address", r'shipping\s+addr', re.IGNORECASE)  # "Shipping Addr.:" or "Shipping Address:"
+PATTERNS.register("anchor.packinglist", r'packinglist', re.IGNORECASE)
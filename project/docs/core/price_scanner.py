@@ -0,0 +1,128 @@
+"""
+Price Scanner Module
+
+Single-pass scanner that finds European formatted prices ("1.540,00") in a
+page's word list and yields each price together with its exact rectangle.
+"""
+
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+try:
+    from .patterns import PATTERNS  # Relative import (when run as module)
+except ImportError:
+    try:
+        from core.patterns import PATTERNS  # From core package
+    except ImportError:
+        from patterns import PATTERNS  # Absolute import (when run directly)
+
+
+# European price format: "1.540,00" or "1540,00"
+PRICE_PATTERN = PATTERNS["price"]
+
+# Characters of block text kept on each side of a price for context checks
+CONTEXT_CHARS = 30
+
+
+class PriceMatch(NamedTuple):
+    """A price found on a page."""
+    text: str                                   # Matched price string, e.g. "1.540,00"
+    rect: Tuple[float, float, float, float]     # Exact bbox of the price text
+    block_no: int                               # Text block the price belongs to
+    block_text: str                             # Text of the whole block
+    offset: int                                 # Start of the price within block_text
+
+    @property
+    def context(self) -> str:
+        """Block text around the price (CONTEXT_CHARS on each side)."""
+        start = max(0, self.offset - CONTEXT_CHARS)
+        return self.block_text[start:self.offset + len(self.text) + CONTEXT_CHARS]
+
+    @property
+    def context_offset(self) -> int:
+        """Start of the price within context."""
+        return self.offset - max(0, self.offset - CONTEXT_CHARS)
+
+
+def _substring_rect(page_text, word: tuple, start: int, end: int) -> Tuple[float, float, float, float]:
+    """
+    Get the rectangle of part of a word.
+
+    Uses the page's character boxes when they can be matched to the word,
+    otherwise splits the word box proportionally by character count.
+    """
+    chars = page_text.chars_in_rect(word[:4]) if page_text is not None else []
+    token = word[4]
+    if "".join(c[4] for c in chars) == token:
+        part = chars[start:end]
+        return (part[0][0], min(c[1] for c in part), part[-1][2], max(c[3] for c in part))
+
+    x0, y0, x1, y1 = word[:4]
+    char_width = (x1 - x0) / len(token)
+    return (x0 + start * char_width, y0, x0 + end * char_width, y1)
+
+
+def _scan_block(page_text, block_words: List[tuple]) -> Iterator[PriceMatch]:
+    """Scan the words of one text block for prices."""
+    # Rebuild the block text (words joined by spaces, lines by newlines)
+    # and remember where each word starts in it
+    pieces: List[str] = []
+    offsets: List[int] = []
+    length = 0
+    previous_line: Optional[int] = None
+    for w in block_words:
+        if previous_line is not None:
+            separator = " " if w[6] == previous_line else "\n"
+            pieces.append(separator)
+            length += 1
+        offsets.append(length)
+        pieces.append(w[4])
+        length += len(w[4])
+        previous_line = w[6]
+    block_text = "".join(pieces)
+
+    for w, word_offset in zip(block_words, offsets):
+        token = w[4]
+        if "," not in token:
+            continue
+        for match in PRICE_PATTERN.finditer(token):
+            start, end = match.span()
+            if start == 0 and end == len(token):
+                rect = tuple(w[:4])
+            else:
+                rect = _substring_rect(page_text, w, start, end)
+
+            yield PriceMatch(match.group(0), rect, w[5], block_text, word_offset + start)
+
+
+def scan_words(words: List[tuple], page_text=None) -> Iterator[PriceMatch]:
+    """
+    Scan a word list for prices in one pass.
+
+    Args:
+        words: Word tuples as returned by ``get_text("words")``
+        page_text: Optional PageText used for exact sub-word rectangles
+
+    Yields:
+        PriceMatch for every price in extraction order
+    """
+    block_words: List[tuple] = []
+    for w in words:
+        if block_words and w[5] != block_words[-1][5]:
+            yield from _scan_block(page_text, block_words)
+            block_words = []
+        block_words.append(w)
+    if block_words:
+        yield from _scan_block(page_text, block_words)
+
+
+def scan_prices(page_text) -> Iterator[PriceMatch]:
+    """
+    Scan a page for prices using its cached word list.
+
+    Args:
+        page_text: PageText of the page
+
+    Yields:
+        PriceMatch for every price on the page
+    """
+    return scan_words(page_text.words, page_text)
@@ -0,0 +1,272 @@
+"""
+Price Candidate Table Module
+
+Columnar storage of price candidates. The discount/percentage filters, the
+VAT removal and the rounding run as NumPy array operations over all
+candidates of a document at once.
+"""
+
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+import pymupdf
+
+try:
+    from .patterns import PATTERNS  # Relative import (when run as module)
+    from .price_scanner import PriceMatch, CONTEXT_CHARS
+except ImportError:
+    try:
+        from core.patterns import PATTERNS  # From core package
+        from core.price_scanner import PriceMatch, CONTEXT_CHARS
+    except ImportError:
+        from patterns import PATTERNS  # Absolute import (when run directly)
+        from price_scanner import PriceMatch, CONTEXT_CHARS
+
+
+# Filter thresholds
+MIN_PRICE = 10
+MAX_PRICE = 100000
+PERCENT_CHECK_LIMIT = 100  # Values below this are checked for a nearby % sign
+PERCENT_MAX_DISTANCE = 20  # % closer than this (in characters) marks a percentage
+
+
+def _positions(rule_name: str, text: str, base: int) -> Tuple[List[int], List[int]]:
+    """Start and end offsets (shifted by base) of all matches of a rule."""
+    starts, ends = [], []
+    for match in PATTERNS[rule_name].finditer(text):
+        starts.append(base + match.start())
+        ends.append(base + match.end())
+    return starts, ends
+
+
+def _last_inside(starts: List[int], ends: List[int], lower: np.ndarray, upper: np.ndarray):
+    """
+    Find the last match that lies completely inside [lower, upper).
+
+    Matches must be non-overlapping and in text order.
+
+    Returns:
+        Tuple (found mask, end offset of the match - only valid where found)
+    """
+    # Sentinel match before everything keeps every index valid
+    starts = np.array([-1] + starts, dtype=np.int64)
+    ends = np.array([-1] + ends, dtype=np.int64)
+    index = np.searchsorted(ends, upper, side="right") - 1
+    return starts[index] >= lower, ends[index]
+
+
+class PriceHit:
+    """
+    A price selected for VAT removal.
+
+    Coordinates are stored as plain floats; ``rect`` builds a
+    ``pymupdf.Rect`` only when the hit is drawn.
+    """
+
+    __slots__ = ("page_num", "x0", "y0", "x1", "y1", "value", "new_value", "text")
+
+    def __init__(self, page_num: int, x0: float, y0: float, x1: float, y1: float,
+                 value: float, new_value: float, text: str):
+        self.page_num = page_num
+        self.x0 = x0
+        self.y0 = y0
+        self.x1 = x1
+        self.y1 = y1
+        self.value = value            # Original price, e.g. 1540.0
+        self.new_value = new_value    # Price without VAT, rounded to cents
+        self.text = text              # Price as printed, e.g. "1.540,00"
+
+    @property
+    def rect(self) -> pymupdf.Rect:
+        """Bounding box of the price text."""
+        return pymupdf.Rect(self.x0, self.y0, self.x1, self.y1)
+
+    @property
+    def position(self) -> Tuple[float, float]:
+        """Text baseline origin (bottom-left corner) of the price."""
+        return (self.x0, self.y1)
+
+    def to_dict(self) -> Dict:
+        """
+        Convert to a plain dictionary.
+
+        Returns:
+            Dictionary with all fields
+        """
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self) -> str:
+        return (f"PriceHit(page={self.page_num}, text={self.text!r}, value={self.value}, "
+                f"new_value={self.new_value})")
+
+
+class PriceCandidateTable:
+    """
+    Columnar table of price candidates found on one or more pages.
+
+    Columns (NumPy arrays, one row per candidate):
+        page, block, value, x0, y0, x1, y1,
+        percent_distance  - characters between the price end and the first
+                            "%" in its context (inf if none)
+        discount_distance - characters between the nearest preceding
+                            discount keyword and the price (inf if none)
+        discount_marker   - context contains "%", "rabatt", "discount" or "- "
+    """
+
+    def __init__(self, texts: List[str], columns: Dict[str, np.ndarray]):
+        self.texts = texts
+        self.page = columns["page"]
+        self.block = columns["block"]
+        self.value = columns["value"]
+        self.x0 = columns["x0"]
+        self.y0 = columns["y0"]
+        self.x1 = columns["x1"]
+        self.y1 = columns["y1"]
+        self.percent_distance = columns["percent_distance"]
+        self.discount_distance = columns["discount_distance"]
+        self.discount_marker = columns["discount_marker"]
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    @classmethod
+    def from_matches(cls, matches: Iterable[Tuple[int, PriceMatch]]) -> "PriceCandidateTable":
+        """
+        Build the table from scanner results.
+
+        Context features are computed once per text block; each candidate
+        is then joined to them with vectorized binary searches.
+
+        Args:
+            matches: (page_num, PriceMatch) pairs
+
+        Returns:
+            PriceCandidateTable
+        """
+        texts: List[str] = []
+        values: List[float] = []
+        pages: List[int] = []
+        blocks: List[int] = []
+        boxes: List[Tuple[float, float, float, float]] = []
+        starts: List[int] = []
+        block_bounds: List[Tuple[int, int]] = []
+
+        # Block features in one global coordinate space (blocks laid end to end)
+        block_base: Dict[Tuple[int, int], int] = {}
+        length = 0
+        percent_pos: List[int] = []
+        before_start: List[int] = []
+        before_end: List[int] = []
+        marker_start: List[int] = []
+        marker_end: List[int] = []
+
+        for page_num, match in matches:
+            key = (page_num, match.block_no)
+            base = block_base.get(key)
+            if base is None:
+                base = length
+                block_base[key] = base
+                length += len(match.block_text) + 1
+                percent_pos.extend(_positions("discount.percent", match.block_text, base)[0])
+                s, e = _positions("discount.before", match.block_text, base)
+                before_start.extend(s)
+                before_end.extend(e)
+                s, e = _positions("discount.marker", match.block_text, base)
+                marker_start.extend(s)
+                marker_end.extend(e)
+
+            texts.append(match.text)
+            values.append(float(match.text.replace(".", "").replace(",", ".")))  # "1.540,00" -> 1540.00
+            pages.append(page_num)
+            blocks.append(match.block_no)
+            boxes.append(match.rect)
+            starts.append(base + match.offset)
+            block_bounds.append((base, base + len(match.block_text)))
+
+        count = len(texts)
+        box_array = np.array(boxes, dtype=np.float64).reshape(count, 4)
+        price_start = np.array(starts, dtype=np.int64)
+        price_end = price_start + np.array([len(t) for t in texts], dtype=np.int64)
+        bounds = np.array(block_bounds, dtype=np.int64).reshape(count, 2)
+        window_start = np.maximum(bounds[:, 0], price_start - CONTEXT_CHARS)
+        window_end = np.minimum(bounds[:, 1], price_end + CONTEXT_CHARS)
+
+        # First "%" inside the context window (sentinel after everything)
+        percent = np.array(percent_pos + [length + 1], dtype=np.int64)
+        first_percent = percent[np.searchsorted(percent, window_start, side="left")]
+        percent_distance = np.where(
+            first_percent < window_end, np.abs(first_percent - price_end), np.inf)
+
+        # Discount keyword between the window start and the price
+        found, keyword_end = _last_inside(before_start, before_end, window_start, price_start)
+        discount_distance = np.where(found, price_start - keyword_end, np.inf)
+
+        # Any discount marker inside the context window
+        discount_marker, _ = _last_inside(marker_start, marker_end, window_start, window_end)
+
+        return cls(texts, {
+            "page": np.array(pages, dtype=np.int32),
+            "block": np.array(blocks, dtype=np.int32),
+            "value": np.array(values, dtype=np.float64),
+            "x0": box_array[:, 0],
+            "y0": box_array[:, 1],
+            "x1": box_array[:, 2],
+            "y1": box_array[:, 3],
+            "percent_distance": percent_distance.astype(np.float64),
+            "discount_distance": discount_distance.astype(np.float64),
+            "discount_marker": discount_marker,
+        })
+
+    def keep_mask(self) -> np.ndarray:
+        """
+        Decide which candidates are product prices.
+
+        Skips percentages and discounts (small values with a "%" or discount
+        keyword nearby) and values outside the price range.
+
+        Returns:
+            Boolean array, True for candidates to keep
+        """
+        value = self.value
+        has_percent = np.isfinite(self.percent_distance)
+        has_discount_before = np.isfinite(self.discount_distance)
+
+        # Values < 100 with a % sign close by
+        percent_value = (value < PERCENT_CHECK_LIMIT) & (self.percent_distance < PERCENT_MAX_DISTANCE)
+        # Values between 10 and 100 near percentage-related keywords
+        discount_value = (
+            (value >= MIN_PRICE) & (value < PERCENT_CHECK_LIMIT)
+            & (has_percent | has_discount_before)
+            & (has_percent | self.discount_marker)
+        )
+        in_range = (value >= MIN_PRICE) & (value <= MAX_PRICE)
+        return in_range & ~percent_value & ~discount_value
+
+    def without_vat(self, detected_vat: float) -> np.ndarray:
+        """
+        Calculate all prices without VAT, rounded to cents.
+
+        Args:
+            detected_vat: VAT percentage
+
+        Returns:
+            Array of new values
+        """
+        return np.round(self.value / (1 + detected_vat / 100), 2)
+
+    def hit(self, row: int, new_value: float) -> PriceHit:
+        """
+        Create the PriceHit record for one row.
+
+        Args:
+            row: Row index
+            new_value: Price without VAT
+
+        Returns:
+            PriceHit with plain Python values
+        """
+        return PriceHit(
+            int(self.page[row]),
+            float(self.x0[row]), float(self.y0[row]), float(self.x1[row]), float(self.y1[row]),
+            float(self.value[row]), float(new_value), self.texts[row],
+        )
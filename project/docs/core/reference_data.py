@@ -0,0 +1,156 @@
+"""
+Reference Data Module
+
+Importers and country names, loaded once into read-only mappings
+indexed by country code. The importers CSV is reloaded
+automatically when the file changes on disk.
+"""
+
+import csv
+import os
+import time
+from pathlib import Path
+from types import MappingProxyType
+from typing import Dict, Mapping, Optional, Tuple
+
+
+# Country code -> country name
+COUNTRY_NAMES: Mapping[str, str] = MappingProxyType({
+    'CH': 'Switzerland',
+    'DE': 'Germany',
+    'FR': 'France',
+    'IT': 'Italy',
+    'AT': 'Austria',
+    'UK': 'United Kingdom',
+    'US': 'United States',
+    'NL': 'Netherlands',
+    'BE': 'Belgium',
+    'ES': 'Spain',
+    'PT': 'Portugal',
+    'SE': 'Sweden',
+    'NO': 'Norway',
+    'DK': 'Denmark',
+    'FI': 'Finland',
+    'PL': 'Poland',
+    'CZ': 'Czech Republic',
+})
+
+# Seconds between checks of the importers CSV modification time
+RELOAD_CHECK_INTERVAL = 1.0
+
+EMPTY_IMPORTERS: Mapping[str, Mapping[str, str]] = MappingProxyType({})
+
+
+def load_importers(csv_path: Path) -> Mapping[str, Mapping[str, str]]:
+    """
+    Read the importers CSV into a read-only mapping.
+
+    Args:
+        csv_path: Path to importers.csv (columns: country_code, importer,
+            vat_number, country)
+
+    Returns:
+        Mapping: upper-case country code -> {'importer', 'vat_number', 'country'}.
+        The first row wins if a country code is listed twice.
+    """
+    importers: Dict[str, Mapping[str, str]] = {}
+    with open(csv_path, 'r', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            importers.setdefault(row['country_code'].upper(), MappingProxyType({
+                'importer': row['importer'],
+                'vat_number': row['vat_number'],
+                'country': row['country'],
+            }))
+    return MappingProxyType(importers)
+
+
+class ReferenceData:
+    """
+    Reference data backed by an importers CSV.
+
+    The CSV is parsed on first use and again only when its modification
+    time or size changes; the file is checked at most once per
+    ``check_interval`` seconds. Lookups are dictionary accesses.
+    """
+
+    def __init__(self, importers_csv: Path, check_interval: float = RELOAD_CHECK_INTERVAL):
+        """
+        Initialize the reference data.
+
+        Args:
+            importers_csv: Path to importers.csv
+            check_interval: Minimum seconds between file modification checks
+        """
+        self.importers_csv = Path(importers_csv)
+        self.check_interval = check_interval
+        self._importers: Mapping[str, Mapping[str, str]] = EMPTY_IMPORTERS
+        self._signature: Optional[Tuple[int, int]] = None  # (mtime_ns, size) of the loaded file
+        self._loaded = False
+        self._next_check = 0.0
+
+    @property
+    def importers(self) -> Mapping[str, Mapping[str, str]]:
+        """Current importers mapping, reloaded if the CSV has changed."""
+        now = time.monotonic()
+        if now >= self._next_check:
+            self._next_check = now + self.check_interval
+            self._refresh()
+        return self._importers
+
+    @property
+    def version(self) -> str:
+        """Identifier of the loaded importers CSV; changes whenever the file does."""
+        self.importers  # Reload first if the file has changed
+        if self._signature is None:
+            return "none"
+        return f"{self._signature[0]}-{self._signature[1]}"
+
+    def _refresh(self) -> None:
+        try:
+            stat = os.stat(self.importers_csv)
+        except OSError:
+            if self._signature is not None or not self._loaded:
+                print(f"[WARNING] Importers CSV not found at: {self.importers_csv}")
+            self._importers = EMPTY_IMPORTERS
+            self._signature = None
+            self._loaded = True
+            return
+
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if self._loaded and signature == self._signature:
+            return
+        try:
+            self._importers = load_importers(self.importers_csv)
+        except Exception as e:
+            # Keep the previous data, e.g. while the file is being rewritten
+            print(f"[WARNING] Error reading importers CSV: {e}")
+        self._signature = signature
+        self._loaded = True
+
+    def importer(self, country_code: Optional[str]) -> Optional[Mapping[str, str]]:
+        """
+        Get the importer registered for a country.
+
+        Args:
+            country_code: Country code (e.g., "CH", "GB", "AU"), any case
+
+        Returns:
+            Read-only mapping with 'importer', 'vat_number' and 'country',
+            or None if not found
+        """
+        if not country_code:
+            return None
+        return self.importers.get(country_code.upper())
+
+    @staticmethod
+    def country_name(code: str) -> str:
+        """
+        Convert country code to full country name.
+
+        Args:
+            code: 2-letter country code
+
+        Returns:
+            Country name or code if not found
+        """
+        return COUNTRY_NAMES.get(code.upper(), code)
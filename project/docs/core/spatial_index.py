@@ -0,0 +1,135 @@
+"""
+Spatial Index Module
+
+Uniform grid indexes over page coordinates, used to answer "what is near
+this rectangle?" from memory instead of re-extracting text with a clip.
+"""
+
+from typing import Dict, List, Sequence, Tuple
+import math
+
+
+class GridIndex:
+    """
+    Uniform grid index over axis-aligned bounding boxes.
+
+    Items are registered in every grid cell their bounding box touches.
+    Queries return items in insertion order, so results keep the
+    extraction order of the underlying text.
+    """
+
+    DEFAULT_CELL_SIZE = 50.0
+
+    def __init__(self, cell_size: float = DEFAULT_CELL_SIZE):
+        """
+        Initialize an empty grid index.
+
+        Args:
+            cell_size: Width and height of a grid cell in PDF points
+        """
+        self.cell_size = cell_size
+        self._boxes: List[Tuple[float, float, float, float]] = []
+        self._items: List[object] = []
+        self._cells: Dict[Tuple[int, int], List[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def _cell_range(self, x0: float, y0: float, x1: float, y1: float):
+        size = self.cell_size
+        return (
+            range(math.floor(x0 / size), math.floor(x1 / size) + 1),
+            range(math.floor(y0 / size), math.floor(y1 / size) + 1),
+        )
+
+    def insert(self, bbox: Sequence[float], item: object) -> None:
+        """
+        Add an item to the index.
+
+        Args:
+            bbox: Bounding box (x0, y0, x1, y1)
+            item: Object returned by queries
+        """
+        x0, y0, x1, y1 = bbox[:4]
+        item_id = len(self._items)
+        self._boxes.append((x0, y0, x1, y1))
+        self._items.append(item)
+        cols, rows = self._cell_range(x0, y0, x1, y1)
+        for cx in cols:
+            for cy in rows:
+                self._cells.setdefault((cx, cy), []).append(item_id)
+
+    def query(self, rect: Sequence[float]) -> List[object]:
+        """
+        Get all items whose bounding box intersects a rectangle.
+
+        Args:
+            rect: Query rectangle (x0, y0, x1, y1)
+
+        Returns:
+            Intersecting items in insertion order
+        """
+        qx0, qy0, qx1, qy1 = rect[:4]
+        cols, rows = self._cell_range(qx0, qy0, qx1, qy1)
+        candidates = set()
+        for cx in cols:
+            for cy in rows:
+                candidates.update(self._cells.get((cx, cy), ()))
+
+        result = []
+        for item_id in sorted(candidates):
+            x0, y0, x1, y1 = self._boxes[item_id]
+            if x0 < qx1 and x1 > qx0 and y0 < qy1 and y1 > qy0:
+                result.append(self._items[item_id])
+        return result
+
+
+class ProximityIndex:
+    """
+    Grid of points for near-duplicate detection.
+
+    Answers "is there already a point within tolerance of (x, y)?" by
+    checking only the neighbouring grid cells.
+    """
+
+    def __init__(self, tolerance: float = 5.0):
+        """
+        Initialize an empty proximity index.
+
+        Args:
+            tolerance: Points closer than this on both axes are duplicates
+        """
+        self.tolerance = tolerance
+        self._cells: Dict[Tuple[int, int], List[Tuple[float, float]]] = {}
+
+    def _cell(self, x: float, y: float) -> Tuple[int, int]:
+        return math.floor(x / self.tolerance), math.floor(y / self.tolerance)
+
+    def has_near(self, x: float, y: float) -> bool:
+        """
+        Check whether a point within tolerance was already added.
+
+        Args:
+            x: X coordinate
+            y: Y coordinate
+
+        Returns:
+            True if a nearby point exists
+        """
+        cx, cy = self._cell(x, y)
+        for nx in (cx - 1, cx, cx + 1):
+            for ny in (cy - 1, cy, cy + 1):
+                for px, py in self._cells.get((nx, ny), ()):
+                    if abs(px - x) < self.tolerance and abs(py - y) < self.tolerance:
+                        return True
+        return False
+
+    def add(self, x: float, y: float) -> None:
+        """
+        Add a point to the index.
+
+        Args:
+            x: X coordinate
+            y: Y coordinate
+        """
+        self._cells.setdefault(self._cell(x, y), []).append((x, y))
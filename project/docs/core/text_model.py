@@ -0,0 +1,272 @@
+"""
+Document Text Model
+
+Lazily extracts and caches the text of a PDF document so that every stage
+of invoice processing reads from the same per-page extraction results.
+"""
+
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import pymupdf
+
+try:
+    from .spatial_index import GridIndex  # Relative import (when run as module)
+except ImportError:
+    try:
+        from core.spatial_index import GridIndex  # From core package
+    except ImportError:
+        from spatial_index import GridIndex  # Absolute import (when run directly)
+
+
+# get_text("dict") flags without image payloads - only text spans are used
+SPAN_FLAGS = pymupdf.TEXTFLAGS_DICT & ~pymupdf.TEXT_PRESERVE_IMAGES
+CHAR_FLAGS = pymupdf.TEXTFLAGS_RAWDICT & ~pymupdf.TEXT_PRESERVE_IMAGES
+
+
+class PageText:
+    """
+    Cached text extraction results for a single PDF page.
+
+    Every extraction mode (plain text, blocks, words, spans, characters) is
+    run at most once and only when first requested. Words and spans are additionally
+    held in grid indexes for rectangle queries.
+    """
+
+    def __init__(self, page: pymupdf.Page):
+        """
+        Initialize the page text cache.
+
+        Args:
+            page: PDF page to extract text from
+        """
+        self.page = page
+        self.number = page.number
+        self._text: Optional[str] = None
+        self._blocks: Optional[List[tuple]] = None
+        self._words: Optional[List[tuple]] = None
+        self._spans: Optional[List[Dict]] = None
+        self._word_index: Optional[GridIndex] = None
+        self._span_index: Optional[GridIndex] = None
+        self._char_index: Optional[GridIndex] = None
+
+    @property
+    def text(self) -> str:
+        """Plain text of the page (``page.get_text()``)."""
+        if self._text is None:
+            self._text = self.page.get_text()
+        return self._text
+
+    @property
+    def blocks(self) -> List[tuple]:
+        """Text and image blocks of the page (``page.get_text("blocks")``)."""
+        if self._blocks is None:
+            self._blocks = self.page.get_text("blocks")
+        return self._blocks
+
+    @property
+    def text_blocks(self) -> List[tuple]:
+        """Blocks of the page that contain text (block type 0)."""
+        return [b for b in self.blocks if b[6] == 0]
+
+    @property
+    def words(self) -> List[tuple]:
+        """
+        Words of the page (``page.get_text("words")``).
+
+        Each word is a tuple: (x0, y0, x1, y1, text, block_no, line_no, word_no)
+        """
+        if self._words is None:
+            self._words = self.page.get_text("words")
+        return self._words
+
+    @property
+    def spans(self) -> List[Dict]:
+        """Flattened list of text span dicts from ``page.get_text("dict")``."""
+        if self._spans is None:
+            text_dict = self.page.get_text("dict", flags=SPAN_FLAGS)
+            self._spans = [
+                span
+                for block in text_dict["blocks"]
+                if "lines" in block
+                for line in block["lines"]
+                for span in line["spans"]
+            ]
+        return self._spans
+
+    @property
+    def word_index(self) -> GridIndex:
+        """Grid index over the word bounding boxes."""
+        if self._word_index is None:
+            self._word_index = GridIndex()
+            for w in self.words:
+                self._word_index.insert(w[:4], w)
+        return self._word_index
+
+    @property
+    def span_index(self) -> GridIndex:
+        """Grid index over the text span bounding boxes."""
+        if self._span_index is None:
+            self._span_index = GridIndex()
+            for span in self.spans:
+                self._span_index.insert(span["bbox"], span)
+        return self._span_index
+
+    @property
+    def char_index(self) -> GridIndex:
+        """
+        Grid index over single characters (``page.get_text("rawdict")``).
+
+        Only needed to locate part of a word, so it is built on first use.
+        Items are tuples: (x0, y0, x1, y1, char)
+        """
+        if self._char_index is None:
+            self._char_index = GridIndex()
+            raw = self.page.get_text("rawdict", flags=CHAR_FLAGS)
+            for block in raw["blocks"]:
+                for line in block.get("lines", ()):
+                    for span in line["spans"]:
+                        for char in span["chars"]:
+                            if char["c"].isspace():
+                                continue
+                            bbox = char["bbox"]
+                            self._char_index.insert(bbox, (*bbox, char["c"]))
+        return self._char_index
+
+    def chars_in_rect(self, rect) -> List[tuple]:
+        """
+        Get the characters whose centre lies inside a rectangle.
+
+        Args:
+            rect: Area to look in, e.g. a word bounding box
+
+        Returns:
+            List of (x0, y0, x1, y1, char) tuples in extraction order
+        """
+        x0, y0, x1, y1 = rect[:4]
+        return [
+            c for c in self.char_index.query(rect)
+            if x0 <= (c[0] + c[2]) / 2 <= x1 and y0 <= (c[1] + c[3]) / 2 <= y1
+        ]
+
+    def words_in_rect(self, rect: pymupdf.Rect) -> List[tuple]:
+        """
+        Get all words whose bounding box intersects a rectangle.
+
+        Args:
+            rect: Area to look in
+
+        Returns:
+            List of word tuples in extraction order
+        """
+        return self.word_index.query(rect)
+
+    def spans_in_rect(self, rect: pymupdf.Rect) -> List[Dict]:
+        """
+        Get all text spans whose bounding box intersects a rectangle.
+
+        Args:
+            rect: Area to look in
+
+        Returns:
+            List of span dicts in extraction order
+        """
+        return self.span_index.query(rect)
+
+    def text_in_rect(self, rect: pymupdf.Rect) -> str:
+        """
+        Get the text near a rectangle without re-extracting the page.
+
+        Words are joined by spaces within a line and lines by newlines,
+        like ``page.get_text("text", clip=rect)``.
+
+        Args:
+            rect: Area to look in
+
+        Returns:
+            Text of all words intersecting the rectangle
+        """
+        return join_words(self.words_in_rect(rect))
+
+
+def join_words(words: List[tuple]) -> str:
+    """
+    Join word tuples into text, one output line per (block, line) pair.
+
+    Args:
+        words: Word tuples as returned by ``get_text("words")``
+
+    Returns:
+        Joined text with trailing newline per line
+    """
+    lines: List[str] = []
+    current_line: Optional[Tuple[int, int]] = None
+    for w in words:
+        line_key = (w[5], w[6])
+        if line_key != current_line:
+            lines.append(w[4])
+            current_line = line_key
+        else:
+            lines[-1] += " " + w[4]
+    return "".join(line + "\n" for line in lines)
+
+
+class DocumentTextModel:
+    """
+    Shared, lazily populated text model of a PDF document.
+
+    Holds one ``PageText`` per page. Pages are only loaded and extracted
+    when a stage of the pipeline first asks for them.
+    """
+
+    def __init__(self, doc: pymupdf.Document):
+        """
+        Initialize the document text model.
+
+        Args:
+            doc: Opened PDF document
+        """
+        self.doc = doc
+        self._pages: Dict[int, PageText] = {}
+
+    def __len__(self) -> int:
+        return len(self.doc)
+
+    def page(self, page_num: int) -> PageText:
+        """
+        Get the cached text of a page.
+
+        Args:
+            page_num: Zero-based page number
+
+        Returns:
+            PageText for the page
+        """
+        page_text = self._pages.get(page_num)
+        if page_text is None:
+            page_text = PageText(self.doc[page_num])
+            self._pages[page_num] = page_text
+        return page_text
+
+    def release(self, page_num: int) -> None:
+        """
+        Drop the cached text of a page (it is extracted again on next use).
+
+        Args:
+            page_num: Zero-based page number
+        """
+        self._pages.pop(page_num, None)
+
+    def iter_page_texts(self) -> Iterator[str]:
+        """
+        Iterate over the plain text of all pages, extracting on demand.
+
+        Yields:
+            Plain text of each page in page order
+        """
+        for page_num in range(len(self.doc)):
+            yield self.page(page_num).text
+
+    @property
+    def full_text(self) -> str:
+        """Plain text of the whole document (all pages concatenated)."""
+        return "".join(self.iter_page_texts())
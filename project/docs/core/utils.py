@@ -4,10 +4,61 @@ PDF Utilities Module
 Provides low-level PDF manipulation utilities using PyMuPDF.
 """
 
+import mmap
 import pymupdf
 from pathlib import Path
-from typing import List, Tuple, Optional, Dict
-import re
+from typing import BinaryIO, List, Tuple, Optional, Dict, Iterable, Union
+
+try:
+    from .patterns import PATTERNS, VAT_SCAN_KEYWORDS, VAT_SCAN_MARGIN, VAT_SCAN_TAIL_CHARS, VAT_SCAN_KEYWORD_LENGTH  # Relative import (when run as module)
+except ImportError:
+    try:
+        from core.patterns import PATTERNS, VAT_SCAN_KEYWORDS, VAT_SCAN_MARGIN, VAT_SCAN_TAIL_CHARS, VAT_SCAN_KEYWORD_LENGTH  # From core package
+    except ImportError:
+        from patterns import PATTERNS, VAT_SCAN_KEYWORDS, VAT_SCAN_MARGIN, VAT_SCAN_TAIL_CHARS, VAT_SCAN_KEYWORD_LENGTH  # Absolute import (when run directly)
+
+try:
+    from .reference_data import ReferenceData  # Relative import (when run as module)
+except ImportError:
+    try:
+        from core.reference_data import ReferenceData  # From core package
+    except ImportError:
+        from reference_data import ReferenceData  # Absolute import (when run directly)
+
+
+# Replacements for characters a font cannot render
+TEXT_FALLBACKS = {'€': 'EUR'}
+
+# Process-wide caches: font name -> Font, font name -> {char: replacement}
+_FONT_CACHE: Dict[str, pymupdf.Font] = {}
+_GLYPH_CACHE: Dict[str, Dict[str, str]] = {}
+
+
+def _open_tail_start(buffer: str) -> int:
+    """
+    Start of the end of a text that a VAT match could still continue from.
+    
+    A match that is cut off by the end of a page consists of a keyword (or
+    percentage), then only separators, digits and possibly the first letters
+    of "VAT". Everything from such a run on is kept for the next page.
+    
+    Args:
+        buffer: Text scanned so far
+    
+    Returns:
+        Offset in buffer
+    """
+    def skip_keyword(end: int) -> int:
+        start = end
+        while start and end - start < VAT_SCAN_KEYWORD_LENGTH and buffer[start - 1].isascii() \
+                and buffer[start - 1].isalpha():
+            start -= 1
+        return start
+    
+    # Partial keyword at the very end, separators and digits, the keyword before them
+    start = skip_keyword(len(buffer))
+    start = len(buffer[:start].rstrip(VAT_SCAN_TAIL_CHARS))
+    return skip_keyword(start)
 
 
 class PDFUtils:
@@ -18,14 +69,17 @@ class PDFUtils:
     DEFAULT_FONT_SIZE = 8.0
     DEFAULT_FONT_FAMILY = "helv"
     DEFAULT_PADDING = 2
-    
+    DEFAULT_MERGE_GAP = 1.0  # Highlights closer than this on one line are merged
+    DEFAULT_LINE_TOLERANCE = 0.5  # Top/bottom edge difference still counted as one line
+
     @staticmethod
-    def open_pdf(pdf_path: Path) -> pymupdf.Document:
+    def open_pdf(pdf_path: Path, use_mmap: bool = False) -> pymupdf.Document:
         """
         Open a PDF document.
         
         Args:
             pdf_path: Path to the PDF file
+            use_mmap: Memory-map the file instead of reading it (see map_pdf)
             
         Returns:
             Opened PDF document
@@ -38,10 +92,38 @@ class PDFUtils:
             raise FileNotFoundError(f"PDF file not found: {pdf_path}")
         
         try:
+            if use_mmap:
+                return pymupdf.open(stream=PDFUtils.map_pdf(pdf_path), filetype="pdf")
             return pymupdf.open(str(pdf_path))
         except Exception as e:
             raise Exception(f"Failed to open PDF: {e}")
     
+    @staticmethod
+    def map_pdf(source: Union[Path, str, BinaryIO]) -> memoryview:
+        """
+        Memory-map a PDF file read-only.
+        
+        PyMuPDF reads a memoryview in place, so the file is not copied into
+        the process: pages are loaded from the page cache on access and are
+        shared by every process that maps the same file.
+        
+        Args:
+            source: Path of the PDF file, or an open binary file backed by disk
+            
+        Returns:
+            Read-only view of the file contents; the mapping is released when
+            the view and every document opened from it are gone
+            
+        Raises:
+            ValueError: If the file is empty
+        """
+        if hasattr(source, "fileno"):
+            mapped = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            with open(source, "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return memoryview(mapped)
+    
     @staticmethod
     def find_text_positions(
         doc: pymupdf.Document,
@@ -91,14 +173,186 @@ class PDFUtils:
             color: RGB color tuple (default: light yellow)
             padding: Padding around the rectangle
         """
-        expanded_rect = pymupdf.Rect(
-            rect.x0 - padding,
-            rect.y0 - padding,
-            rect.x1 + padding,
-            rect.y1 + padding
-        )
-        page.draw_rect(expanded_rect, color=color, fill=color)
-    
+        PDFUtils.highlight_rects(page, [rect], color=color, padding=padding)
+
+    @staticmethod
+    def merge_rects(
+        rects: Iterable[Tuple[float, float, float, float]],
+        gap: float = DEFAULT_MERGE_GAP,
+        line_tolerance: float = DEFAULT_LINE_TOLERANCE
+    ) -> List[Tuple[float, float, float, float]]:
+        """
+        Merge rectangles that overlap or touch on the same text line.
+
+        Two rectangles are on the same line when their top and bottom edges
+        differ by at most line_tolerance; they are merged when the horizontal
+        space between them is at most gap.
+
+        Args:
+            rects: Rectangles as (x0, y0, x1, y1)
+            gap: Largest horizontal distance that still counts as touching
+            line_tolerance: Largest difference of top/bottom edges on one line
+
+        Returns:
+            Merged rectangles as (x0, y0, x1, y1), sorted by line and x
+        """
+        ordered = sorted((tuple(r) for r in rects), key=lambda r: (r[1], r[3], r[0]))
+        merged: List[List[float]] = []
+        for x0, y0, x1, y1 in ordered:
+            target = None
+            # Only rectangles on the current line can be merged with this one
+            for current in reversed(merged):
+                if abs(current[1] - y0) > line_tolerance:
+                    break
+                if abs(current[3] - y1) <= line_tolerance and x0 <= current[2] + gap and x1 >= current[0] - gap:
+                    target = current
+                    break
+
+            if target is None:
+                merged.append([x0, y0, x1, y1])
+            else:
+                target[0] = min(target[0], x0)
+                target[1] = min(target[1], y0)
+                target[2] = max(target[2], x1)
+                target[3] = max(target[3], y1)
+        return [tuple(r) for r in merged]
+
+    @staticmethod
+    def highlight_rects(
+        page: pymupdf.Page,
+        rects: Iterable,
+        color: Tuple[float, float, float] = DEFAULT_HIGHLIGHT_COLOR,
+        padding: float = DEFAULT_PADDING,
+        oc: int = 0
+    ) -> int:
+        """
+        Draw many highlight rectangles on a page with a single Shape.
+
+        Overlapping and adjacent rectangles on the same line are merged first,
+        and all of them are committed as one content stream fragment.
+
+        Args:
+            page: PDF page to draw on
+            rects: Rectangles (pymupdf.Rect or (x0, y0, x1, y1))
+            color: RGB color tuple (default: light yellow)
+            padding: Padding around each rectangle
+            oc: Optional content group xref (0 = always visible)
+
+        Returns:
+            Number of rectangles drawn after merging
+        """
+        expanded = [
+            (r[0] - padding, r[1] - padding, r[2] + padding, r[3] + padding)
+            for r in rects
+        ]
+        merged = PDFUtils.merge_rects(expanded)
+        if not merged:
+            return 0
+
+        shape = page.new_shape()
+        for rect in merged:
+            shape.draw_rect(pymupdf.Rect(rect))
+        shape.finish(color=color, fill=color, oc=oc)
+        shape.commit()
+        return len(merged)
+
+    @staticmethod
+    def get_font(font_family: str = DEFAULT_FONT_FAMILY) -> pymupdf.Font:
+        """
+        Get a font object, loading it once per process.
+        
+        Args:
+            font_family: Font name understood by ``pymupdf.Font`` (e.g. "helv")
+            
+        Returns:
+            Cached pymupdf.Font
+        """
+        font = _FONT_CACHE.get(font_family)
+        if font is None:
+            font = pymupdf.Font(font_family)
+            _FONT_CACHE[font_family] = font
+        return font
+
+    @staticmethod
+    def prepare_text(text: str, font_family: str = DEFAULT_FONT_FAMILY) -> str:
+        """
+        Replace characters the font has no glyph for.
+        
+        Runs before drawing instead of catching errors per insert: "€"
+        becomes "EUR", any other missing character "?". Base-14 fonts such
+        as "helv" are written with a single-byte encoding, so only Latin-1
+        characters count as available there. Lookups are cached per font
+        and character.
+        
+        Args:
+            text: Text to draw
+            font_family: Font the text will be drawn with
+            
+        Returns:
+            Text that the font can render completely
+        """
+        if text.isascii():
+            return text
+        glyphs = _GLYPH_CACHE.setdefault(font_family, {})
+        parts = []
+        for char in text:
+            replacement = glyphs.get(char)
+            if replacement is None:
+                font = PDFUtils.get_font(font_family)
+                simple_encoding = font_family in pymupdf.Base14_fontdict
+                if font.has_glyph(ord(char)) and (ord(char) < 256 or not simple_encoding):
+                    replacement = char
+                else:
+                    replacement = TEXT_FALLBACKS.get(char, "?")
+                glyphs[char] = replacement
+            parts.append(replacement)
+        return "".join(parts)
+
+    @staticmethod
+    def insert_texts(
+        page: pymupdf.Page,
+        items: Iterable[Tuple[float, float, str]],
+        font_size: float = DEFAULT_FONT_SIZE,
+        font_family: str = DEFAULT_FONT_FAMILY,
+        color: Tuple[int, int, int] = (0, 0, 0),
+        oc: int = 0
+    ) -> int:
+        """
+        Insert many texts on a page with a single Shape.
+        
+        All texts are collected first and committed in one go, so the page
+        content stream and the font resource are only touched once. Base-14
+        fonts ("helv") are referenced, not embedded, which keeps every output
+        file as small as the input.
+        
+        Args:
+            page: PDF page to insert text on
+            items: (x, y, text) tuples; (x, y) is the text baseline start
+            font_size: Size of the font
+            font_family: Font family name
+            color: Text color as RGB tuple
+            oc: Optional content group xref (0 = always visible)
+            
+        Returns:
+            Number of texts written
+        """
+        shape = page.new_shape()
+        count = 0
+        for x, y, text in items:
+            shape.insert_text(
+                pymupdf.Point(x, y),
+                PDFUtils.prepare_text(text, font_family),
+                fontsize=font_size,
+                fontname=font_family,
+                color=color,
+                render_mode=0,  # Fill text (not outline)
+                oc=oc,
+            )
+            count += 1
+        if count:
+            shape.commit()
+        return count
+
     @staticmethod
     def insert_text(
         page: pymupdf.Page,
@@ -120,32 +374,13 @@ class PDFUtils:
             color: Text color as RGB tuple
             
         Note:
-            Handles Unicode Euro symbol (€) with fallback to "EUR"
+            Characters missing from the font are replaced by ``prepare_text``
+            (Euro symbol "€" -> "EUR"). Use ``insert_texts`` for many texts
+            on one page.
         """
         x, y = position
-        point = pymupdf.Point(x, y)
-        
-        try:
-            # Try inserting with Unicode Euro
-            page.insert_text(
-                point,
-                text,
-                fontsize=font_size,
-                fontname=font_family,
-                color=color,
-                render_mode=0,  # Fill text (not outline)
-            )
-        except Exception:
-            # Fallback: if Euro symbol fails, use "EUR" instead
-            text_fallback = text.replace('€', 'EUR')
-            page.insert_text(
-                point,
-                text_fallback,
-                fontsize=font_size,
-                fontname=font_family,
-                color=color,
-                render_mode=0,
-            )
+        PDFUtils.insert_texts(page, [(x, y, text)], font_size=font_size,
+                              font_family=font_family, color=color)
     
     @staticmethod
     def save_pdf(
@@ -188,60 +423,100 @@ class PDFUtils:
             doc.close()
     
     @staticmethod
-    def detect_vat_percentage(text: str) -> Optional[float]:
+    def detect_vat_percentage(text: Union[str, Iterable[str]]) -> Optional[float]:
         """
         Detect VAT percentage from text.
         
+        Scans the text once for VAT keywords and applies the priority rules
+        as it goes: the first "<percent> % VAT" match wins immediately,
+        otherwise the first "VAT <percent>" match, otherwise the first match
+        of the other keywords in rule order (MwSt, Mehrwertsteuer, USt, GST,
+        TVA, IVA).
+        
         Args:
-            text: Text to search for VAT percentage
+            text: Text to search for VAT percentage, or an iterable of page
+                texts. Pages are consumed lazily, so later pages are not
+                requested once the highest-priority rule has fired.
             
         Returns:
             VAT percentage as float, or None if not found
             
         Example:
-            >>> detect_vat_percentage("19 %")
-            19.0
+            >>> detect_vat_percentage("(8,10 % VAT: 115,39)")
+            8.1
             >>> detect_vat_percentage("MwSt: 19%")
             19.0
         """
-        # Match patterns like "19 %", "19%", "MwSt 19%", etc.
-        patterns = [
-            r'(\d+(?:[,\.]\d+)?)\s*%\s*VAT',  # "8.10 % VAT" or "8,10 % VAT"
-            r'VAT[:\s]*(\d+(?:[,\.]\d+)?)',  # "VAT: 19" or "VAT 19"
-            r'MwSt[:\s]*(\d+(?:[,\.]\d+)?)',  # "MwSt: 19"
-            r'Mehrwertsteuer[:\s]*(\d+(?:[,\.]\d+)?)',  # "Mehrwertsteuer: 19"
-            r'USt[:\s]*(\d+(?:[,\.]\d+)?)',  # "USt: 19"
-            r'GST[:\s]*\((\d+(?:[,\.]\d+)?)',  # "GST(9%)"
-            r'TVA[:\s]*(\d+(?:[,\.]\d+)?)',  # "TVA: 19" (French)
-            r'IVA[:\s]*(\d+(?:[,\.]\d+)?)',  # "IVA: 19" (Italian/Spanish)
-        ]
+        # Match patterns like "8,10 % VAT", "MwSt 19%", etc. (see patterns.py)
+        rules = PATTERNS.group("vat.")
+        scanner = PATTERNS["vat_scan"]
+        rule_by_keyword = {
+            keyword: rules[index]
+            for index, keyword in enumerate(VAT_SCAN_KEYWORDS, start=1)
+        }
+        rule_index = {rule.name: index for index, rule in enumerate(rules)}
         
-        # Store all found percentages with context
-        found_vat = []
+        chunks = [text] if isinstance(text, str) else text
+        buffer = ""  # Text not scanned yet (plus margin)
+        base = 0  # Document offset of buffer[0]
+        last_end = [0] * len(rules)  # Per-rule end of last match (non-overlapping)
+        first_value: List[Optional[float]] = [None] * len(rules)
         
-        for pattern in patterns:
-            matches = re.finditer(pattern, text, re.IGNORECASE)
-            for match in matches:
+        chunk_iter = iter(chunks)
+        more = True
+        while more:
+            chunk = next(chunk_iter, None)
+            more = chunk is not None
+            if more:
+                buffer += chunk
+            # Hits close to the end, or followed only by text a match can run on
+            # with, may continue on the next page - defer them
+            limit = min(len(buffer) - VAT_SCAN_MARGIN, _open_tail_start(buffer)) if more else len(buffer)
+            
+            pos = 0
+            while True:
+                hit = scanner.search(buffer, pos)
+                if hit is None or hit.start() >= limit:
+                    pos = max(pos, limit)
+                    break
+                start = hit.start()
+                pos = start + 1
+                
+                if hit.group("percent") is not None:
+                    rule = rules[0]
+                else:
+                    rule = rule_by_keyword[hit.group("keyword").lower()]
+                index = rule_index[rule.name]
+                if base + start < last_end[index]:
+                    continue
+                
+                match = rule.match(buffer, start)
+                if match is None:
+                    continue
+                last_end[index] = base + match.end()
+                if first_value[index] is not None:
+                    continue
+                
                 try:
-                    vat_str = match.group(1).replace(',', '.')
-                    vat_percent = float(vat_str)
-                    # Reasonable VAT range: 0-30%
-                    if 0 <= vat_percent <= 30:
-                        found_vat.append({
-                            'value': vat_percent,
-                            'pattern': pattern,
-                            'context': text[max(0, match.start()-20):match.end()+20]
-                        })
+                    vat_percent = float(match.group(1).replace(',', '.'))
                 except (ValueError, IndexError):
                     continue
+                # Reasonable VAT range: 0-30%
+                if not 0 <= vat_percent <= 30:
+                    continue
+                
+                if index == 0:
+                    # Highest priority rule fired - no need to look further
+                    return vat_percent
+                first_value[index] = vat_percent
+            
+            base += pos
+            buffer = buffer[pos:]
         
-        if found_vat:
-            # Prioritize patterns with "VAT" keyword
-            vat_matches = [v for v in found_vat if 'VAT' in v['pattern']]
-            if vat_matches:
-                return vat_matches[0]['value']
-            # Otherwise return first valid match
-            return found_vat[0]['value']
+        # Prioritize "VAT" keyword, otherwise first valid match in rule order
+        for value in first_value:
+            if value is not None:
+                return value
         
         return None
     
@@ -290,14 +565,11 @@ class PDFUtils:
             >>> detect_country_code("Via Pietro Capelli 18 - CH-6900 Lugano")
             'CH'
         """
-        # Pattern to match country codes: 2-3 uppercase letters, optionally followed by dash/space/postal code
-        patterns = [
-            r'\b([A-Z]{2,3})[-\s]\d',  # "CH-6900" or "DE 12345"
-            r'\b([A-Z]{2,3})\b',  # Standalone country code (less reliable)
-        ]
+        # Country codes: 2-3 uppercase letters, optionally followed by dash/space/postal code
+        rules = PATTERNS.group("country.")
         
-        for pattern in patterns:
-            matches = re.finditer(pattern, text)
+        for rule in rules:
+            matches = rule.finditer(text)
             for match in matches:
                 code = match.group(1)
                 # Reason: Common European country codes are 2 letters
@@ -317,27 +589,7 @@ class PDFUtils:
         Returns:
             Country name or code if not found
         """
-        country_map = {
-            'CH': 'Switzerland',
-            'DE': 'Germany',
-            'FR': 'France',
-            'IT': 'Italy',
-            'AT': 'Austria',
-            'UK': 'United Kingdom',
-            'US': 'United States',
-            'NL': 'Netherlands',
-            'BE': 'Belgium',
-            'ES': 'Spain',
-            'PT': 'Portugal',
-            'SE': 'Sweden',
-            'NO': 'Norway',
-            'DK': 'Denmark',
-            'FI': 'Finland',
-            'PL': 'Poland',
-            'CZ': 'Czech Republic',
-        }
-        
-        return country_map.get(code.upper(), code)
+        return ReferenceData.country_name(code)
     
     @staticmethod
     def extract_all_prices(text: str) -> List[float]:
@@ -351,10 +603,8 @@ class PDFUtils:
             List of price values as floats
         """
         # European price format: "1.540,00" or "1540,00"
-        price_pattern = r'\d{1,3}(?:\.\d{3})*,\d{2}'
-        
         prices = []
-        matches = re.finditer(price_pattern, text)
+        matches = PATTERNS["price"].finditer(text)
         
         for match in matches:
             try:
@@ -12,15 +12,22 @@ Example:
     python -m src.main invoice.pdf _corrected
 """
 
+import os
 import sys
+import mmap
+import tempfile
 from pathlib import Path
-import re
 import pymupdf
-import csv
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 
 # Import PDFUtils - add current directory to path
 sys.path.insert(0, str(Path(__file__).parent))
 
+# Core modules live in docs/core - make them importable by module name
+CORE_DIR = Path(__file__).parent.parent / "docs" / "core"
+sys.path.insert(0, str(CORE_DIR))
+
 # Direct import from docs/core
 import importlib.util
 spec = importlib.util.spec_from_file_location(
@@ -31,44 +38,57 @@ utils_module = importlib.util.module_from_spec(spec)
 spec.loader.exec_module(utils_module)
 PDFUtils = utils_module.PDFUtils
 
+from text_model import DocumentTextModel
+from spatial_index import ProximityIndex
+from price_scanner import scan_prices
+from price_table import PriceCandidateTable
+from invoice_plan import InvoicePlan, PagePlan
+from reference_data import ReferenceData
+from layout_templates import TemplateStore, layout_fingerprint, price_columns
+from patterns import PATTERNS
+
+# Output styles, in the order they are rendered for "both"
+OUTPUT_STYLES = ("review", "download")
+
+# Highlight fill per output style: yellow for review, white for download
+HIGHLIGHT_COLORS = {"review": (1, 1, 0.85), "download": (1, 1, 1)}
+
+# Optional content group (layer) names used by the "layered" output style
+LAYER_NAMES = {"review": "Review highlights", "download": "Download highlights"}
+
+# Page ranges handed to each worker process in parallel analysis
+PARALLEL_CHUNKS_PER_WORKER = 4
+
+# Importers by country code, loaded from configs/importers.csv
+REFERENCE_DATA = ReferenceData(Path(__file__).parent / "configs" / "importers.csv")
+
+# Anchors learned per supplier layout, reused by later invoices with the same layout.
+# Set LAYOUT_TEMPLATES_FILE to keep them across restarts (empty = memory only)
+LAYOUT_TEMPLATES_FILE = os.getenv("LAYOUT_TEMPLATES_FILE", "")
+LAYOUT_TEMPLATES = TemplateStore(path=LAYOUT_TEMPLATES_FILE or None)
+
+# Pre-rendered importer boxes: (importer, vat_number, width, height, style) -> stamp PDF
+IMPORTER_STAMPS = {}
+IMPORTER_STAMP_MARGIN = 10  # Room around the box for descenders and long names
+
 
 def get_importer_info(country_code: str):
     """
     Get importer information from CSV based on country code.
     
+    The CSV is loaded once by REFERENCE_DATA and reloaded when it changes.
+    
     Args:
         country_code: 2-letter country code (e.g., "CH", "GB", "AU")
         
     Returns:
         Dictionary with importer info or None if not found
     """
-    if not country_code:
-        return None
-    
-    # Path to importers CSV
-    csv_path = Path(__file__).parent / "configs" / "importers.csv"
-    
-    if not csv_path.exists():
-        print(f"[WARNING] Importers CSV not found at: {csv_path}")
-        return None
-    
-    try:
-        with open(csv_path, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                if row['country_code'].upper() == country_code.upper():
-                    return {
-                        'importer': row['importer'],
-                        'vat_number': row['vat_number'],
-                        'country': row['country']
-                    }
-    except Exception as e:
-        print(f"[WARNING] Error reading importers CSV: {e}")
-    
-    return None
+    importer = REFERENCE_DATA.importer(country_code)
+    return dict(importer) if importer is not None else None
 
 
-def add_importer_info_box(doc, country_code: str, output_style: str = "review"):
+def add_importer_info_box(doc, country_code: str, output_style: str = "review", text_model=None):
     """
     Add importer information box to the first page of the PDF.
     
@@ -76,29 +96,97 @@ def add_importer_info_box(doc, country_code: str, output_style: str = "review"):
         doc: PyMuPDF document
         country_code: Country code to look up importer
         output_style: Output style - "review" for yellow, "download" for white
+        text_model: Optional shared DocumentTextModel of the document
+    """
+    box = plan_importer_box(doc, country_code, text_model)
+    if box:
+        draw_importer_box(doc[0], box, output_style)
+
+
+def plan_importer_box(doc, country_code: str, text_model=None):
+    """
+    Decide the position and content of the importer box on the first page.
+    
+    Args:
+        doc: PyMuPDF document
+        country_code: Country code to look up importer
+        text_model: Optional shared DocumentTextModel of the document
+    
+    Returns:
+        Dictionary with x, y, width, height, importer and vat_number, or None
     """
     importer_info = get_importer_info(country_code)
     
     if not importer_info:
         print(f"[INFO] No importer info found for country code: {country_code}")
-        return
+        return None
     
     print(f"[INFO] Adding importer info box for {country_code}: {importer_info['importer']}")
     
-    # Add to first page
-    page = doc[0]
-    page_rect = page.rect
-    
     # Find anchor point for importer box placement
     # Priority: 1) Shipping address line, 2) Packlist row, 3) Default position
     y_position = 200  # Default position
-    text_blocks = page.get_text("blocks")
+    if text_model is None:
+        text_model = DocumentTextModel(doc)
+    text_blocks = text_model.page(0).blocks
+    
+    anchor_name, anchor_row_top, anchor_row_x0 = find_importer_anchor(text_blocks)
+    
+    # Calculate box dimensions - accommodate full text but compact
+    # Full importer name: "Cream della Cream Switzerland GmbH" = 40 chars
+    # Full VAT number: "VAT Number: CHE-114.821.618" = 28 chars
+    box_width = 290  # Compact width to fit content (increased by 10px on right side)
+    box_height = 50  # Reduced height for more compact box
+    
+    if anchor_row_top is not None:
+        # Use upper border of anchor row as lower boundary for our box
+        # Position box so its bottom is above the anchor row top
+        margin = 8  # Reduced spacing between box bottom and anchor row top
+        y_position = anchor_row_top - box_height - margin
+        print(f"[INFO] Placing box above {anchor_name} (top at y={anchor_row_top:.1f})")
+        print(f"[INFO] Box top will be at y={y_position:.1f} (box bottom at y={anchor_row_top - margin:.1f})")
+    else:
+        print(f"[WARNING] Could not find shipping address line or packlist row, using default y={y_position}")
+    
+    # Align box text with anchor text start
+    if anchor_row_x0 is not None:
+        # Offset box left by text padding (10px) so the text inside aligns with anchor text
+        x = anchor_row_x0 - 10
+        print(f"[INFO] Aligning box text with {anchor_name} text start at x={anchor_row_x0:.1f} (box at x={x:.1f})")
+    else:
+        x = 10  # Fallback: Left side with small padding
+    
+    y = y_position  # Below recipient address area
+    
+    print(f"[INFO] Final box dimensions: {box_width}x{box_height} at position ({x:.1f}, {y:.1f})")
+    
+    return {
+        'x': x,
+        'y': y,
+        'width': box_width,
+        'height': box_height,
+        'importer': importer_info['importer'],
+        'vat_number': importer_info['vat_number'],
+    }
+
+
+def find_importer_anchor(text_blocks):
+    """
+    Find the anchor row of the importer box on the first page.
+    
+    Priority: 1) Shipping address line (if above the packlist row), 2) Packlist row.
     
+    Args:
+        text_blocks: Text blocks of the first page
+    
+    Returns:
+        Tuple (anchor name, row top, row left), all None if no anchor was found
+    """
     # Pattern for shipping address line (e.g., "Shipping Addr.:" or "Shipping Address:")
-    shipping_pattern = re.compile(r'shipping\s+addr', re.IGNORECASE)
+    shipping_pattern = PATTERNS["anchor.shipping_address"]
     
     # Pattern for packlist row
-    packlist_pattern = re.compile(r'packinglist', re.IGNORECASE)
+    packlist_pattern = PATTERNS["anchor.packinglist"]
     
     shipping_row_top = None
     shipping_row_x0 = None
@@ -129,13 +217,7 @@ def add_importer_info_box(doc, country_code: str, output_style: str = "review"):
                 packlist_row_x0 = block_x0  # Capture x position for alignment
                 print(f"[INFO] Found packlist row '{block_text.strip()[:50]}' top at y={block_y0:.1f}, left at x={block_x0:.1f}")
     
-    # Calculate box dimensions - accommodate full text but compact
-    # Full importer name: "Cream della Cream Switzerland GmbH" = 40 chars
-    # Full VAT number: "VAT Number: CHE-114.821.618" = 28 chars
-    box_width = 290  # Compact width to fit content (increased by 10px on right side)
-    box_height = 50  # Reduced height for more compact box
-    
-    # Calculate y_position: use shipping address only if it's above packlist row
+    # Use shipping address only if it's above packlist row
     # In PyMuPDF coordinate system: smaller y0 = higher on page
     anchor_row_top = None
     anchor_row_x0 = None
@@ -168,32 +250,89 @@ def add_importer_info_box(doc, country_code: str, output_style: str = "review"):
         anchor_name = "packlist row"
         print(f"[INFO] Packlist row found, shipping address line not found - using packlist row as anchor")
     
-    if anchor_row_top is not None:
-        # Use upper border of anchor row as lower boundary for our box
-        # Position box so its bottom is above the anchor row top
-        margin = 8  # Reduced spacing between box bottom and anchor row top
-        y_position = anchor_row_top - box_height - margin
-        print(f"[INFO] Placing box above {anchor_name} (top at y={anchor_row_top:.1f})")
-        print(f"[INFO] Box top will be at y={y_position:.1f} (box bottom at y={anchor_row_top - margin:.1f})")
-    else:
-        print(f"[WARNING] Could not find shipping address line or packlist row, using default y={y_position}")
+    return anchor_name, anchor_row_top, anchor_row_x0
+
+
+def draw_importer_box(page, box, output_style: str = "review", layers=None):
+    """
+    Place the importer box planned by plan_importer_box.
     
-    # Align box text with anchor text start
-    if anchor_row_x0 is not None:
-        # Offset box left by text padding (10px) so the text inside aligns with anchor text
-        x = anchor_row_x0 - 10
-        print(f"[INFO] Aligning box text with {anchor_name} text start at x={anchor_row_x0:.1f} (box at x={x:.1f})")
+    The box is drawn once per importer and style into a small stamp PDF
+    (get_importer_stamp) and shown on the page as a Form XObject.
+    
+    Args:
+        page: First page of the document
+        box: Box dictionary from plan_importer_box
+        output_style: Output style - "review" for yellow, "download" for white,
+            "layered" for one stamp per style on its own layer
+        layers: Layer xref per style from add_style_layers ("layered" only)
+    """
+    if output_style == "layered":
+        placements = list(layers.items())
     else:
-        x = 10  # Fallback: Left side with small padding
+        placements = [(output_style, 0)]
     
-    y = y_position  # Below recipient address area
+    for style, oc in placements:
+        stamp, margin = get_importer_stamp(box, style)
+        stamp_rect = stamp[0].rect
+        target = pymupdf.Rect(box['x'] - margin, box['y'] - margin,
+                              box['x'] - margin + stamp_rect.width,
+                              box['y'] - margin + stamp_rect.height)
+        page.show_pdf_page(target, stamp, 0, oc=oc)
     
-    print(f"[INFO] Final box dimensions: {box_width}x{box_height} at position ({x:.1f}, {y:.1f})")
+    print(f"[SUCCESS] Importer info box added successfully")
+
+
+def get_importer_stamp(box, output_style: str = "review"):
+    """
+    Get the pre-rendered importer box for an importer and style.
+    
+    Stamps are cached per process, so the box is only drawn the first time
+    an importer is seen in a style.
+    
+    Args:
+        box: Box dictionary from plan_importer_box
+        output_style: "review" or "download"
+    
+    Returns:
+        Tuple of (one-page stamp PDF, margin around the box on the stamp page)
+    """
+    key = (box['importer'], box['vat_number'], box['width'], box['height'], output_style)
+    stamp = IMPORTER_STAMPS.get(key)
+    if stamp is None:
+        # Long names may run past the right edge of the box - widen the page
+        text_width = 10 + max(
+            pymupdf.get_text_length(box['importer'], fontname="helv", fontsize=9.0),
+            pymupdf.get_text_length(f"VAT Number: {box['vat_number']}", fontname="helv", fontsize=8.5),
+        )
+        stamp = pymupdf.open()
+        stamp_page = stamp.new_page(
+            width=max(box['width'], text_width) + 2 * IMPORTER_STAMP_MARGIN,
+            height=box['height'] + 2 * IMPORTER_STAMP_MARGIN,
+        )
+        draw_importer_box_content(
+            stamp_page, dict(box, x=IMPORTER_STAMP_MARGIN, y=IMPORTER_STAMP_MARGIN), output_style)
+        IMPORTER_STAMPS[key] = stamp
+        print(f"[INFO] Rendered importer box stamp for {box['importer']} ({output_style})")
+    return stamp, IMPORTER_STAMP_MARGIN
+
+
+def draw_importer_box_content(page, box, output_style: str = "review"):
+    """
+    Draw the importer box rectangle and its three text lines.
+    
+    Args:
+        page: Page to draw on (the stamp page of get_importer_stamp)
+        box: Box dictionary with x, y, width, height, importer and vat_number
+        output_style: Output style - "review" for yellow, "download" for white
+    """
+    x, y = box['x'], box['y']
+    box_width, box_height = box['width'], box['height']
     
     # Draw rectangle with appropriate color based on output style
-    box_color = (1, 1, 0.85) if output_style == "review" else (1, 1, 1)
     box_rect = pymupdf.Rect(x, y, x + box_width, y + box_height)
-    page.draw_rect(box_rect, color=box_color, fill=box_color)
+    for box_color, oc in get_style_fills(output_style):
+        page.draw_rect(box_rect, color=box_color, fill=box_color, oc=oc)
     
     # Add text - 3 lines with tight spacing, vertically centered in box
     line_height = 14  # Tight spacing for compact box
@@ -215,7 +354,7 @@ def add_importer_info_box(doc, country_code: str, output_style: str = "review"):
         pass
     
     # Line 2: Importer name (full length - no truncation)
-    importer_name = importer_info['importer']
+    importer_name = box['importer']
     
     try:
         page.insert_text(
@@ -241,7 +380,7 @@ def add_importer_info_box(doc, country_code: str, output_style: str = "review"):
             pass
     
     # Line 3: VAT Number
-    vat_text = f"VAT Number: {importer_info['vat_number']}"
+    vat_text = f"VAT Number: {box['vat_number']}"
     try:
         page.insert_text(
             pymupdf.Point(x + 10, text_y + line_height * 2),
@@ -264,262 +403,178 @@ def add_importer_info_box(doc, country_code: str, output_style: str = "review"):
             )
         except Exception:
             pass
-    
-    print(f"[SUCCESS] Importer info box added successfully")
 
 
-def extract_prices_and_positions(doc, detected_vat):
+def extract_prices_and_positions(doc, detected_vat, text_model=None, pages=None):
     """
     Extract all prices and their positions from PDF.
     
+    Args:
+        doc: PyMuPDF document
+        detected_vat: Detected VAT percentage
+        text_model: Optional shared DocumentTextModel of the document
+        pages: Optional page numbers to search (default: all pages)
+    
     Returns:
-        List of tuples: (page_num, position, rect, original_value, new_value)
+        List of PriceHit records
     """
     all_prices = []
-    
-    for page_num in range(len(doc)):
-        page = doc[page_num]
-        
+    if text_model is None:
+        text_model = DocumentTextModel(doc)
+    if pages is None:
+        pages = range(len(doc))
+    
+    # Collect all price candidates first, then classify them in one go
+    candidates = []
+    for page_num in pages:
         print(f"\n[INFO] Searching for prices on page {page_num + 1}...")
         
-        # Search for European price format: "1.540,00" or "1540,00"
-        price_pattern = r'\d{1,3}(?:\.\d{3})*,\d{2}'
-        
-        text_blocks = page.get_text("blocks")
-        text_only_blocks = [b for b in text_blocks if b[6] == 0]
+        # Single pass over the page's words: each price comes with its exact rect
+        candidates.extend((page_num, match) for match in scan_prices(text_model.page(page_num)))
+    
+    # Vectorized filters: skip percentages, discounts and out-of-range values
+    table = PriceCandidateTable.from_matches(candidates)
+    keep = table.keep_mask()
+    new_values = table.without_vat(detected_vat)
+    
+    # Positions of prices already found per page (duplicate suppression)
+    seen_positions = {}
+    for row in np.flatnonzero(keep):
+        hit = table.hit(row, new_values[row])
+        seen = seen_positions.setdefault(hit.page_num, ProximityIndex(tolerance=5))
+        if seen.has_near(hit.x0, hit.y0):
+            continue
+        seen.add(hit.x0, hit.y0)
+        all_prices.append(hit)
         
-        for block in text_only_blocks:
-            block_text = block[4]
-            matches = re.finditer(price_pattern, block_text)
-            
-            for match in matches:
-                price_str = match.group(0)
-                
-                # Skip dates and small values
-                if re.match(r'\d{2}[\.]\d{2}[\.]\d{4}', price_str):
-                    continue
-                if re.match(r'\d{2}[\.]\d{2}', price_str) and float(price_str.replace(',', '.')) < 50:
-                    continue
-                
-                try:
-                    price_without_thousands = price_str.replace('.', '')
-                    price_float = float(price_without_thousands.replace(',', '.'))
-                    
-                    # Skip discount percentages - small values (< 100) with % sign nearby
-                    block_context = block_text[max(0, block_text.find(price_str) - 30):block_text.find(price_str) + len(price_str) + 30]
-                    
-                    # Check if this is a discount percentage
-                    has_percent_sign = '%' in block_context
-                    percent_position = block_context.find('%') if has_percent_sign else -1
-                    price_position_in_context = block_context.find(price_str)
-                    
-                    # Skip if it's a value < 100 and has % sign nearby
-                    if price_float < 100 and has_percent_sign and percent_position != -1:
-                        # Check if % sign is within reasonable distance
-                        distance_to_percent = abs(percent_position - (price_position_in_context + len(price_str)))
-                        if distance_to_percent < 20:  # % is close to the number
-                            continue  # Skip all small values with % nearby
-                    
-                    # Always skip very small values (likely errors or percentages)
-                    if price_float < 10:
-                        continue
-                    
-                    # Additional check: if value is between 10-100, be more careful
-                    if 10 <= price_float < 100:
-                        # Check context for percentage indicators
-                        context_before = block_context[:price_position_in_context].lower()
-                        if '%' in block_context or any(word in context_before for word in ['rabatt', 'discount', 'reduktion', 'reduction', '-']):
-                            # Skip if it appears near percentage-related keywords
-                            if any(keyword in block_context.lower() for keyword in ['%', 'rabatt', 'discount', '- ']):
-                                continue
-                    
-                    if 10 <= price_float <= 100000:
-                        search_results = page.search_for(price_str)
-                        
-                        for text_rect in search_results:
-                            new_value = price_float / (1 + detected_vat / 100)
-                            new_value = round(new_value, 2)
-                            
-                            # Check for duplicates
-                            duplicate = False
-                            for existing in all_prices:
-                                if (existing[0] == page_num and 
-                                    abs(existing[2].x0 - text_rect.x0) < 5 and 
-                                    abs(existing[2].y0 - text_rect.y0) < 5):
-                                    duplicate = True
-                                    break
-                            
-                            if not duplicate:
-                                all_prices.append((
-                                    page_num,
-                                    (text_rect.x0, text_rect.y1),
-                                    text_rect,
-                                    price_float,
-                                    new_value,
-                                    price_str
-                                ))
-                                
-                                print(f"  Found price: {price_str} ({price_float}) -> {new_value:.2f} (VAT {detected_vat}% removed)")
-                                
-                except (ValueError, AttributeError):
-                    continue
+        print(f"  Found price: {hit.text} ({hit.value}) -> {hit.new_value:.2f} (VAT {detected_vat}% removed)")
     
     return all_prices
 
 
-def process_invoice(pdf_path: Path, output_suffix: str = "_clean", output_style: str = "review"):
+def find_vat_amount(page_text, vat_rules):
     """
-    Process PDF invoice: detect VAT, remove from prices, highlight changes.
+    Detect the VAT amount printed on a page, e.g. "(8,10 % VAT: 240,31)".
     
     Args:
-        pdf_path: Path to PDF invoice
-        output_suffix: Suffix for output filename
-        output_style: Output style - "review" for yellow highlights, "download" for white highlights
-        
+        page_text: PageText of the page
+        vat_rules: VatRules of the detected VAT percentage
+    
     Returns:
-        Path to processed PDF
+        VAT amount as float, or None if the page has none
     """
-    print(f"\n{'='*80}")
-    print(f"Automated VAT Removal System")
-    print(f"{'='*80}\n")
-    
-    # Load PDF
-    print(f"[INFO] Loading PDF: {pdf_path}")
-    doc = pymupdf.open(str(pdf_path))
-    
-    # Extract text and detect VAT
-    full_text = ""
-    for page_num, page in enumerate(doc):
-        full_text += page.get_text()
-    
-    print(f"[INFO] Detecting VAT percentage...")
-    detected_vat = PDFUtils.detect_vat_percentage(full_text)
-    
-    if detected_vat is None:
-        print(f"[ERROR] Could not detect VAT percentage")
-        doc.close()
-        return None
-    
-    print(f"[SUCCESS] Detected VAT: {detected_vat}%")
-    print(f"[INFO] Calculating prices without VAT...")
-    print(f"  Formula: new_price = old_price / (1 + {detected_vat}%)")
-    
-    # Find all prices
-    all_prices = extract_prices_and_positions(doc, detected_vat)
-    
-    print(f"\n[INFO] Found {len(all_prices)} prices to update")
-    
-    if not all_prices:
-        print(f"[WARNING] No prices found to update")
-        doc.close()
-        return None
-    
-    # STEP 1: Find and highlight VAT-related items FIRST (lowest layer)
-    print(f"[INFO] Detecting VAT amount from document...")
-    
-    # Try to detect the actual VAT amount from the document
-    # Look for the last price on the page near VAT label - that's usually the VAT amount
-    vat_amount_rects = []
-    vat_amount_values = []
-    vat_amount_detected = None
+    vat_match = vat_rules.amount.search(page_text.text)
+    if vat_match:
+        vat_amount_str = vat_match.group(1)
+        try:
+            vat_amount_without_thousands = vat_amount_str.replace('.', '')
+            return float(vat_amount_without_thousands.replace(',', '.'))
+        except (ValueError, AttributeError):
+            pass
+    return None
+
+
+def find_vat_label_rect(page, page_text, vat_rules):
+    """
+    Find the VAT label line "(8,10 % VAT: 240,31)" on a page.
     
-    for page_num in range(len(doc)):
-        page = doc[page_num]
-        text = page.get_text()
-        # Look for pattern like "(8,10 % VAT: 240,31)" or "(8.10 % VAT: 240.31)"
-        vat_match = re.search(rf'\({detected_vat}.*?%\s*VAT[:\s]*(\d[\d.,]+)', text, re.IGNORECASE)
-        if vat_match:
-            vat_amount_str = vat_match.group(1)
-            try:
-                vat_amount_without_thousands = vat_amount_str.replace('.', '')
-                vat_amount_detected = float(vat_amount_without_thousands.replace(',', '.'))
-                print(f"  -> Detected VAT amount: {vat_amount_detected}")
-                # Find all occurrences of this value and mark them
-                search_results = page.search_for(vat_amount_str)
-                for rect in search_results:
-                    vat_amount_rects.append((page_num, rect))
-                    vat_amount_values.append(vat_amount_detected)
-                break
-            except (ValueError, AttributeError):
-                pass
+    Args:
+        page: PyMuPDF page
+        page_text: PageText of the page
+        vat_rules: VatRules of the detected VAT percentage
     
-    if vat_amount_detected is None:
-        print(f"  -> Could not detect VAT amount from document")
+    Returns:
+        Highlight rectangle (x0, y0, x1, y1) of the label, or None
+    """
+    # Search for "VAT" text and check nearby context
+    search_results = page.search_for("VAT")
     
-    # Find and highlight the VAT label text "(8,10 % VAT:" FIRST
-    print(f"[INFO] Searching for VAT label to highlight...")
-    for page_num in range(len(doc)):
-        page = doc[page_num]
-        # Search for "VAT" text and check nearby context
-        search_results = page.search_for("VAT")
-        
-        for rect in search_results:
-            # Get a larger area around "VAT" to check for VAT percentage
-            expanded_search_rect = pymupdf.Rect(
-                rect.x0 - 150,  # Expand left to catch the percentage
-                rect.y0 - 10,
-                rect.x1 + 200,  # Expand right significantly to find VAT amount
-                rect.y1 + 10
-            )
-            text_near = page.get_text("text", clip=expanded_search_rect)
+    for rect in search_results:
+        # Get a larger area around "VAT" to check for VAT percentage
+        expanded_search_rect = pymupdf.Rect(
+            rect.x0 - 150,  # Expand left to catch the percentage
+            rect.y0 - 10,
+            rect.x1 + 200,  # Expand right significantly to find VAT amount
+            rect.y1 + 10
+        )
+        text_near = page_text.text_in_rect(expanded_search_rect)
+        
+        # Check if this text contains the VAT pattern like "(8,10 % VAT" or "(8.10 % VAT"
+        if vat_rules.value.search(text_near) and PATTERNS["vat_keyword"].search(text_near):
+            # Use regex to find the complete VAT line pattern to get exact boundaries
+            # Pattern: "(10,00 % VAT: 172,55)" - find this exact text
+            vat_line_match = vat_rules.line.search(text_near)
             
-            # Check if this text contains the VAT pattern like "(8,10 % VAT" or "(8.10 % VAT"
-            if re.search(rf'{detected_vat}', text_near) and re.search(r'VAT', text_near, re.IGNORECASE):
-                # Use regex to find the complete VAT line pattern to get exact boundaries
-                # Pattern: "(10,00 % VAT: 172,55)" - find this exact text
-                vat_line_match = re.search(rf'\([^\s]*{detected_vat}[^\s]*\s*%\s*VAT[:\s]*[\d.,]+\)', text_near, re.IGNORECASE)
-                
-                if vat_line_match:
-                    # Find the exact text positions for the VAT line
-                    vat_line_text = vat_line_match.group(0)
-                    # Search for this exact text to get its position
-                    vat_line_positions = page.search_for(vat_line_text)
-                    if vat_line_positions:
-                        # Use the exact position of the VAT line text
-                        vat_line_rect = vat_line_positions[0]
-                        line_left = vat_line_rect.x0
-                        line_right = vat_line_rect.x1
-                        line_top = vat_line_rect.y0
-                        line_bottom = vat_line_rect.y1
-                    else:
-                        # Fallback: use VAT rect with conservative extension
-                        line_left = rect.x0 - 100  # Opening parenthesis
-                        line_right = rect.x1 + 80  # Conservative: colon + amount + closing parenthesis (~80px)
-                        line_top = rect.y0
-                        line_bottom = rect.y1
+            if vat_line_match:
+                # Find the exact text positions for the VAT line
+                vat_line_text = vat_line_match.group(0)
+                # Search for this exact text to get its position
+                vat_line_positions = page.search_for(vat_line_text)
+                if vat_line_positions:
+                    # Use the exact position of the VAT line text
+                    vat_line_rect = vat_line_positions[0]
+                    line_left = vat_line_rect.x0
+                    line_right = vat_line_rect.x1
+                    line_top = vat_line_rect.y0
+                    line_bottom = vat_line_rect.y1
                 else:
-                    # Fallback: if pattern not found, use conservative approach
-                    # Only extend slightly to right to cover colon and amount
-                    line_left = rect.x0 - 100  # Cover percentage part (opening parenthesis)
-                    line_right = rect.x1 + 80  # Very conservative: only 80px right (colon + short amount + closing parenthesis)
+                    # Fallback: use VAT rect with conservative extension
+                    line_left = rect.x0 - 100  # Opening parenthesis
+                    line_right = rect.x1 + 80  # Conservative: colon + amount + closing parenthesis (~80px)
                     line_top = rect.y0
                     line_bottom = rect.y1
-                
-                # Draw highlight over the VAT label area - only the exact VAT line
-                padding = 2
-                # Extend the highlight to cover VAT line: opening parenthesis, percentage, "VAT:", amount, closing parenthesis
-                expanded_rect = pymupdf.Rect(
-                    line_left - padding,  # Cover the percentage part and opening parenthesis
-                    line_top - padding,
-                    line_right + padding,  # Only covers the VAT line text itself
-                    line_bottom + padding
-                )
-                vat_color = (1, 1, 0.85) if output_style == "review" else (1, 1, 1)
-                page.draw_rect(expanded_rect, color=vat_color, fill=vat_color)
-                print(f"  -> VAT label highlighted on page {page_num + 1} (rect: x={expanded_rect.x0:.1f}-{expanded_rect.x1:.1f}, y={expanded_rect.y0:.1f}-{expanded_rect.y1:.1f})")
-                break  # Only highlight once per page
-    
-    # STEP 2: Apply highlights for VAT amount line
-    print(f"[INFO] Drawing VAT amount highlights (empty boxes)...")
-    
-    # STEP 3: Collect all highlights and text overlays separately
-    highlights = []  # Store yellow rectangles
-    text_overlays = []  # Store text to insert
-    
-    for idx, (page_num, pos, rect, old_value, new_value, orig_str) in enumerate(all_prices):
-        page = doc[page_num]
+            else:
+                # Fallback: if pattern not found, use conservative approach
+                # Only extend slightly to right to cover colon and amount
+                line_left = rect.x0 - 100  # Cover percentage part (opening parenthesis)
+                line_right = rect.x1 + 80  # Very conservative: only 80px right (colon + short amount + closing parenthesis)
+                line_top = rect.y0
+                line_bottom = rect.y1
+            
+            # Highlight only the exact VAT line: opening parenthesis, percentage, "VAT:", amount, closing parenthesis
+            padding = 2
+            return (line_left - padding, line_top - padding, line_right + padding, line_bottom + padding)
+    
+    return None
+
+
+def analyze_page(page, page_text, hits, vat_rules, vat_amount_detected=None, first_index=0, total=None):
+    """
+    Decide the edits for one page: VAT label, price highlights and new price texts.
+    
+    Args:
+        page: PyMuPDF page
+        page_text: PageText of the page
+        hits: PriceHit records found on the page
+        vat_rules: VatRules of the detected VAT percentage
+        vat_amount_detected: VAT amount of the document, if known
+        first_index: Number of prices processed before this page (for progress output)
+        total: Total number of prices in the document, if known (for progress output)
+    
+    Returns:
+        PagePlan with all edits of the page
+    """
+    plan = PagePlan(page.number)
+    
+    # VAT label first - it is drawn on the lowest layer. search_for("VAT") ignores case and
+    # costs a full page search, so pages whose extracted text has no "vat" are skipped
+    label_rect = None
+    if "vat" in page_text.text.lower():
+        label_rect = find_vat_label_rect(page, page_text, vat_rules)
+    if label_rect:
+        plan.label_rects.append(label_rect)
+        print(f"  -> VAT label found on page {page.number + 1} (rect: x={label_rect[0]:.1f}-{label_rect[2]:.1f}, y={label_rect[1]:.1f}-{label_rect[3]:.1f})")
+    
+    padding = 2
+    trailing_pattern = PATTERNS["trailing"]
+    
+    for idx, hit in enumerate(hits, start=first_index + 1):
+        old_value, new_value, orig_str = hit.value, hit.new_value, hit.text
+        rect = hit.rect
+        plan.add_price(old_value)
         
-        print(f"[{idx+1}/{len(all_prices)}] Processing: {orig_str} ({old_value}) -> {new_value:.2f}")
+        progress = f"{idx}/{total}" if total is not None else f"{idx}"
+        print(f"[{progress}] Processing: {orig_str} ({old_value}) -> {new_value:.2f}")
         
         # Check if this is a VAT amount line (highlight only, no new value)
         is_vat_amount_line = False
@@ -531,10 +586,10 @@ def process_invoice(pdf_path: Path, output_suffix: str = "_clean", output_style:
             rect.x1 + 100,
             rect.y1 + 30
         )
-        page_text_near = page.get_text("text", clip=expanded_search_rect)
+        page_text_near = page_text.text_in_rect(expanded_search_rect)
         
         # Check if nearby text contains VAT pattern like "(10.0 % VAT:"
-        if re.search(rf'{detected_vat}.*?%.*?VAT', page_text_near, re.IGNORECASE):
+        if vat_rules.label.search(page_text_near):
             # This price is near a VAT label
             # VAT amounts are typically smaller values (< 500) near the bottom of financial summaries
             # Only flag smaller values as VAT amounts (avoid flagging large totals)
@@ -542,201 +597,771 @@ def process_invoice(pdf_path: Path, output_suffix: str = "_clean", output_style:
                 is_vat_amount_line = True
                 print(f"  -> VAT amount line near VAT label ({old_value}): highlighting only (empty box, no new value)")
         
-        # Also check if this matches any detected VAT amount values
-        if vat_amount_detected is not None:
-            if abs(old_value - vat_amount_detected) < 0.01:
-                is_vat_amount_line = True
-                print(f"  -> VAT amount line ({old_value}): highlighting only (empty box, no new value)")
-            for vat_val in vat_amount_values:
-                if abs(old_value - vat_val) < 0.01:
-                    is_vat_amount_line = True
-                    print(f"  -> VAT amount line ({old_value}): highlighting only (empty box, no new value)")
-                    break
-        
-        # Store highlight
-        padding = 2
+        # Also check if this matches the detected VAT amount
+        if vat_amount_detected is not None and abs(old_value - vat_amount_detected) < 0.01:
+            is_vat_amount_line = True
+            print(f"  -> VAT amount line ({old_value}): highlighting only (empty box, no new value)")
         
         # Check for trailing characters near the price that should be included
         # Look for patterns like ",72)" or other decimal continuation after the price
-        page = doc[page_num]
         expanded_search_rect = pymupdf.Rect(
             rect.x0 - 2,
             rect.y0 - 2,
             rect.x1 + 30,  # Check up to 30px to the right for trailing chars
             rect.y1 + 2
         )
-        nearby_text = page.get_textbox(expanded_search_rect)
-        
-        # If we find text that looks like it should be part of the price (e.g., ",72)")
-        # expand the rectangle to cover it
-        trailing_pattern = r',\d{2}\)|,\d{4}\)'
-        trailing_match = re.search(trailing_pattern, nearby_text)
-        
-        if trailing_match:
-            # Found trailing characters - need to search for the full extent
-            # Use dict extraction to find the exact bbox
-            text_dict = page.get_text("dict")
-            found_extended = False
-            
-            for block in text_dict["blocks"]:
-                if "lines" not in block:
-                    continue
-                for line in block["lines"]:
-                    for span in line["spans"]:
-                        span_rect = pymupdf.Rect(span["bbox"])
-                        # Check if this span is near our price rectangle
-                        if (abs(span_rect.x0 - rect.x1) < 30 and 
-                            abs(span_rect.y0 - rect.y0) < 3):
-                            if re.search(trailing_pattern, span["text"]):
-                                # Found trailing text, extend rectangle to cover it
-                                expanded_rect = pymupdf.Rect(
-                                    rect.x0 - padding,
-                                    rect.y0 - padding,
-                                    span_rect.x1 + padding,
-                                    rect.y1 + padding
-                                )
-                                highlights.append((page_num, expanded_rect))
-                                found_extended = True
-                                print(f"  -> Extended highlight to cover trailing text: {span['text']}")
-                                break
-                        if found_extended:
-                            break
-                    if found_extended:
+        nearby_text = page_text.text_in_rect(expanded_search_rect)
+        
+        # Standard highlight, extended if text like ",72)" continues the price
+        right = rect.x1
+        if trailing_pattern.search(nearby_text):
+            # Use the cached span dicts to find the exact bbox of the trailing text
+            # Only spans starting within 30px right of the price and 3px vertically
+            span_search_rect = pymupdf.Rect(rect.x1 - 30, rect.y0 - 3, rect.x1 + 30, rect.y0 + 3)
+            for span in page_text.spans_in_rect(span_search_rect):
+                span_rect = pymupdf.Rect(span["bbox"])
+                # Check if this span is near our price rectangle
+                if (abs(span_rect.x0 - rect.x1) < 30 and 
+                    abs(span_rect.y0 - rect.y0) < 3):
+                    if trailing_pattern.search(span["text"]):
+                        # Found trailing text, extend rectangle to cover it
+                        right = span_rect.x1
+                        print(f"  -> Extended highlight to cover trailing text: {span['text']}")
                         break
-                if found_extended:
-                    break
-            
-            if not found_extended:
-                # Default highlight
-                expanded_rect = pymupdf.Rect(
-                    rect.x0 - padding,
-                    rect.y0 - padding,
-                    rect.x1 + padding,
-                    rect.y1 + padding
-                )
-                highlights.append((page_num, expanded_rect))
-        else:
-            # Standard highlight
-            expanded_rect = pymupdf.Rect(
-                rect.x0 - padding,
-                rect.y0 - padding,
-                rect.x1 + padding,
-                rect.y1 + padding
-            )
-            highlights.append((page_num, expanded_rect))
+        
+        plan.highlights.append((rect.x0 - padding, rect.y0 - padding, right + padding, rect.y1 + padding))
         
         # Store text overlay (only for non-VAT amounts)
         if not is_vat_amount_line:
             new_price_str = f"{new_value:.2f}".replace('.', ',')
-            adjusted_pos = (pos[0], pos[1] - 1)  # Move text slightly up
-            text_overlays.append((page_num, adjusted_pos, new_price_str))
+            plan.overlays.append((hit.x0, hit.y1 - 1, new_price_str))  # Move text slightly up
     
-    # STEP 4: Draw all highlights first (bottom layer)
-    # Choose color based on output style: yellow for review, white for download
-    highlight_color = (1, 1, 0.85) if output_style == "review" else (1, 1, 1)
+    return plan
+
+
+def add_style_layers(doc):
+    """
+    Create one optional content group (layer) per output style.
     
-    for page_num, expanded_rect in highlights:
-        page = doc[page_num]
-        page.draw_rect(expanded_rect, color=highlight_color, fill=highlight_color)
+    The review layer is visible by default; set_visible_style and
+    switch_layered_pdf change that in the saved file.
     
-    # STEP 5: Insert all text on top (top layer)
-    for page_num, adjusted_pos, new_price_str in text_overlays:
-        page = doc[page_num]
-        point = pymupdf.Point(adjusted_pos[0], adjusted_pos[1])
-        
-        try:
-            page.insert_text(
-                point,
-                new_price_str,
-                fontsize=8.0,
-                fontname="helv",
-                color=(0, 0, 0),
-                render_mode=0
-            )
-        except Exception:
-            page.insert_text(
-                point,
-                new_price_str.replace('€', 'EUR'),
-                fontsize=8.0,
-                fontname="helv",
-                color=(0, 0, 0),
-                render_mode=0
-            )
+    Args:
+        doc: PyMuPDF document
+    
+    Returns:
+        Dictionary: style -> OCG xref
+    """
+    return {style: doc.add_ocg(LAYER_NAMES[style], on=(style == "review")) for style in OUTPUT_STYLES}
+
+
+def set_visible_style(doc, output_style: str):
+    """
+    Show the highlight layer of one style in a "layered" PDF and hide the others.
+    
+    Args:
+        doc: PyMuPDF document rendered with the "layered" style
+        output_style: "review" or "download"
+    """
+    layer_styles = {name: style for style, name in LAYER_NAMES.items()}
+    on, off = [], []
+    for xref, ocg in doc.get_ocgs().items():
+        style = layer_styles.get(ocg["name"])
+        if style == output_style:
+            on.append(xref)
+        elif style is not None:
+            off.append(xref)
+    doc.set_layer(-1, on=on, off=off)
+
+
+def switch_layered_pdf(pdf_path: Path, output_style: str, output_path: Path = None) -> Path:
+    """
+    Flip the visible highlight layer of a saved "layered" PDF.
+    
+    Only the layer configuration changes, so without output_path the file is
+    updated in place with an incremental save.
+    
+    Args:
+        pdf_path: PDF rendered with the "layered" style
+        output_style: Style to show - "review" or "download"
+        output_path: Optional path for a copy with the new default
+    
+    Returns:
+        Path of the updated PDF
+    """
+    doc = pymupdf.open(str(pdf_path))
+    set_visible_style(doc, output_style)
+    if output_path is None:
+        doc.save(str(pdf_path), incremental=True, encryption=pymupdf.PDF_ENCRYPT_KEEP)
+        output_path = pdf_path
+    else:
+        doc.save(str(output_path))
+    doc.close()
+    return output_path
+
+
+def get_style_fills(output_style: str, layers=None):
+    """
+    Highlight fills to draw for an output style.
+    
+    Args:
+        output_style: "review", "download" or "layered"
+        layers: Layer xref per style from add_style_layers ("layered" only)
+    
+    Returns:
+        List of (fill color, OCG xref) - xref 0 draws without a layer
+    """
+    if output_style == "layered":
+        return [(HIGHLIGHT_COLORS[style], oc) for style, oc in layers.items()]
+    return [(HIGHLIGHT_COLORS.get(output_style, HIGHLIGHT_COLORS["download"]), 0)]
+
+
+def draw_page_plan(page, plan, output_style="review", layers=None):
+    """
+    Draw the edits of a PagePlan onto its page.
+    
+    Args:
+        page: PyMuPDF page of the plan
+        plan: PagePlan to draw
+        output_style: "review" for yellow highlights, "download" for white highlights,
+            "layered" for both fills on their own layers
+        layers: Layer xref per style from add_style_layers ("layered" only)
+    """
+    # VAT label and price highlights first (bottom layer) - one Shape per fill,
+    # with touching highlights on the same line merged
+    for highlight_color, oc in get_style_fills(output_style, layers):
+        PDFUtils.highlight_rects(page, plan.label_rects + plan.highlights,
+                                 color=highlight_color, padding=0, oc=oc)
+    
+    # New prices on top (top layer) - shared by all styles, one Shape per page
+    PDFUtils.insert_texts(page, plan.overlays, font_size=8.0, font_family="helv", color=(0, 0, 0))
+
+
+def analyze_pages(doc, text_model, pages, detected_vat, vat_amount_detected=None):
+    """
+    Find the prices on a range of pages and plan their edits.
+    
+    Args:
+        doc: PyMuPDF document
+        text_model: DocumentTextModel of the document
+        pages: Page numbers to analyse, in order
+        detected_vat: Detected VAT percentage
+        vat_amount_detected: VAT amount of the document, if known
+    
+    Returns:
+        List of PagePlan, one per page
+    """
+    vat_rules = PATTERNS.for_vat(detected_vat)
+    hits = extract_prices_and_positions(doc, detected_vat, text_model, pages)
+    
+    hits_by_page = {}
+    for hit in hits:
+        hits_by_page.setdefault(hit.page_num, []).append(hit)
+    
+    plans = []
+    processed = 0
+    for page_num in pages:
+        page_hits = hits_by_page.get(page_num, [])
+        plans.append(analyze_page(doc[page_num], text_model.page(page_num), page_hits, vat_rules,
+                                  vat_amount_detected, processed, len(hits)))
+        processed += len(page_hits)
+    return plans
+
+
+def describe_pdf_source(pdf_source) -> str:
+    """Short description of a PDF path or PDF bytes for log messages."""
+    if isinstance(pdf_source, (bytes, bytearray, memoryview)):
+        return f"<{len(pdf_source)} bytes in memory>"
+    return str(pdf_source)
+
+
+def open_pdf_source(pdf_source):
+    """
+    Open a PDF given as a path or as bytes.
+    
+    Args:
+        pdf_source: Path (or str) of a PDF file, or the PDF as bytes
+    
+    Returns:
+        Opened PyMuPDF document
+    """
+    if isinstance(pdf_source, (bytes, bytearray, memoryview)):
+        return pymupdf.open(stream=pdf_source, filetype="pdf")
+    return pymupdf.open(str(pdf_source))
+
+
+def _analyze_pages_worker(pdf_path, pages, detected_vat, vat_amount_detected):
+    """Worker process: open the PDF file and analyse a range of pages."""
+    doc = open_pdf_source(pdf_path)
+    try:
+        return analyze_pages(doc, DocumentTextModel(doc), pages, detected_vat, vat_amount_detected)
+    finally:
+        doc.close()
+
+
+def analyze_pages_parallel(pdf_source, page_count: int, detected_vat, vat_amount_detected=None,
+                           workers: int = 2):
+    """
+    Analyse all pages in worker processes.
+    
+    Each worker opens the PDF itself and returns compact PagePlans for a
+    contiguous range of pages, so only plain values cross process borders.
+    A PDF held in memory is written to a temporary file once and the workers
+    open that file: a memoryview cannot be pickled, and bytes would be
+    copied to the workers once per chunk.
+    
+    Args:
+        pdf_source: Path to PDF invoice, or the PDF as bytes or memoryview
+        page_count: Number of pages in the document
+        detected_vat: Detected VAT percentage
+        vat_amount_detected: VAT amount of the document, if known
+        workers: Number of worker processes
+    
+    Returns:
+        List of PagePlan in page order
+    """
+    # Several ranges per worker keeps all cores busy when pages differ in cost
+    chunk_size = max(1, -(-page_count // (workers * PARALLEL_CHUNKS_PER_WORKER)))
+    ranges = [list(range(start, min(start + chunk_size, page_count)))
+              for start in range(0, page_count, chunk_size)]
+    
+    temp_path = None
+    if isinstance(pdf_source, (bytes, bytearray, memoryview)):
+        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as temp_file:
+            temp_file.write(pdf_source)
+        temp_path = pdf_source = Path(temp_file.name)
+    
+    print(f"[INFO] Analysing {page_count} pages in {len(ranges)} chunks with {workers} worker processes...")
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_analyze_pages_worker, pdf_source, pages, detected_vat, vat_amount_detected)
+                       for pages in ranges]
+            return [plan for future in futures for plan in future.result()]
+    finally:
+        if temp_path is not None:
+            temp_path.unlink(missing_ok=True)
+
+
+def learn_page_layout(template, page_plans):
+    """
+    Update a layout template from the page analysis of a document.
+    
+    Checks the price columns: if they moved, the layout changed and the
+    template is reset.
+    
+    Args:
+        template: LayoutTemplate of the document
+        page_plans: PagePlan list of the document
+    """
+    highlights = [rect for page_plan in page_plans for rect in page_plan.highlights]
+    if not template.check_price_columns(price_columns(highlights)):
+        print(f"[WARNING] Price columns of layout {template.fingerprint} moved - relearning template")
+
+
+def find_invoice_total(text):
+    """
+    Find the invoice total ("Total Value:", "Sum-Gross-Value:", ...) in text.
+    
+    Reason: Summing all prices counts duplicates and includes VAT amounts.
+    Patterns are tried in priority order to avoid matching VAT lines.
+    
+    Args:
+        text: Document text
     
-    # Save with style suffix
-    style_suffix = "_review" if output_style == "review" else "_download"
-    output_path = pdf_path.parent / f"{pdf_path.stem}{output_suffix}{style_suffix}.pdf"
-    print(f"\n[INFO] Saving {output_style} version to: {output_path}")
-    
-    # Calculate extended metadata
-    # Extract country code
-    country_code = PDFUtils.detect_country_code(full_text)
-    
-    # Add importer info box based on country code
-    if country_code:
-        print(f"\n[INFO] Detected country code: {country_code}")
-        add_importer_info_box(doc, country_code, output_style)
-    
-    # Calculate totals - find the actual "Total Value" from PDF text
-    # Reason: Summing all prices counts duplicates and includes VAT amounts
-    prior_total = None
-    corrected_total = None
-    
-    # Look for "Total Value:" or similar patterns in the text
-    # Priority: patterns that avoid VAT amounts
-    # We need to match the line structure carefully to avoid matching VAT lines
-    total_patterns = [
-        r'Sum-Gross-Value\s*:\s*(\d{1,3}(?:\.\d{3})*,\d{2})',  # Sum-Gross-Value (most reliable, matches 1.540,00)
-        r'Total\s+Value\s*:\s*(\d{1,3}(?:\.\d{3})*,\d{2})\s*\n',  # Total Value followed by newline (not followed by VAT line)
-        r'Total\s+Qty\.\s*:\s*\d+[\s\S]*?Total\s+Value\s*:\s*(\d{1,3}(?:\.\d{3})*,\d{2})',  # Match in context
-        r'SUM-Net-Value[:\s]+(\d{1,3}(?:\.\d{3})*,\d{2})',  # Most specific
-        r'Betrag[:\s]+(\d{1,3}(?:\.\d{3})*,\d{2})(?!\s*(?:%|MwSt|VAT))',  # German total not followed by VAT
-        r'Gesamt[:\s]+(\d{1,3}(?:\.\d{3})*,\d{2})(?!\s*(?:%|MwSt|VAT))'  # German alternative
-    ]
-    
-    for pattern in total_patterns:
-        match = re.search(pattern, full_text, re.IGNORECASE)
+    Returns:
+        Total as float, or None if not found
+    """
+    for pattern in PATTERNS.group("total."):
+        match = pattern.search(text)
         if match:
             total_str = match.group(1)
             try:
                 # Convert format "1.540,00" to float 1540.0
-                prior_total = float(total_str.replace('.', '').replace(',', '.'))
-                print(f"[INFO] Found invoice total in text: {prior_total}")
-                break
+                return float(total_str.replace('.', '').replace(',', '.'))
             except (ValueError, AttributeError):
                 continue
+    return None
+
+
+def set_invoice_totals(plan, prior_total, max_price):
+    """
+    Store the invoice total and the total without VAT in a plan.
     
-    # If we couldn't find the total, use max unique price as fallback
-    if prior_total is None:
-        unique_original_values = set([price_info[3] for price_info in all_prices])
-        prior_total = max(unique_original_values) if unique_original_values else 0
+    Args:
+        plan: InvoicePlan to update
+        prior_total: Total found in the invoice text, or None
+        max_price: Largest price found, used when no total was found
+    """
+    if prior_total is not None:
+        print(f"[INFO] Found invoice total in text: {prior_total}")
+    else:
+        # If we couldn't find the total, use max unique price as fallback
+        prior_total = max_price
         print(f"[INFO] Using max price as fallback: {prior_total}")
+    plan.prior_total = prior_total
     
     # Calculate corrected total by removing VAT from prior total
-    if prior_total and detected_vat:
+    if prior_total and plan.detected_vat:
         # Formula: corrected = prior / (1 + vat_percentage/100)
-        corrected_total = prior_total / (1 + detected_vat / 100)
-        print(f"[INFO] Calculated corrected total: {corrected_total:.2f}")
+        plan.corrected_total = prior_total / (1 + plan.detected_vat / 100)
+        print(f"[INFO] Calculated corrected total: {plan.corrected_total:.2f}")
+    else:
+        plan.corrected_total = prior_total if prior_total else 0
+
+
+def get_output_styles(output_style: str):
+    """Styles to render for an output_style argument ("both" = review and download)."""
+    return list(OUTPUT_STYLES) if output_style == "both" else [output_style]
+
+
+def get_output_path(pdf_path: Path, output_suffix: str, output_style: str) -> Path:
+    """Output file path with style suffix, next to the input PDF."""
+    if output_style == "review":
+        style_suffix = "_review"
+    elif output_style == "layered":
+        style_suffix = "_layered"
     else:
-        corrected_total = prior_total if prior_total else 0
+        style_suffix = "_download"
+    return pdf_path.parent / f"{pdf_path.stem}{output_suffix}{style_suffix}.pdf"
+
+
+def analyze_invoice(pdf_path, workers: int = 1, doc=None, templates=LAYOUT_TEMPLATES):
+    """
+    Analyse a PDF invoice without changing it.
     
-    # Save PDF
-    doc.save(str(output_path))
-    doc.close()
+    Detects VAT, prices, the VAT amount, country and totals and decides every
+    highlight and new price text. The result is a serializable plan that
+    render_plan draws in any output style.
+    
+    Args:
+        pdf_path: Path to PDF invoice, or the PDF as bytes
+        workers: Number of processes for the page analysis (1 = analyse in this process)
+        doc: Optional already opened document of pdf_path
+        templates: TemplateStore of known layouts (None = do not track layouts);
+            saved to its file when a template was learned or changed
+    
+    Returns:
+        InvoicePlan, or None if no VAT or no prices were found
+    """
+    own_doc = doc is None
+    if own_doc:
+        print(f"[INFO] Loading PDF: {describe_pdf_source(pdf_path)}")
+        doc = open_pdf_source(pdf_path)
+    
+    try:
+        # Shared text model - each page is extracted once and reused by all steps
+        text_model = DocumentTextModel(doc)
+        
+        # Detect VAT - pages are extracted lazily until the detector has an answer
+        print(f"[INFO] Detecting VAT percentage...")
+        detected_vat = PDFUtils.detect_vat_percentage(text_model.iter_page_texts())
+        
+        if detected_vat is None:
+            print(f"[ERROR] Could not detect VAT percentage")
+            return None
+        
+        print(f"[SUCCESS] Detected VAT: {detected_vat}%")
+        plan = InvoicePlan(detected_vat, len(doc))
+        
+        # Layout template - what earlier invoices of the same layout looked like
+        template = None
+        if templates is not None:
+            template = templates.get(layout_fingerprint(text_model.page(0)))
+            known_anchors = template.anchors()
+            if template.learned:
+                print(f"[INFO] Known layout {template.fingerprint} (used {template.uses}x)")
+            else:
+                print(f"[INFO] New layout {template.fingerprint}")
+        
+        # Patterns built from the detected VAT are compiled once per document
+        vat_rules = PATTERNS.for_vat(detected_vat)
+        print(f"[INFO] Calculating prices without VAT...")
+        print(f"  Formula: new_price = old_price / (1 + {detected_vat}%)")
+        
+        # Full document text for total and country detection
+        full_text = text_model.full_text
+        
+        # STEP 1: Detect the actual VAT amount from the document (first page that prints it)
+        print(f"[INFO] Detecting VAT amount from document...")
+        for page_num in range(len(doc)):
+            plan.vat_amount = find_vat_amount(text_model.page(page_num), vat_rules)
+            if plan.vat_amount is not None:
+                print(f"  -> Detected VAT amount: {plan.vat_amount}")
+                break
+        
+        if plan.vat_amount is None:
+            print(f"  -> Could not detect VAT amount from document")
+        
+        # STEP 2: Find all prices and decide the VAT label highlight, price highlights
+        # and new texts per page
+        if workers > 1 and len(doc) > 1:
+            plan.pages = analyze_pages_parallel(pdf_path, len(doc), detected_vat, plan.vat_amount, workers)
+        else:
+            plan.pages = analyze_pages(doc, text_model, range(len(doc)), detected_vat, plan.vat_amount)
+        plan.prices_count = sum(page_plan.price_count for page_plan in plan.pages)
+        
+        print(f"\n[INFO] Found {plan.prices_count} prices to update")
+        
+        if not plan.prices_count:
+            print(f"[WARNING] No prices found to update")
+            return None
+        
+        if template is not None:
+            learn_page_layout(template, plan.pages)
+        
+        # STEP 3: Country code and importer box
+        plan.country_code = PDFUtils.detect_country_code(full_text)
+        if plan.country_code:
+            print(f"\n[INFO] Detected country code: {plan.country_code}")
+            plan.country_name = PDFUtils.get_country_name(plan.country_code)
+            plan.importer_box = plan_importer_box(doc, plan.country_code, text_model)
+        
+        # STEP 4: Totals - find the actual "Total Value" from PDF text
+        max_price = max(page_plan.max_price for page_plan in plan.pages if page_plan.max_price is not None)
+        set_invoice_totals(plan, find_invoice_total(full_text), max_price)
+        
+        if template is not None:
+            template.uses += 1
+            if templates.path is not None and template.anchors() != known_anchors:
+                templates.save()
+        return plan
+    finally:
+        if own_doc:
+            doc.close()
+
+
+def render_plan(doc, plan, output_style: str = "review"):
+    """
+    Draw an InvoicePlan onto a document - no analysis is done here.
+    
+    Args:
+        doc: PyMuPDF document the plan was made for
+        plan: InvoicePlan from analyze_invoice
+        output_style: Output style - "review" for yellow highlights, "download" for white highlights,
+            "layered" for both fills on switchable layers in one file
+    """
+    layers = add_style_layers(doc) if output_style == "layered" else None
+    
+    # Highlights (bottom layer) and new prices (top layer) per page
+    for page_plan in plan.pages:
+        draw_page_plan(doc[page_plan.page_num], page_plan, output_style, layers)
+    
+    # Importer info box on the first page
+    if plan.importer_box:
+        draw_importer_box(doc[0], plan.importer_box, output_style, layers)
+
+
+def get_memory_usage():
+    """
+    Resident memory of this process.
+    
+    Returns:
+        Dictionary with 'rss' (all resident bytes) and 'file' (resident bytes
+        backed by files, e.g. memory-mapped input, which the kernel can drop
+        and shares between processes), or None where /proc is not available
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            fields = f.read().split()
+    except OSError:
+        return None
+    page_size = mmap.PAGESIZE
+    return {'rss': int(fields[1]) * page_size, 'file': int(fields[2]) * page_size}
+
+
+def report_memory_usage(before, label: str = "processing"):
+    """
+    Print the change in resident memory since a get_memory_usage snapshot.
+    
+    Args:
+        before: Snapshot from get_memory_usage (nothing is printed if None)
+        label: What was measured
+    """
+    after = get_memory_usage()
+    if before is None or after is None:
+        return
+    mb = 1024 * 1024
+    rss_delta = (after['rss'] - before['rss']) / mb
+    file_delta = (after['file'] - before['file']) / mb
+    print(f"[INFO] Resident memory ({label}): {before['rss'] / mb:.1f} MB -> {after['rss'] / mb:.1f} MB "
+          f"({rss_delta:+.1f} MB, file-backed {file_delta:+.1f} MB, private {rss_delta - file_delta:+.1f} MB)")
+
+
+def render_styles(pdf_source, plan, output_style: str = "review", doc=None):
+    """
+    Render a plan in every style requested by an output style.
+    
+    Every style is drawn on an unmodified copy of the input; each document
+    is closed once the caller moves on to the next style.
+    
+    Args:
+        pdf_source: Original PDF - path, or the PDF as bytes
+        plan: InvoicePlan from analyze_invoice
+        output_style: "review", "download", "both" or "layered"
+        doc: Optional unmodified document opened from pdf_source, used for the first style
+    
+    Yields:
+        (style, rendered document) tuples
+    """
+    for style in get_output_styles(output_style):
+        if doc is None:
+            doc = open_pdf_source(pdf_source)
+        try:
+            render_plan(doc, plan, style)
+            yield style, doc
+        finally:
+            doc.close()
+            doc = None
+
+
+def process_invoice_bytes(pdf_bytes: bytes, output_style: str = "review", workers: int = 1):
+    """
+    Process a PDF invoice held in memory - nothing is read from or written to disk.
+    
+    Args:
+        pdf_bytes: PDF invoice as bytes, or a memoryview such as PDFUtils.map_pdf returns
+        output_style: Output style - "review", "download", "both" or "layered"
+            (see process_invoice)
+        workers: Number of processes for the page analysis (1 = analyse in this process)
+    
+    Returns:
+        Dictionary with the metadata of process_invoice, or None if nothing
+        was changed. 'output_bytes' maps each rendered style to its PDF;
+        'output_paths' is empty.
+    """
+    print(f"\n{'='*80}")
+    print(f"Automated VAT Removal System")
+    print(f"{'='*80}\n")
+    
+    memory_before = get_memory_usage()
+    print(f"[INFO] Loading PDF: {describe_pdf_source(pdf_bytes)}")
+    doc = pymupdf.open(stream=pdf_bytes, filetype="pdf")
+    
+    plan = analyze_invoice(pdf_bytes, workers, doc)
+    if plan is None:
+        doc.close()
+        return None
+    
+    output_bytes = {}
+    for style, rendered in render_styles(pdf_bytes, plan, output_style, doc):
+        output_bytes[style] = rendered.tobytes()
+        print(f"[INFO] Rendered {style} version ({len(output_bytes[style])} bytes)")
+    
+    print(f"[SUCCESS] VAT removal complete!")
+    report_memory_usage(memory_before, "mapped input" if isinstance(pdf_bytes, memoryview) else "input in memory")
+    
+    result = plan.result()
+    result['output_bytes'] = output_bytes
+    return result
+
+
+def process_invoice_mapped(pdf_path, output_style: str = "review", workers: int = 1):
+    """
+    Process a PDF file like process_invoice_bytes, memory-mapping instead of reading it.
+    
+    Used by worker processes for large uploads, which are handed over as a
+    file instead of being copied into the call.
+    
+    Args:
+        pdf_path: Path to PDF invoice
+        output_style: Output style (see process_invoice_bytes)
+        workers: Number of processes for the page analysis
+    
+    Returns:
+        Result of process_invoice_bytes
+    """
+    return process_invoice_bytes(PDFUtils.map_pdf(pdf_path), output_style, workers)
+
+
+def process_invoice(pdf_path: Path, output_suffix: str = "_clean", output_style: str = "review",
+                    streaming: bool = False, workers: int = 1, use_mmap: bool = False):
+    """
+    Process PDF invoice: detect VAT, remove from prices, highlight changes.
+    
+    Args:
+        pdf_path: Path to PDF invoice
+        output_suffix: Suffix for output filename
+        output_style: Output style - "review" for yellow highlights, "download" for white highlights,
+            "both" for both files from a single load and analysis, "layered" for one
+            file with both highlight fills on switchable layers (review visible)
+        streaming: Process one page at a time with flat memory use (for very large PDFs)
+        workers: Number of processes for the page analysis (1 = analyse in this process)
+        use_mmap: Memory-map the input instead of reading it into memory (large PDFs)
+        
+    Returns:
+        Dictionary with extended metadata, or None if nothing was changed.
+        'output_paths' maps each rendered style to its file; 'output_path'
+        is the first of them.
+    """
+    if streaming:
+        return process_invoice_streaming(pdf_path, output_suffix, output_style)
+    
+    print(f"\n{'='*80}")
+    print(f"Automated VAT Removal System")
+    print(f"{'='*80}\n")
+    
+    # Load PDF - MuPDF reads the file itself; a second style reopens it from the
+    # path (or the mapping) instead of keeping a copy of the input in memory
+    memory_before = get_memory_usage()
+    if use_mmap:
+        print(f"[INFO] Memory-mapping PDF: {pdf_path}")
+        pdf_source = PDFUtils.map_pdf(pdf_path)
+    else:
+        print(f"[INFO] Loading PDF: {pdf_path}")
+        pdf_source = Path(pdf_path)
+    doc = open_pdf_source(pdf_source)
+    
+    plan = analyze_invoice(pdf_path, workers, doc)
+    if plan is None:
+        doc.close()
+        return None
+    
+    output_paths = {}
+    for style, rendered in render_styles(pdf_source, plan, output_style, doc):
+        # Save with style suffix
+        output_path = get_output_path(pdf_path, output_suffix, style)
+        print(f"\n[INFO] Saving {style} version to: {output_path}")
+        rendered.save(str(output_path))
+        output_paths[style] = output_path
     
     print(f"[SUCCESS] VAT removal complete!")
-    print(f"[SUCCESS] Output: {output_path}")
+    for output_path in output_paths.values():
+        print(f"[SUCCESS] Output: {output_path}")
+    report_memory_usage(memory_before, "mapped input" if use_mmap else "input opened by path")
     
     # Return extended metadata
-    return {
-        'output_path': output_path,
-        'detected_vat': detected_vat,
-        'country_code': country_code,
-        'country_name': PDFUtils.get_country_name(country_code) if country_code else None,
-        'prior_total': prior_total,
-        'corrected_total': corrected_total,
-        'prices_count': len(all_prices)
-    }
+    return plan.result(output_paths)
+
+
+def process_invoice_streaming(pdf_path: Path, output_suffix: str = "_clean", output_style: str = "review"):
+    """
+    Process a PDF invoice one page at a time.
+    
+    Each page is extracted, analysed, drawn and released before the next one
+    is touched, so memory use stays flat for documents with hundreds of pages.
+    Totals and the country code are tracked incrementally.
+    
+    Differences to the default mode: the VAT amount is only known from the
+    current and earlier pages, and text spanning more than two pages is not
+    matched as a total.
+    
+    Args:
+        pdf_path: Path to PDF invoice
+        output_suffix: Suffix for output filename
+        output_style: Output style - "review" for yellow highlights, "download" for white highlights,
+            "both" to draw every page into two output documents
+        
+    Returns:
+        Dictionary with extended metadata, or None if nothing was changed
+    """
+    print(f"\n{'='*80}")
+    print(f"Automated VAT Removal System (streaming)")
+    print(f"{'='*80}\n")
+    
+    print(f"[INFO] Loading PDF: {pdf_path}")
+    doc = pymupdf.open(str(pdf_path))
+    
+    # Detect VAT from the first pages that contain it - page texts are not kept
+    print(f"[INFO] Detecting VAT percentage...")
+    detected_vat = PDFUtils.detect_vat_percentage(page.get_text() for page in doc)
+    
+    if detected_vat is None:
+        print(f"[ERROR] Could not detect VAT percentage")
+        doc.close()
+        return None
+    
+    print(f"[SUCCESS] Detected VAT: {detected_vat}%")
+    plan = InvoicePlan(detected_vat, len(doc))
+    vat_rules = PATTERNS.for_vat(detected_vat)
+    print(f"[INFO] Calculating prices without VAT...")
+    print(f"  Formula: new_price = old_price / (1 + {detected_vat}%)")
+    
+    # One output document per style - the first one is also analysed
+    styles = get_output_styles(output_style)
+    outputs = {style: doc if i == 0 else pymupdf.open(str(pdf_path)) for i, style in enumerate(styles)}
+    layers = {style: add_style_layers(output_doc) if style == "layered" else None
+              for style, output_doc in outputs.items()}
+    
+    text_model = DocumentTextModel(doc)
+    country_rules = PATTERNS.group("country.")
+    total_rules = PATTERNS.group("total.")
+    
+    # Incremental document state
+    country_matches = [None] * len(country_rules)  # First 2-letter code per rule
+    total_matches = [None] * len(total_rules)      # First total per rule
+    previous_text = ""                             # Totals may continue from the last page
+    max_price = None
+    
+    for page_num in range(len(doc)):
+        page = doc[page_num]
+        page_text = text_model.page(page_num)
+        text = page_text.text
+        
+        if plan.vat_amount is None:
+            plan.vat_amount = find_vat_amount(page_text, vat_rules)
+            if plan.vat_amount is not None:
+                print(f"  -> Detected VAT amount: {plan.vat_amount}")
+        
+        for i, rule in enumerate(country_rules):
+            if country_matches[i] is None:
+                country_matches[i] = next(
+                    (m.group(1) for m in rule.finditer(text) if len(m.group(1)) == 2), None)
+        
+        for i, rule in enumerate(total_rules):
+            if total_matches[i] is None:
+                match = rule.search(previous_text + text)
+                if match:
+                    try:
+                        total_matches[i] = float(match.group(1).replace('.', '').replace(',', '.'))
+                    except (ValueError, AttributeError):
+                        pass
+        
+        page_plan = analyze_pages(doc, text_model, [page_num], detected_vat, plan.vat_amount)[0]
+        for style, output_doc in outputs.items():
+            draw_page_plan(output_doc[page_num], page_plan, style, layers[style])
+        
+        plan.prices_count += page_plan.price_count
+        if page_plan.max_price is not None and (max_price is None or page_plan.max_price > max_price):
+            max_price = page_plan.max_price
+        
+        # Release the page's data before moving on
+        previous_text = text
+        text_model.release(page_num)
+        del page, page_text, page_plan
+    
+    print(f"\n[INFO] Found {plan.prices_count} prices to update")
+    
+    if not plan.prices_count:
+        print(f"[WARNING] No prices found to update")
+        for output_doc in outputs.values():
+            output_doc.close()
+        return None
+    
+    plan.country_code = next((code for code in country_matches if code), None)
+    if plan.country_code:
+        print(f"\n[INFO] Detected country code: {plan.country_code}")
+        plan.country_name = PDFUtils.get_country_name(plan.country_code)
+        plan.importer_box = plan_importer_box(doc, plan.country_code, text_model)
+        if plan.importer_box:
+            for style, output_doc in outputs.items():
+                draw_importer_box(output_doc[0], plan.importer_box, style, layers[style])
+    
+    prior_total = next((total for total in total_matches if total is not None), None)
+    set_invoice_totals(plan, prior_total, max_price)
+    
+    output_paths = {}
+    for style, output_doc in outputs.items():
+        output_path = get_output_path(pdf_path, output_suffix, style)
+        print(f"\n[INFO] Saving {style} version to: {output_path}")
+        output_doc.save(str(output_path))
+        output_doc.close()
+        output_paths[style] = output_path
+    
+    print(f"[SUCCESS] VAT removal complete!")
+    for output_path in output_paths.values():
+        print(f"[SUCCESS] Output: {output_path}")
+    
+    return plan.result(output_paths)
 
 
 def print_usage():
@@ -746,15 +1371,20 @@ def print_usage():
     print("\nDetects VAT percentage, finds product prices, removes VAT,")
     print("and highlights changes with rectangles.")
     print("\nUsage:")
-    print("  python -m src.main <pdf_file> [output_suffix] [style]")
+    print("  python -m src.main <pdf_file> [output_suffix] [style] [--streaming] [--workers=N] [--mmap]")
     print("\nArguments:")
     print("  pdf_file      Path to PDF invoice")
     print("  output_suffix Suffix for output (default: '_clean')")
-    print("  style         Output style: 'review' (yellow) or 'download' (white) (default: 'review')")
+    print("  style         Output style: 'review' (yellow), 'download' (white), 'both' or")
+    print("                'layered' (one file, highlights on switchable layers) (default: 'review')")
+    print("  --streaming   Process one page at a time (flat memory for very large PDFs)")
+    print("  --workers=N   Analyse pages in N processes (large multi-page invoices)")
+    print("  --mmap        Memory-map the input instead of reading it (very large PDFs)")
     print("\nExample:")
     print("  python -m src.main project/examples/example_1.PDF")
     print("  python -m src.main invoice.pdf _corrected review")
     print("  python -m src.main invoice.pdf _corrected download")
+    print("  python -m src.main invoice.pdf _corrected both")
     print("\nWhat it does:")
     print("  1. Detect VAT percentage automatically")
     print("  2. Find all product prices in PDF")
@@ -765,17 +1395,25 @@ def print_usage():
 
 def main():
     """Main entry point."""
-    if len(sys.argv) < 2:
+    streaming = "--streaming" in sys.argv
+    use_mmap = "--mmap" in sys.argv
+    workers = 1
+    for arg in sys.argv[1:]:
+        if arg.startswith("--workers="):
+            workers = int(arg.split("=", 1)[1])
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    
+    if len(args) < 1:
         print_usage()
         sys.exit(1)
     
-    pdf_path = Path(sys.argv[1])
-    output_suffix = sys.argv[2] if len(sys.argv) > 2 else "_clean"
-    output_style = sys.argv[3] if len(sys.argv) > 3 else "review"
+    pdf_path = Path(args[0])
+    output_suffix = args[1] if len(args) > 1 else "_clean"
+    output_style = args[2] if len(args) > 2 else "review"
     
     # Validate style parameter
-    if output_style not in ["review", "download"]:
-        print(f"[ERROR] Invalid style '{output_style}'. Must be 'review' or 'download'")
+    if output_style not in ["review", "download", "both", "layered"]:
+        print(f"[ERROR] Invalid style '{output_style}'. Must be 'review', 'download', 'both' or 'layered'")
         sys.exit(1)
     
     if not pdf_path.exists():
@@ -783,7 +1421,10 @@ def main():
         sys.exit(1)
     
     try:
-        result = process_invoice(pdf_path, output_suffix, output_style)
+        result = process_invoice(pdf_path, output_suffix, output_style,
+                                 streaming=streaming, workers=workers, use_mmap=use_mmap)
+        
+        print(f"\n[INFO] Pattern statistics:\n{PATTERNS.report()}")
         
         if result and result.get('output_path'):
             print(f"\n[SUCCESS] File created: {result['output_path']}")
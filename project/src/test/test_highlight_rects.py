@@ -0,0 +1,48 @@
+"""
+Tests for batched highlight drawing
+"""
+
+import sys
+from pathlib import Path
+import pymupdf
+import pytest
+
+# Add core directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "docs" / "core"))
+
+from utils import PDFUtils
+
+
+def test_merge_rects_joins_touching_rects_on_one_line():
+    rects = [
+        (0, 10, 20, 20),
+        (20.5, 10, 40, 20),     # touches the first one
+        (60, 10, 80, 20),       # same line, too far away
+        (0, 30, 20, 40),        # next line
+        (10, 30.2, 30, 40.2),   # overlaps the previous one
+    ]
+
+    merged = PDFUtils.merge_rects(rects)
+
+    assert merged == [(0, 10, 40, 20), (60, 10, 80, 20), (0, 30, 30, 40.2)]
+
+
+def test_merge_rects_keeps_lines_apart():
+    rects = [(0, 0, 10, 10), (0, 10, 10, 20), (5, 0, 15, 10)]
+
+    assert PDFUtils.merge_rects(rects) == [(0, 0, 15, 10), (0, 10, 10, 20)]
+
+
+def test_highlight_rects_draws_one_path_per_page():
+    doc = pymupdf.open()
+    page = doc.new_page()
+
+    drawn = PDFUtils.highlight_rects(page, [pymupdf.Rect(50, 50, 80, 60), (82, 50, 100, 60),
+                                            (50, 100, 80, 110)])
+    drawings = page.get_drawings()
+
+    assert drawn == 2
+    assert len(drawings) == 1
+    assert len(drawings[0]["items"]) == 2
+    assert drawings[0]["fill"] == pytest.approx(PDFUtils.DEFAULT_HIGHLIGHT_COLOR)
+    doc.close()
@@ -0,0 +1,206 @@
+"""
+Tests for per-page edit plans and the streaming processing mode
+"""
+
+import io
+import contextlib
+import pickle
+import shutil
+import sys
+import pytest
+from pathlib import Path
+
+# Add src and core directories to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "docs" / "core"))
+
+from invoice_plan import PagePlan
+
+EXAMPLES_DIR = Path(__file__).parent.parent.parent / "examples"
+
+
+def test_page_plan_round_trip():
+    plan = PagePlan(2)
+    plan.label_rects.append((1.0, 2.0, 3.0, 4.0))
+    plan.highlights.append((10.0, 20.0, 30.0, 40.0))
+    plan.overlays.append((10.0, 39.0, "100,00"))
+    plan.add_price(108.1)
+    plan.add_price(54.05)
+
+    restored = PagePlan.from_dict(plan.to_dict())
+    unpickled = pickle.loads(pickle.dumps(plan))
+
+    for other in (restored, unpickled):
+        assert other.page_num == 2
+        assert other.highlights == plan.highlights
+        assert other.overlays == plan.overlays
+        assert other.price_count == 2
+        assert other.max_price == 108.1
+
+
+def test_streaming_matches_default_mode(tmp_path):
+    import main
+
+    pdf_path = tmp_path / "example_2.PDF"
+    shutil.copy(EXAMPLES_DIR / "example_2.PDF", pdf_path)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        default = main.process_invoice(pdf_path, "_a", "review")
+        streaming = main.process_invoice(pdf_path, "_b", "review", streaming=True)
+
+    for key in ("detected_vat", "country_code", "prior_total", "corrected_total", "prices_count"):
+        assert streaming[key] == default[key]
+    assert streaming["output_path"].exists()
+
+
+def test_parallel_analysis_matches_serial():
+    import pymupdf
+    import main
+
+    pdf_path = EXAMPLES_DIR / "example_2.PDF"
+    doc = pymupdf.open(str(pdf_path))
+    page_count = len(doc)
+    with contextlib.redirect_stdout(io.StringIO()):
+        serial = main.analyze_pages(doc, main.DocumentTextModel(doc), range(page_count), 8.1)
+        parallel = main.analyze_pages_parallel(pdf_path, page_count, 8.1, workers=2)
+        mapped = main.analyze_pages_parallel(main.PDFUtils.map_pdf(pdf_path), page_count, 8.1, workers=2)
+    doc.close()
+
+    assert [p.to_dict() for p in parallel] == [p.to_dict() for p in serial]
+    assert [p.to_dict() for p in mapped] == [p.to_dict() for p in serial]
+
+
+def test_analyze_once_render_from_serialized_plan():
+    import json
+    import pymupdf
+    import main
+    from invoice_plan import InvoicePlan
+
+    pdf_path = EXAMPLES_DIR / "example_1.PDF"
+    with contextlib.redirect_stdout(io.StringIO()):
+        plan = main.analyze_invoice(pdf_path)
+
+    assert plan.detected_vat == 8.1
+    assert plan.country_code == "CH"
+    assert plan.importer_box is not None
+
+    restored = InvoicePlan.from_dict(json.loads(json.dumps(plan.to_dict())))
+    assert restored.to_dict() == plan.to_dict()
+    assert restored.result()["prices_count"] == plan.prices_count
+
+    doc = pymupdf.open(str(pdf_path))
+    main.render_plan(doc, restored, "download")
+    rendered = "".join(page.get_text() for page in doc)
+    doc.close()
+
+    overlays = [text for page in plan.pages for _, _, text in page.overlays]
+    assert overlays and all(text in rendered for text in overlays)
+    assert plan.importer_box["importer"] in rendered
+
+
+def _page_content(path):
+    import pymupdf
+    doc = pymupdf.open(stream=path) if isinstance(path, bytes) else pymupdf.open(str(path))
+    content = [(page.get_text(), [d["fill"] for d in page.get_drawings()]) for page in doc]
+    doc.close()
+    return content
+
+
+def test_both_styles_match_single_runs(tmp_path):
+    import main
+
+    for streaming in (False, True):
+        pdf_path = tmp_path / f"example_3_{streaming}.PDF"
+        shutil.copy(EXAMPLES_DIR / "example_3.PDF", pdf_path)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            both = main.process_invoice(pdf_path, "_both", "both", streaming=streaming)
+            review = main.process_invoice(pdf_path, "_one", "review", streaming=streaming)
+            download = main.process_invoice(pdf_path, "_one", "download", streaming=streaming)
+
+        assert set(both["output_paths"]) == {"review", "download"}
+        assert both["output_path"] == both["output_paths"]["review"]
+        assert both["prices_count"] == review["prices_count"]
+        assert _page_content(both["output_paths"]["review"]) == _page_content(review["output_path"])
+        assert _page_content(both["output_paths"]["download"]) == _page_content(download["output_path"])
+
+
+def test_layered_output_switches_between_styles(tmp_path):
+    import pymupdf
+    import main
+
+    pdf_path = tmp_path / "example_1.PDF"
+    shutil.copy(EXAMPLES_DIR / "example_1.PDF", pdf_path)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        both = main.process_invoice(pdf_path, "_both", "both")
+        layered = main.process_invoice(pdf_path, "_one", "layered")
+
+    def first_page_pixels(path):
+        doc = pymupdf.open(str(path))
+        samples = doc[0].get_pixmap(dpi=40).samples
+        doc.close()
+        return samples
+
+    layered_path = layered["output_path"]
+    assert layered_path.name.endswith("_layered.pdf")
+    assert first_page_pixels(layered_path) == first_page_pixels(both["output_paths"]["review"])
+
+    main.switch_layered_pdf(layered_path, "download")
+    assert first_page_pixels(layered_path) == first_page_pixels(both["output_paths"]["download"])
+
+    main.switch_layered_pdf(layered_path, "review")
+    assert first_page_pixels(layered_path) == first_page_pixels(both["output_paths"]["review"])
+
+
+def test_importer_box_stamp_is_rendered_once():
+    import pymupdf
+    import main
+
+    box = {'x': 40.0, 'y': 100.0, 'width': 290, 'height': 50,
+           'importer': 'Test Importer GmbH', 'vat_number': 'CHE-000.000.000'}
+    docs = [pymupdf.open() for _ in range(2)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        for doc in docs:
+            doc.new_page()
+            main.draw_importer_box(doc[0], box, "review")
+
+    keys = [key for key in main.IMPORTER_STAMPS if key[0] == 'Test Importer GmbH']
+    assert keys == [('Test Importer GmbH', 'CHE-000.000.000', 290, 50, "review")]
+    for doc in docs:
+        page = doc[0]
+        assert page.get_xobjects()  # Placed as a Form XObject
+        assert page.search_for("Test Importer GmbH")[0].x0 == pytest.approx(50.0, abs=1)
+        doc.close()
+
+
+def test_bytes_api_matches_file_api(tmp_path):
+    import main
+
+    pdf_path = tmp_path / "example_1.pdf"
+    shutil.copy(EXAMPLES_DIR / "example_1.PDF", pdf_path)
+    with contextlib.redirect_stdout(io.StringIO()):
+        from_file = main.process_invoice(pdf_path, "_file", "both")
+        from_bytes = main.process_invoice_bytes(pdf_path.read_bytes(), "both")
+
+    assert from_bytes['output_paths'] == {} and from_bytes['output_path'] is None
+    assert sorted(tmp_path.iterdir()) == sorted([pdf_path, *from_file['output_paths'].values()])
+    for key in ('detected_vat', 'country_code', 'prior_total', 'corrected_total', 'prices_count'):
+        assert from_bytes[key] == from_file[key]
+    for style, path in from_file['output_paths'].items():
+        assert _page_content(path) == _page_content(from_bytes['output_bytes'][style])
+
+
+def test_mapped_input_matches_read_input(tmp_path):
+    import main
+
+    pdf_path = tmp_path / "example_2.pdf"
+    shutil.copy(EXAMPLES_DIR / "example_2.PDF", pdf_path)
+    with contextlib.redirect_stdout(io.StringIO()) as log:
+        read = main.process_invoice(pdf_path, "_read", "review")
+        mapped = main.process_invoice(pdf_path, "_mapped", "review", use_mmap=True)
+
+    assert isinstance(main.PDFUtils.map_pdf(pdf_path), memoryview)
+    assert "Resident memory (mapped input)" in log.getvalue()
+    assert mapped['prices_count'] == read['prices_count']
+    assert _page_content(mapped['output_path']) == _page_content(read['output_path'])
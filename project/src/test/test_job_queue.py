@@ -0,0 +1,97 @@
+"""
+Tests for the durable job queue
+"""
+
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+# Add src directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from web import job_queue as job_queue_module
+from web.job_queue import JobQueue, JobRunner
+from web.processing_pool import ProcessingPool
+
+
+def crash_worker(*args):
+    os._exit(1)
+
+
+def test_jobs_survive_restart_and_expired_leases_are_reclaimed(tmp_path):
+    queue = JobQueue(tmp_path, max_attempts=2, lease_seconds=0)
+    job_id = queue.submit(b"%PDF-1.7", "a.pdf", "review")
+    assert queue.get(job_id)["status"] == "queued"
+    assert queue.claim()["attempts"] == 1
+
+    # Server restarted - the runner holding the job is gone
+    restarted = JobQueue(tmp_path, max_attempts=2, lease_seconds=0)
+    time.sleep(0.01)
+    assert restarted.claim()["attempts"] == 2
+    time.sleep(0.01)
+    assert restarted.claim() is None
+    job = restarted.get(job_id)
+    assert job["status"] == "failed" and "crashed 2 times" in job["error"]
+    assert restarted.input_path(job_id).read_bytes() == b"%PDF-1.7"
+
+
+def test_failures_are_retried_only_after_crashes(tmp_path):
+    queue = JobQueue(tmp_path, max_attempts=3)
+    crashed, broken = queue.submit(b"1", "a.pdf", "review"), queue.submit(b"2", "b.pdf", "review")
+
+    queue.claim()
+    queue.fail(crashed, "Worker crashed", retry=True)
+    assert queue.get(crashed)["status"] == "queued"
+    queue.claim()   # Oldest first: the crashed job again
+    queue.claim()
+    queue.fail(broken, "No VAT")
+
+    assert queue.get(crashed)["attempts"] == 2
+    assert queue.get(broken)["status"] == "failed"
+    assert queue.stats() == {"running": 1, "failed": 1}
+    queue.release(crashed)
+    assert queue.get(crashed)["attempts"] == 1 and queue.get(crashed)["queue_position"] == 0
+
+    queue.complete(broken, {"styles": ["review"]})
+    for path in (queue.input_path(broken), queue.output_path(broken, "review")):
+        path.write_bytes(b"x")
+    assert queue.purge(max_age_seconds=-1) == 1
+    assert queue.get(broken) is None and not queue.input_path(broken).exists()
+
+
+def test_runner_retries_job_after_worker_crash(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_queue_module, "run_job", crash_worker)
+    queue = JobQueue(tmp_path, max_attempts=2)
+    pool = ProcessingPool(workers=1, max_queue=0)
+    job_id = queue.submit(b"%PDF-1.7", "a.pdf", "review")
+
+    async def run_until_finished():
+        runner = JobRunner(queue, pool, poll_interval=0.05)
+        runner.start()
+        try:
+            while queue.get(job_id)["status"] in ("queued", "running"):
+                await asyncio.sleep(0.05)
+        finally:
+            await runner.stop()
+
+    try:
+        asyncio.run(asyncio.wait_for(run_until_finished(), 60))
+    finally:
+        pool.shutdown()
+
+    job = queue.get(job_id)
+    assert job["status"] == "failed" and job["attempts"] == 2
+    assert "crashed" in job["error"]
+
+
+def test_jobs_are_claimed_per_owner(tmp_path):
+    queue = JobQueue(tmp_path)
+    batch = [queue.submit(b"%PDF", f"{i}.pdf", "review", owner="finance") for i in range(3)]
+    single = queue.submit(b"%PDF", "review.pdf", "review", owner="marcus")
+
+    assert queue.waiting_owners() == ["finance", "marcus"]
+    assert queue.claim("marcus")["id"] == single
+    assert queue.claim()["id"] == batch[0]
+    assert queue.waiting_owners() == ["finance"]
@@ -0,0 +1,111 @@
+"""
+Tests for layout fingerprints and learned extraction templates
+"""
+
+import io
+import contextlib
+import sys
+from pathlib import Path
+import pymupdf
+
+# Add src and core directories to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "docs" / "core"))
+
+from layout_templates import TemplateStore, layout_fingerprint
+from text_model import DocumentTextModel
+
+EXAMPLES_DIR = Path(__file__).parent.parent.parent / "examples"
+
+
+def _invoice_page(customer_number: str, amount: str):
+    doc = pymupdf.open()
+    page = doc.new_page()
+    page.insert_text((50, 60), "Invoice")
+    page.insert_text((50, 120), f"Customer {customer_number}")
+    page.insert_text((300, 60), "Shipping Address:")
+    page.insert_text((300, 400), f"Total Value: {amount}")
+    return doc
+
+
+def test_fingerprint_ignores_numbers_but_not_labels():
+    first, second = _invoice_page("10001", "1.540,00"), _invoice_page("20777", "99,10")
+    moved = _invoice_page("10001", "1.540,00")
+    moved[0].insert_text((50, 200), "Delivery Note")
+
+    fingerprints = [layout_fingerprint(DocumentTextModel(doc).page(0)) for doc in (first, second, moved)]
+
+    assert fingerprints[0] == fingerprints[1]
+    assert fingerprints[0] != fingerprints[2]
+
+
+def test_template_is_learned_and_reused_with_same_plan():
+    import main
+
+    store = TemplateStore()
+    pdf_path = EXAMPLES_DIR / "example_1.PDF"
+    with contextlib.redirect_stdout(io.StringIO()):
+        reference = main.analyze_invoice(pdf_path, templates=None)
+        learned = main.analyze_invoice(pdf_path, templates=store)
+        reused = main.analyze_invoice(pdf_path, templates=store)
+
+    assert len(store) == 1
+    template = next(iter(store._templates.values()))
+    assert template.uses == 2
+    assert template.learned and template.price_columns
+    assert learned.to_dict() == reference.to_dict()
+    assert reused.to_dict() == reference.to_dict()
+
+
+def test_price_column_drift_resets_template(tmp_path):
+    store = TemplateStore()
+    template = store.get("abc")
+    assert template.check_price_columns([400.0, 500.0])
+    assert template.check_price_columns([500.0])
+    assert template.price_columns == [400.0, 500.0]
+    assert not template.check_price_columns([100.0])
+    assert template.price_columns == [100.0]
+
+    store.save(tmp_path / "templates.json")
+    loaded = TemplateStore()
+
+    assert loaded.load(tmp_path / "templates.json") == 1
+    assert loaded.get("abc").to_dict() == template.to_dict()
+
+
+def _save_templates(path, prefix, count):
+    store = TemplateStore(path=path)
+    for number in range(count):
+        store.get(f"{prefix}{number}").price_columns = [float(number)]
+        store.save()
+
+
+def test_concurrent_saves_keep_all_templates(tmp_path):
+    import multiprocessing
+
+    path = tmp_path / "templates.json"
+    processes = [multiprocessing.Process(target=_save_templates, args=(path, prefix, 20)) for prefix in "abcd"]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    assert len(TemplateStore(path=path)) == 80
+
+
+def test_templates_persist_in_store_file(tmp_path):
+    import main
+
+    path = tmp_path / "templates.json"
+    pdf_path = EXAMPLES_DIR / "example_1.PDF"
+    other_process = TemplateStore(path=path)
+    other_process.get("abc").price_columns = [400.0]
+    with contextlib.redirect_stdout(io.StringIO()):
+        main.analyze_invoice(pdf_path, templates=TemplateStore(path=path))
+        other_process.save()
+
+    restarted = TemplateStore(path=path)
+    assert len(restarted) == 2
+    assert restarted.version != "none" and TemplateStore().version == "none"
+    assert restarted.get("abc").price_columns == [400.0]
+    assert all(template.price_columns for template in restarted._templates.values())
@@ -0,0 +1,71 @@
+"""
+Tests for the pattern registry and VAT detection
+"""
+
+import sys
+from pathlib import Path
+
+# Add core directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "docs" / "core"))
+
+from patterns import PATTERNS, PatternRegistry
+from utils import PDFUtils
+
+
+def test_rules_record_calls_and_matches():
+    registry = PatternRegistry()
+    rule = registry.register("price", r'\d{1,3}(?:\.\d{3})*,\d{2}')
+
+    assert [m.group(0) for m in rule.finditer("1.540,00 and 115,39")] == ["1.540,00", "115,39"]
+    assert rule.search("no price") is None
+
+    stats = registry.stats()["price"]
+    assert stats["calls"] == 2
+    assert stats["matches"] == 2
+    assert "price" in registry.report()
+
+
+def test_vat_rules_are_compiled_once_per_value():
+    rules = PATTERNS.for_vat(8.1)
+
+    assert PATTERNS.for_vat(8.1) is rules
+    # The VAT value is a wildcard pattern: "8.1" matches "8,10"
+    assert rules.label.search("(8,10 % VAT: 115,39)")
+    assert rules.line.search("(8,10 % VAT: 115,39)").group(0) == "(8,10 % VAT: 115,39)"
+
+
+def test_total_rules_keep_priority_order():
+    names = [rule.name for rule in PATTERNS.group("total.")]
+
+    assert names[0] == "total.sum_gross_value"
+    assert names[-1] == "total.gesamt"
+
+
+def test_detect_vat_prefers_percent_before_vat():
+    assert PDFUtils.detect_vat_percentage("MwSt: 19 ... (8,10 % VAT: 115,39)") == 8.1
+    assert PDFUtils.detect_vat_percentage("USt 7 and MwSt: 19") == 19.0
+    assert PDFUtils.detect_vat_percentage("(128,10 % VAT) VAT 20") == 20.0
+    assert PDFUtils.detect_vat_percentage("no tax here") is None
+
+
+def test_detect_vat_stops_consuming_pages_early():
+    requested = []
+
+    def pages():
+        for number, text in enumerate(["Total (8,10 % VAT: 115,39)\n", "MwSt 19\n", "x\n"]):
+            requested.append(number)
+            yield text + " " * 100
+
+    assert PDFUtils.detect_vat_percentage(pages()) == 8.1
+    assert requested == [0]
+
+
+def test_detect_vat_matches_running_on_to_the_next_page():
+    cases = [
+        ("must" + " " * 70 + "8,10", "25"),
+        ("Privat\n" + " " * 70, "19"),
+        ("(8,10" + " " * 70 + "% V", "AT: 115,39)"),
+    ]
+    for pages in cases:
+        assert PDFUtils.detect_vat_percentage(iter(pages)) == PDFUtils.detect_vat_percentage("".join(pages))
+    assert PDFUtils.detect_vat_percentage(iter(cases[0])) == 8.1025
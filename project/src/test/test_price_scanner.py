@@ -0,0 +1,43 @@
+"""
+Tests for the word-based price scanner
+"""
+
+import sys
+from pathlib import Path
+import pymupdf
+
+# Add core directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "docs" / "core"))
+
+from text_model import DocumentTextModel
+from price_scanner import scan_prices, scan_words
+
+EXAMPLES_DIR = Path(__file__).parent.parent.parent / "examples"
+
+
+def test_scan_words_reports_context_and_block():
+    words = [
+        (10, 10, 30, 20, "Rabatt", 0, 0, 0),
+        (35, 10, 50, 20, "-", 0, 0, 1),
+        (55, 10, 80, 20, "50,00%", 0, 0, 2),
+        (10, 30, 60, 40, "1.540,00", 1, 0, 0),
+    ]
+
+    matches = list(scan_words(words))
+
+    assert [m.text for m in matches] == ["50,00", "1.540,00"]
+    assert matches[0].context == "Rabatt - 50,00%"
+    assert matches[0].context[matches[0].context_offset:].startswith("50,00")
+    assert matches[1].block_no == 1
+    assert matches[1].rect == (10, 30, 60, 40)
+
+
+def test_scan_prices_rects_match_search_for():
+    doc = pymupdf.open(str(EXAMPLES_DIR / "example_1.PDF"))
+    page = doc[1]
+    page_text = DocumentTextModel(doc).page(1)
+
+    for match in scan_prices(page_text):
+        found = [tuple(r) for r in page.search_for(match.text)]
+        assert any(all(abs(a - b) < 0.01 for a, b in zip(match.rect, r)) for r in found)
+    doc.close()
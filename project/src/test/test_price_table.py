@@ -0,0 +1,62 @@
+"""
+Tests for the columnar price candidate table
+"""
+
+import sys
+from pathlib import Path
+
+# Add core directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "docs" / "core"))
+
+from patterns import PATTERNS
+from price_scanner import PriceMatch
+from price_table import PriceCandidateTable
+
+
+def _matches(block_text, block_no=0, page_num=0):
+    """Build scanner results for every price in a block text."""
+    return [
+        (page_num, PriceMatch(m.group(0), (10.0, 20.0, 50.0, 30.0), block_no, block_text, m.start()))
+        for m in PATTERNS["price"].finditer(block_text)
+    ]
+
+
+def test_keep_mask_skips_percentages_and_discounts():
+    matches = (
+        _matches("Discount 15,00 % on item", block_no=0)
+        + _matches("Rabatt - 25,00", block_no=1)
+        + _matches("Unit price 45,00 Total 1.540,00", block_no=2)
+        + _matches("Fee 5,00", block_no=3)
+    )
+    table = PriceCandidateTable.from_matches(matches)
+
+    assert table.texts == ["15,00", "25,00", "45,00", "1.540,00", "5,00"]
+    assert list(table.keep_mask()) == [False, False, True, True, False]
+
+
+def test_without_vat_rounds_to_cents():
+    table = PriceCandidateTable.from_matches(_matches("Total 1.540,00 and 108,10"))
+
+    assert list(table.value) == [1540.0, 108.1]
+    assert list(table.without_vat(8.1)) == [round(1540.0 / 1.081, 2), 100.0]
+
+
+def test_empty_table():
+    table = PriceCandidateTable.from_matches([])
+
+    assert len(table) == 0
+    assert len(table.keep_mask()) == 0
+
+
+def test_hit_stores_plain_floats():
+    table = PriceCandidateTable.from_matches(_matches("Total 1.540,00"))
+    hit = table.hit(0, table.without_vat(8.1)[0])
+
+    assert type(hit.x0) is float and type(hit.new_value) is float
+    assert hit.rect == (10.0, 20.0, 50.0, 30.0)
+    assert hit.position == (10.0, 30.0)
+    assert hit.to_dict() == {
+        "page_num": 0, "x0": 10.0, "y0": 20.0, "x1": 50.0, "y1": 30.0,
+        "value": 1540.0, "new_value": round(1540.0 / 1.081, 2), "text": "1.540,00",
+    }
+    assert not hasattr(hit, "__dict__")
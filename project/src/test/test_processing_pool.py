@@ -0,0 +1,114 @@
+"""
+Tests for the bounded processing pool
+"""
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+# Add src directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from web.processing_pool import BULK, INTERACTIVE, PoolBusy, ProcessingPool, WeightedRoundRobin, parse_weights
+
+
+def test_jobs_run_in_workers_and_report_wait_and_run_times():
+    pool = ProcessingPool(workers=1, max_queue=1)
+
+    async def submit_two():
+        return await asyncio.gather(pool.run(time.sleep, 0.3), pool.run(time.sleep, 0.3))
+
+    try:
+        (_, first), (_, second) = asyncio.run(submit_two())
+    finally:
+        pool.shutdown()
+
+    assert first["run_seconds"] >= 0.3 and second["run_seconds"] >= 0.3
+    # One worker - one of the jobs waited for the other
+    assert max(first["wait_seconds"], second["wait_seconds"]) >= 0.25
+    assert pool.stats()["completed"] == 2
+
+
+def test_full_queue_rejects_with_retry_after():
+    pool = ProcessingPool(workers=1, max_queue=1)
+
+    async def submit_three():
+        running = [asyncio.ensure_future(pool.run(time.sleep, 0.3)) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(PoolBusy) as busy:
+            await pool.run(time.sleep, 0.3)
+        await asyncio.gather(*running)
+        return busy.value
+
+    try:
+        busy = asyncio.run(submit_three())
+    finally:
+        pool.shutdown()
+
+    assert busy.retry_after >= 1
+    assert pool.stats()["rejected"] == 1
+    assert pool.stats()["running"] == pool.stats()["queued"] == 0
+
+
+def test_cancelled_request_keeps_its_worker_until_the_job_ends():
+    pool = ProcessingPool(workers=1, max_queue=1)
+
+    async def cancel_running_job():
+        request = asyncio.ensure_future(pool.run(time.sleep, 1.0))
+        await asyncio.sleep(0.3)    # Job is running in the worker
+        request.cancel()
+        await asyncio.sleep(0)
+        running_after_cancel = pool.stats()["running"]
+        _, timings = await pool.run(time.sleep, 0)
+        return running_after_cancel, timings
+
+    try:
+        running_after_cancel, timings = asyncio.run(cancel_running_job())
+    finally:
+        pool.shutdown()
+
+    assert running_after_cancel == 1
+    assert timings["wait_seconds"] >= 0.5     # Waited for the cancelled request's job
+    assert pool.stats()["running"] == 0
+
+
+def test_weighted_round_robin_spreads_picks_by_weight():
+    rr = WeightedRoundRobin(parse_weights("finance:2, admin:1"))
+
+    picks = [rr.pick(["finance", "admin", "user"]) for _ in range(8)]
+
+    assert picks.count("finance") == 4 and picks.count("admin") == 2 and picks.count("user") == 2
+    assert "finance" in picks[:2] and picks[:2] != ["finance", "finance"]
+    assert rr.pick(["user"]) == "user"
+
+
+def test_interactive_lane_and_other_users_are_not_starved_by_a_batch():
+    pool = ProcessingPool(workers=1, max_queue=4, bulk_queue=20,
+                          lane_weights={INTERACTIVE: 4, BULK: 1}, user_weights={})
+    order = []
+
+    async def job(tag, user, lane, seconds=0.0):
+        result, _ = await pool.run(time.sleep, seconds, user=user, lane=lane)
+        order.append(tag)
+
+    async def submit_all():
+        batch = [asyncio.ensure_future(job("A1", "a", BULK, 0.3))]
+        await asyncio.sleep(0.05)   # A1 holds the only worker
+        batch += [asyncio.ensure_future(job(f"A{i}", "a", BULK)) for i in range(2, 7)]
+        await asyncio.sleep(0)
+        colleague = asyncio.ensure_future(job("B1", "b", BULK))
+        review = asyncio.ensure_future(job("C1", "c", INTERACTIVE))
+        await asyncio.gather(*batch, colleague, review)
+
+    try:
+        asyncio.run(submit_all())
+    finally:
+        pool.shutdown()
+
+    assert order[:4] == ["A1", "C1", "A2", "B1"]
+    stats = pool.stats()
+    assert stats["lanes"][BULK]["samples"] == 7 and stats["lanes"][INTERACTIVE]["samples"] == 1
+    assert stats["lanes"][BULK]["wait_p99_seconds"] >= stats["lanes"][BULK]["wait_p50_seconds"] > 0
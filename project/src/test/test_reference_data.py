@@ -0,0 +1,53 @@
+"""
+Tests for the reference data registry
+"""
+
+import os
+import sys
+from pathlib import Path
+import pytest
+
+# Add core directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "docs" / "core"))
+
+from reference_data import ReferenceData
+from utils import PDFUtils
+
+HEADER = "country_code,importer,vat_number,country\n"
+
+
+def test_importer_lookup_is_read_only_and_case_insensitive(tmp_path):
+    csv_path = tmp_path / "importers.csv"
+    csv_path.write_text(HEADER + "CH,First GmbH,CHE-1,Switzerland\nch,Second GmbH,CHE-2,Switzerland\n")
+    data = ReferenceData(csv_path)
+
+    importer = data.importer("ch")
+
+    assert importer["importer"] == "First GmbH"   # First row wins
+    assert data.importer("AU") is None
+    assert data.importer(None) is None
+    with pytest.raises(TypeError):
+        importer["importer"] = "Other"
+
+
+def test_importers_reload_when_csv_changes(tmp_path):
+    csv_path = tmp_path / "importers.csv"
+    csv_path.write_text(HEADER + "GB,Old Ltd,GB1,Great Britain\n")
+    data = ReferenceData(csv_path, check_interval=0)
+    assert data.importer("GB")["importer"] == "Old Ltd"
+
+    csv_path.write_text(HEADER + "GB,New Ltd,GB2,Great Britain\nAU,Aus Pty,57,Australia\n")
+    stat = csv_path.stat()
+    os.utime(csv_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    assert data.importer("GB")["importer"] == "New Ltd"
+    assert data.importer("AU")["vat_number"] == "57"
+
+    csv_path.unlink()
+    assert data.importer("GB") is None
+
+
+def test_country_names():
+    assert ReferenceData.country_name("ch") == "Switzerland"
+    assert PDFUtils.get_country_name("ch") == "Switzerland"
+    assert PDFUtils.get_country_name("XX") == "XX"
@@ -0,0 +1,56 @@
+"""
+Tests for the two-tier result cache
+"""
+
+import sys
+from pathlib import Path
+
+# Add src directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from web.result_cache import ResultCache
+
+
+def _key(name):
+    return ResultCache.make_key(name.encode(), "review", "csv-1", "code-1")
+
+
+def test_key_depends_on_content_style_and_versions():
+    key = ResultCache.make_key(b"%PDF-1", "review", "csv-1", "code-1")
+
+    assert key == ResultCache.make_key(memoryview(b"%PDF-1"), "review", "csv-1", "code-1")
+    assert key != ResultCache.make_key(b"%PDF-2", "review", "csv-1", "code-1")
+    assert key != ResultCache.make_key(b"%PDF-1", "download", "csv-1", "code-1")
+    assert key != ResultCache.make_key(b"%PDF-1", "review", "csv-2", "code-1")
+    assert key != ResultCache.make_key(b"%PDF-1", "review", "csv-1", "code-2")
+    assert key != ResultCache.make_key(b"%PDF-1", "review", "csv-1", "code-1", "templates-2")
+
+
+def test_memory_tier_evicts_least_recently_used(tmp_path):
+    cache = ResultCache(tmp_path, memory_budget=250, disk_budget=0)
+    for name in ("a", "b"):
+        cache.put(_key(name), {"name": name}, {"review": bytes(100)})
+    cache.get(_key("a"))                                    # "b" is now least recently used
+    cache.put(_key("c"), {"name": "c"}, {"review": bytes(100)})
+
+    assert cache.get(_key("a"))[0] == {"name": "a"}
+    assert cache.get(_key("b")) is None
+    assert cache.stats()["memory_bytes"] == 200
+    assert cache.stats()["disk_entries"] == 0               # Larger than the disk budget
+
+
+def test_disk_tier_survives_restart_and_stays_in_budget(tmp_path):
+    cache = ResultCache(tmp_path, memory_budget=0, disk_budget=1000)
+    for name in ("a", "b", "c"):
+        cache.put(_key(name), {"name": name}, {"review": bytes(300), "download": bytes(100)})
+
+    restarted = ResultCache(tmp_path, memory_budget=1000, disk_budget=1000)
+    metadata, outputs = restarted.get(_key("c"))
+
+    assert restarted.get(_key("a")) is None                 # Evicted to stay within 1000 bytes
+    assert metadata == {"name": "c"}
+    assert outputs == {"review": bytes(300), "download": bytes(100)}
+    assert restarted.stats()["hits"] == {"memory": 0, "disk": 1}
+    assert restarted.get(_key("c")) is not None
+    assert restarted.stats()["hits"] == {"memory": 1, "disk": 1}
+    assert sum(f.stat().st_size for f in tmp_path.iterdir()) <= 1000
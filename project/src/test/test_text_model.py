@@ -0,0 +1,83 @@
+"""
+Tests for the shared document text model
+"""
+
+import sys
+from pathlib import Path
+import pymupdf
+
+# Add core directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "docs" / "core"))
+
+from text_model import DocumentTextModel
+from spatial_index import GridIndex, ProximityIndex
+
+EXAMPLES_DIR = Path(__file__).parent.parent.parent / "examples"
+
+
+def test_full_text_matches_page_extraction():
+    doc = pymupdf.open(str(EXAMPLES_DIR / "example_1.PDF"))
+    model = DocumentTextModel(doc)
+
+    expected = "".join(page.get_text() for page in doc)
+
+    assert model.full_text == expected
+    doc.close()
+
+
+def test_page_extraction_is_cached():
+    doc = pymupdf.open(str(EXAMPLES_DIR / "example_1.PDF"))
+    model = DocumentTextModel(doc)
+
+    page_text = model.page(0)
+
+    assert model.page(0) is page_text
+    assert page_text.words is page_text.words
+    assert page_text.spans is page_text.spans
+    assert all(b[6] == 0 for b in page_text.text_blocks)
+    doc.close()
+
+
+def test_text_in_rect_finds_vat_label():
+    doc = pymupdf.open(str(EXAMPLES_DIR / "example_1.PDF"))
+    model = DocumentTextModel(doc)
+    page_text = model.page(1)
+
+    vat_rect = doc[1].search_for("VAT")[0]
+    near = page_text.text_in_rect(pymupdf.Rect(vat_rect.x0 - 150, vat_rect.y0 - 10,
+                                               vat_rect.x1 + 200, vat_rect.y1 + 10))
+
+    assert "(8,10 % VAT:" in near
+    doc.close()
+
+
+def test_grid_index_query_keeps_insertion_order():
+    index = GridIndex(cell_size=10)
+    index.insert((0, 0, 5, 5), "a")
+    index.insert((100, 100, 120, 110), "b")
+    index.insert((4, 4, 60, 8), "c")
+
+    assert index.query((1, 1, 6, 6)) == ["a", "c"]
+    assert index.query((110, 105, 111, 106)) == ["b"]
+    assert index.query((200, 200, 300, 300)) == []
+
+
+def test_word_index_matches_linear_scan():
+    doc = pymupdf.open(str(EXAMPLES_DIR / "example_3.PDF"))
+    page_text = DocumentTextModel(doc).page(0)
+    rect = pymupdf.Rect(300, 300, 500, 420)
+
+    expected = [w for w in page_text.words
+                if w[0] < rect.x1 and w[2] > rect.x0 and w[1] < rect.y1 and w[3] > rect.y0]
+
+    assert page_text.words_in_rect(rect) == expected
+    doc.close()
+
+
+def test_proximity_index_detects_near_points():
+    index = ProximityIndex(tolerance=5)
+    index.add(100.0, 200.0)
+
+    assert index.has_near(104.9, 195.1)
+    assert not index.has_near(105.0, 200.0)
+    assert not index.has_near(100.0, 206.0)
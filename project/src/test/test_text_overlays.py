@@ -0,0 +1,33 @@
+"""
+Tests for bulk text overlay insertion
+"""
+
+import sys
+from pathlib import Path
+import pymupdf
+
+# Add core directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "docs" / "core"))
+
+from utils import PDFUtils
+
+
+def test_prepare_text_replaces_missing_glyphs_only():
+    assert PDFUtils.prepare_text("1.234,56") == "1.234,56"
+    assert PDFUtils.prepare_text("1.234,56 €") == "1.234,56 EUR"   # Not in base-14 Latin-1 encoding
+    assert PDFUtils.prepare_text("12,00 Fr. für 中") == "12,00 Fr. für ?"
+    assert PDFUtils.get_font("helv") is PDFUtils.get_font("helv")
+
+
+def test_insert_texts_writes_all_texts_at_once():
+    doc = pymupdf.open()
+    page = doc.new_page()
+
+    written = PDFUtils.insert_texts(page, [(50, 60, "100,00"), (50, 90, "25,50 €")])
+    lines = [line for line in page.get_text().splitlines() if line]
+
+    assert written == 2
+    assert lines == ["100,00", "25,50 EUR"]
+    assert [font[1] for font in page.get_fonts()] == ["n/a"]    # Base-14 font, not embedded
+    assert PDFUtils.insert_texts(page, []) == 0
+    doc.close()
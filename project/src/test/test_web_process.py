@@ -0,0 +1,297 @@
+"""
+Tests for the PDF processing API
+"""
+
+import asyncio
+import io
+import contextlib
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+
+# Add src directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from web.app import app
+from web import routes
+
+EXAMPLES_DIR = Path(__file__).parent.parent.parent / "examples"
+
+
+def test_process_and_download_in_memory():
+    client = TestClient(app)
+    pdf_bytes = (EXAMPLES_DIR / "example_1.PDF").read_bytes()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        response = client.post(
+            "/api/process",
+            files={"file": ("example_1.pdf", pdf_bytes, "application/pdf")},
+            data={"style": "both"},
+        )
+
+    assert response.status_code == 200
+    result = response.json()
+    assert set(result["downloads"]) == {"review", "download"}
+    for style, download in result["downloads"].items():
+        assert "path" not in routes.processed_files[download["download_token"]]
+        pdf = client.get(download["download_url"])
+        assert pdf.status_code == 200
+        assert pdf.content.startswith(b"%PDF")
+        assert pdf.headers["content-disposition"] == f'attachment; filename="example_1_corrected_{style}.pdf"'
+
+
+def test_process_rejects_non_pdf():
+    client = TestClient(app)
+
+    response = client.post("/api/process", files={"file": ("notes.txt", b"hello", "text/plain")})
+
+    assert response.status_code == 400
+
+
+def test_large_upload_is_processed_from_spooled_file():
+    import pymupdf
+
+    doc = pymupdf.open(EXAMPLES_DIR / "example_1.PDF")
+    doc.embfile_add("padding.bin", os.urandom(2 * 1024 * 1024))  # Above the 1 MB spooling limit
+    pdf_bytes = doc.tobytes()
+    doc.close()
+    client = TestClient(app)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        response = client.post(
+            "/api/process",
+            files={"file": ("large.pdf", pdf_bytes, "application/pdf")},
+            data={"style": "review"},
+        )
+
+    assert response.status_code == 200
+    assert response.json()["prices_updated"] > 0
+
+
+def test_read_upload_maps_only_large_uploads(monkeypatch):
+    from fastapi import UploadFile
+
+    monkeypatch.setattr(routes, "MAP_UPLOAD_MIN_BYTES", 100)
+    on_disk = tempfile.SpooledTemporaryFile(max_size=10)
+    on_disk.write(b"%PDF-" + bytes(100))
+    in_memory = tempfile.SpooledTemporaryFile(max_size=1000)
+    in_memory.write(b"%PDF-" + bytes(50))
+    for spooled in (on_disk, in_memory):
+        spooled.seek(0)
+
+    mapped = asyncio.run(routes.read_upload(UploadFile(on_disk, filename="a.pdf")))
+    read = asyncio.run(routes.read_upload(UploadFile(in_memory, filename="b.pdf")))
+
+    assert isinstance(mapped, memoryview) and mapped[:5] == b"%PDF-"
+    assert isinstance(read, bytes) and len(read) == 55
+
+
+def test_mapped_upload_is_handed_to_the_worker_as_a_file(tmp_path, monkeypatch):
+    from web.result_cache import ResultCache
+    main = routes.load_processing()
+
+    upload_dir = tmp_path / "uploads"
+    upload_dir.mkdir()
+    monkeypatch.setattr(routes, "result_cache", ResultCache(tmp_path / "cache"))
+    monkeypatch.setattr(routes.tempfile, "tempdir", str(upload_dir))
+    pdf_path = EXAMPLES_DIR / "example_2.PDF"
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        mapped, _, _ = asyncio.run(routes.process_content(
+            main.PDFUtils.map_pdf(pdf_path), "a.pdf", "review", routes.DEFAULT_USER, routes.INTERACTIVE))
+        expected = main.process_invoice_bytes(pdf_path.read_bytes(), "review")
+
+    assert mapped["prices_count"] == expected["prices_count"]
+    assert mapped["output_bytes"].keys() == expected["output_bytes"].keys()
+    assert not list(upload_dir.iterdir())
+
+
+def test_repeated_upload_is_served_from_result_cache(tmp_path, monkeypatch):
+    from web.result_cache import ResultCache
+
+    monkeypatch.setattr(routes, "result_cache", ResultCache(tmp_path))
+    client = TestClient(app)
+    pdf_bytes = (EXAMPLES_DIR / "example_2.PDF").read_bytes()
+
+    responses = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for style in ("review", "review", "download"):
+            responses.append(client.post(
+                "/api/process",
+                files={"file": ("example_2.pdf", pdf_bytes, "application/pdf")},
+                data={"style": style},
+            ).json())
+
+    assert [r["cached"] for r in responses] == [False, True, False]
+    first, second = responses[0], responses[1]
+    assert second["prices_updated"] == first["prices_updated"]
+    assert second["download_token"] != first["download_token"]
+    assert client.get(second["download_url"]).content == client.get(first["download_url"]).content
+
+
+def test_full_processing_queue_answers_503_with_retry_after(tmp_path, monkeypatch):
+    from web.processing_pool import ProcessingPool
+    from web.result_cache import ResultCache
+
+    busy_pool = ProcessingPool(workers=1, max_queue=0)
+    busy_pool._running = 1   # One job running, no queue
+    monkeypatch.setattr(routes, "processing_pool", busy_pool)
+    monkeypatch.setattr(routes, "result_cache", ResultCache(tmp_path))
+    client = TestClient(app)
+
+    response = client.post(
+        "/api/process",
+        files={"file": ("example_3.pdf", (EXAMPLES_DIR / "example_3.PDF").read_bytes(), "application/pdf")},
+    )
+
+    assert response.status_code == 503
+    assert int(response.headers["retry-after"]) >= 1
+    assert client.get("/health").status_code == 200
+    assert client.get("/api/stats").json()["processing_pool"]["rejected"] == 1
+
+
+def test_job_api_processes_in_background(tmp_path, monkeypatch):
+    import time
+    from web.job_queue import JobQueue, JobRunner
+
+    queue = JobQueue(tmp_path)
+    monkeypatch.setattr(routes, "job_queue", queue)
+    monkeypatch.setattr(routes, "job_runner", JobRunner(queue, routes.processing_pool, poll_interval=0.1))
+
+    with TestClient(app) as client:
+        submitted = client.post(
+            "/api/jobs",
+            files={"file": ("example_1.pdf", (EXAMPLES_DIR / "example_1.PDF").read_bytes(), "application/pdf")},
+            data={"style": "both"},
+        )
+        assert submitted.status_code == 202
+        status_url = submitted.json()["status_url"]
+        assert client.get(f"{submitted.json()['result_url']}").status_code in (200, 409)
+
+        deadline = time.time() + 60
+        while client.get(status_url).json()["status"] in ("queued", "running") and time.time() < deadline:
+            time.sleep(0.1)
+        status = client.get(status_url).json()
+
+        assert status["status"] == "done" and status["attempts"] == 1
+        assert status["prices_updated"] > 0
+        assert set(status["downloads"]) == {"review", "download"}
+        pdf = client.get(status["downloads"]["download"]["download_url"])
+        assert pdf.content.startswith(b"%PDF")
+        assert pdf.headers["content-disposition"] == 'attachment; filename="example_1_corrected_download.pdf"'
+        assert client.get("/api/jobs/unknown").status_code == 404
+
+
+def test_left_over_files_are_removed_at_startup(tmp_path, monkeypatch):
+    from web.job_queue import JobQueue, JobRunner
+
+    queue = JobQueue(tmp_path / "jobs")
+    monkeypatch.setattr(routes, "job_queue", queue)
+    monkeypatch.setattr(routes, "job_runner", JobRunner(queue, routes.processing_pool))
+    monkeypatch.setattr(routes, "PROCESSED_FILES_DIR", tmp_path / "downloads")
+    job_id = queue.submit(b"%PDF", "a.pdf", "review")
+    queue.claim()
+    queue.complete(job_id, {"styles": []})
+
+    routes.PROCESSED_FILES_DIR.mkdir()
+    left_over = [routes.PROCESSED_FILES_DIR / "expired.pdf",
+                 queue.queue_dir / "0123.input.pdf.tmp",
+                 queue.queue_dir / "gone.review.pdf"]
+    recent = routes.PROCESSED_FILES_DIR / "other_server.pdf"
+    for path in [*left_over, recent]:
+        path.write_bytes(b"%PDF")
+    for path in [*left_over, queue.input_path(job_id)]:
+        os.utime(path, (0, 0))
+
+    with TestClient(app):
+        pass
+
+    assert not any(path.exists() for path in left_over)
+    assert recent.exists() and queue.input_path(job_id).exists()
+
+
+def test_batch_upload_of_pdfs_and_zip(tmp_path, monkeypatch):
+    import zipfile
+    import pymupdf
+    from web.result_cache import ResultCache
+
+    monkeypatch.setattr(routes, "result_cache", ResultCache(tmp_path / "cache"))
+    monkeypatch.setattr(routes, "PROCESSED_FILES_DIR", tmp_path / "downloads")
+    client = TestClient(app)
+    example_1 = (EXAMPLES_DIR / "example_1.PDF").read_bytes()
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zf:
+        zf.writestr("march/example_2.pdf", (EXAMPLES_DIR / "example_2.PDF").read_bytes())
+        zf.writestr("march/example_1.pdf", example_1)
+        zf.writestr("march/readme.txt", "not an invoice")
+    blank = pymupdf.open()
+    blank.new_page()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        response = client.post(
+            "/api/process/batch",
+            files=[
+                ("files", ("example_1.pdf", example_1, "application/pdf")),
+                ("files", ("invoices.zip", archive.getvalue(), "application/zip")),
+                ("files", ("blank.pdf", blank.tobytes(), "application/pdf")),
+                ("files", ("notes.txt", b"hello", "text/plain")),
+            ],
+        )
+
+    assert response.status_code == 200
+    result = response.json()
+    assert [(f["filename"], f["status"]) for f in result["files"]] == [
+        ("example_1.pdf", "success"), ("example_2.pdf", "success"), ("example_1.pdf", "success"),
+        ("blank.pdf", "error"), ("notes.txt", "error"),
+    ]
+    assert result["status"] == "partial" and result["processed"] == 3 and result["failed"] == 2
+    assert result["files"][1]["prices_updated"] > 0
+    token = result["files"][1]["downloads"]["review"]["download_token"]
+    assert Path(routes.processed_files[token]["path"]).parent == tmp_path / "downloads"
+    single = client.get(f"/api/download/{token}")
+    assert single.headers["content-disposition"] == 'attachment; filename="example_2_corrected.pdf"'
+
+    download = client.get(result["batch_download_url"])
+    assert download.headers["content-type"] == "application/zip"
+    with zipfile.ZipFile(io.BytesIO(download.content)) as zf:
+        assert zf.namelist() == ["example_1_corrected.pdf", "example_2_corrected.pdf", "example_1_corrected_2.pdf"]
+        assert zf.read("example_2_corrected.pdf") == single.content
+    assert client.get("/api/download/batch/unknown").status_code == 404
+
+
+def test_batch_upload_without_pdfs_reports_errors():
+    client = TestClient(app)
+
+    response = client.post("/api/process/batch", files=[("files", ("notes.txt", b"hello", "text/plain"))])
+
+    assert response.status_code == 200 and response.json()["status"] == "error"
+    assert "batch_token" not in response.json()
+
+
+def test_batch_zip_is_streamed_in_chunks(tmp_path, monkeypatch):
+    import zipfile
+    from datetime import datetime, timedelta
+
+    monkeypatch.setattr(routes, "DOWNLOAD_CHUNK_BYTES", 64 * 1024)
+    on_disk = tmp_path / "big.pdf"
+    on_disk.write_bytes(os.urandom(300 * 1024))
+    entries = [
+        ("big_corrected.pdf", {"path": str(on_disk)}),
+        ("small_corrected.pdf", {"content": b"%PDF-small"}),
+    ]
+
+    parts = list(routes.stream_zip(entries))
+
+    assert len(parts) > 5 and max(len(part) for part in parts) < 70 * 1024
+    with zipfile.ZipFile(io.BytesIO(b"".join(parts))) as zf:
+        assert zf.read("big_corrected.pdf") == on_disk.read_bytes()
+        assert zf.read("small_corrected.pdf") == b"%PDF-small"
+
+    # Expired batch files are removed from disk
+    routes.processed_files["expired"] = {"path": str(on_disk), "original_filename": "big.pdf",
+                                         "expires_at": datetime.now() - timedelta(seconds=1)}
+    routes.purge_expired_files()
+    assert "expired" not in routes.processed_files and not on_disk.exists()
@@ -37,8 +37,7 @@ class PP_VATMainWindow(QMainWindow):
         super().__init__()
         self.pdf_path = None
         self.detected_vat = None
-        self.corrected_pdf_buffer = None  # In-memory corrected PDF
-        self.temp_file_path = None  # Store temp file path for cleanup
+        self.corrected_pdf_buffer = None  # In-memory corrected PDF (bytes)
         
         self.setup_ui()
         self.apply_styling()
@@ -326,7 +325,7 @@ class PP_VATMainWindow(QMainWindow):
         """Create corrected PDF with VAT removed using complete main.py logic"""
         try:
             # Import the complete processing function from main.py
-            from src.main import process_invoice
+            from src.main import process_invoice_bytes
             
             # Process invoice with all the sophisticated logic from main.py
             # This includes:
@@ -335,21 +334,16 @@ class PP_VATMainWindow(QMainWindow):
             # - VAT label highlighting
             # - Correct layering of highlights and text overlays
             
-            # Create a temporary output file
-            temp_output = self.pdf_path.parent / f"{self.pdf_path.stem}_temp.pdf"
+            # Use the complete processing with "review" style for GUI preview -
+            # the corrected PDF stays in memory until the user saves it
+            result = process_invoice_bytes(self.pdf_path.read_bytes(), "review")
             
-            # Use the complete process_invoice function with "review" style for GUI preview
-            output_path = process_invoice(self.pdf_path, "_temp", "review")
-            
-            if output_path and output_path.exists():
-                # Store temp file path for cleanup later
-                self.temp_file_path = output_path
+            if result and result.get('output_bytes'):
+                # Keep the processed document for saving later
+                self.corrected_pdf_buffer = result['output_bytes']['review']
                 
                 # Load corrected PDF in preview
-                self.corrected_preview.load_pdf(output_path)
-                
-                # Keep the processed document for saving later
-                self.corrected_pdf_buffer = pymupdf.open(str(output_path))
+                self.corrected_preview.load_pdf(self.corrected_pdf_buffer)
                 
                 # Enable accept button
                 self.accept_btn.setEnabled(True)
@@ -390,14 +384,8 @@ class PP_VATMainWindow(QMainWindow):
             return
         
         try:
-            # Copy the processed temp file to the user's chosen location
-            import shutil
-            shutil.copy2(str(self.temp_file_path), file_path)
-            
-            # Optional: Clean up temp file after successful save
-            # (Uncomment the next 2 lines if you want to delete temp files automatically)
-            # if self.temp_file_path.exists():
-            #     self.temp_file_path.unlink()
+            # Write the processed PDF to the user's chosen location
+            Path(file_path).write_bytes(self.corrected_pdf_buffer)
             
             QMessageBox.information(
                 self,
@@ -418,17 +406,8 @@ class PP_VATMainWindow(QMainWindow):
         self.original_preview.cleanup()
         self.corrected_preview.cleanup()
         
-        # Close PDF buffer if exists
-        if self.corrected_pdf_buffer:
-            self.corrected_pdf_buffer.close()
-        
-        # Clean up temp file if it exists
-        if self.temp_file_path and self.temp_file_path.exists():
-            try:
-                self.temp_file_path.unlink()
-                print(f"Cleaned up temp file: {self.temp_file_path}")
-            except Exception as e:
-                print(f"Could not delete temp file: {e}")
+        # Release the in-memory corrected PDF
+        self.corrected_pdf_buffer = None
         
         event.accept()
 
@@ -122,18 +122,21 @@ class PDFPreviewWidget(QWidget):
         
         return nav_widget
     
-    def load_pdf(self, pdf_path: Path):
+    def load_pdf(self, pdf_path):
         """
         Load and display PDF file
         
         Args:
-            pdf_path: Path to PDF file
+            pdf_path: Path to PDF file, or the PDF as bytes
         """
-        self.pdf_path = pdf_path
+        self.pdf_path = None if isinstance(pdf_path, (bytes, bytearray)) else pdf_path
         
         try:
-            # Open PDF
-            self.doc = pymupdf.open(str(pdf_path))
+            # Open PDF - from memory if bytes were given
+            if isinstance(pdf_path, (bytes, bytearray)):
+                self.doc = pymupdf.open(stream=pdf_path, filetype="pdf")
+            else:
+                self.doc = pymupdf.open(str(pdf_path))
             
             # Render first page
             self.render_page(0)
@@ -6,6 +6,7 @@ from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from pathlib import Path
+import asyncio
 import os
 
 # Import routes
@@ -41,11 +42,21 @@ async def startup_event():
     """Startup event handler"""
     print("PP_VAT Web Application Starting...")
     print(f"Environment: {os.getenv('ENVIRONMENT', 'development')}")
+    if os.getenv("K_SERVICE") and not os.getenv("DATA_DIR"):
+        # Cloud Run keeps the temp directory in memory
+        print("[WARNING] DATA_DIR is not set - jobs, cached results and downloads use memory-backed /tmp")
+    routes.purge_expired_files()
+    removed = await asyncio.to_thread(routes.remove_orphan_files)
+    if removed:
+        print(f"[INFO] Removed {removed} left-over files")
     print("Ready to process invoices!")
+    routes.job_runner.start()
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Shutdown event handler"""
     print("PP_VAT Web Application Shutting Down...")
+    await routes.job_runner.stop()
+    routes.processing_pool.shutdown()
 
@@ -0,0 +1,455 @@
+"""
+Durable job queue for asynchronous invoice processing
+
+Jobs are rows in a SQLite database next to their input and output PDFs,
+so they survive a restart of the server. A running job holds a lease that
+its runner renews; when a runner dies the lease runs out and the job is
+picked up again. Jobs are retried after a worker crash, up to
+JOB_MAX_ATTEMPTS times; a PDF that cannot be processed fails at once.
+
+Jobs are taken user by user (weighted round-robin over the owners with
+waiting jobs) and run in the bulk lane of the processing pool.
+"""
+
+import asyncio
+import contextlib
+import json
+import os
+import secrets
+import sqlite3
+import tempfile
+import time
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set
+
+from .processing_pool import BULK, DEFAULT_USER, USER_WEIGHTS, PoolBusy, ProcessingPool, WeightedRoundRobin
+
+# Base directory of the job queue, result cache and downloads. It must be on
+# disk: on Cloud Run the default temp directory is held in memory, so point
+# DATA_DIR at a volume mount there.
+DATA_DIR = Path(os.getenv("DATA_DIR", tempfile.gettempdir()))
+
+# Queue location and limits (override with environment variables)
+JOB_QUEUE_DIR = Path(os.getenv("JOB_QUEUE_DIR", DATA_DIR / "pp_vat_jobs"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETENTION_HOURS = float(os.getenv("JOB_RETENTION_HOURS", "24"))
+
+# Seconds a running job stays claimed without a lease renewal
+JOB_LEASE_SECONDS = 60.0
+# Seconds between checks for new jobs when nothing wakes the runner
+JOB_POLL_INTERVAL = 1.0
+# Seconds between removals of expired jobs
+JOB_PURGE_INTERVAL = 600.0
+# Age in seconds before a job file without a job counts as left behind
+JOB_ORPHAN_AGE = 3600.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,              -- queued, running, done or failed
+    owner TEXT NOT NULL DEFAULT 'anonymous',   -- user who submitted the job
+    filename TEXT NOT NULL,
+    style TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_until REAL,
+    error TEXT,
+    metadata TEXT,                     -- JSON result metadata of a finished job
+    styles TEXT,                       -- JSON list of rendered output styles
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, created_at);
+"""
+
+# Claimable jobs: queued, or running with a lease that has run out
+CLAIMABLE = "(status = 'queued' OR (status = 'running' AND lease_until < :now))"
+
+
+def run_job(input_path: str, output_dir: str, job_id: str, style: str) -> Dict:
+    """
+    Worker process: process the input PDF of a job and write its outputs.
+
+    Args:
+        input_path: Uploaded PDF
+        output_dir: Directory for the output PDFs
+        job_id: Job ID (output file name prefix)
+        style: Output style
+
+    Returns:
+        Result metadata with 'styles', the rendered output styles
+
+    Raises:
+        ValueError: If the PDF could not be processed (e.g., no VAT detected)
+    """
+    from main import process_invoice_mapped
+
+    result = process_invoice_mapped(input_path, style)
+    if not result or not result.get('output_bytes'):
+        raise ValueError("Failed to process PDF. VAT may not be detected.")
+    for output_style, pdf in result['output_bytes'].items():
+        path = Path(output_dir) / f"{job_id}.{output_style}.pdf"
+        tmp_path = path.with_name(path.name + ".tmp")
+        tmp_path.write_bytes(pdf)
+        os.replace(tmp_path, path)
+    metadata = {k: v for k, v in result.items() if k not in ('output_bytes', 'output_paths', 'output_path')}
+    metadata['styles'] = list(result['output_bytes'])
+    return metadata
+
+
+class JobQueue:
+    """
+    SQLite backed job queue with input and output files on disk.
+
+    Every method opens its own short connection, so a queue can be shared by
+    several server processes using the same directory.
+    """
+
+    def __init__(self, queue_dir: Path = JOB_QUEUE_DIR, max_attempts: int = JOB_MAX_ATTEMPTS,
+                 lease_seconds: float = JOB_LEASE_SECONDS):
+        """
+        Initialize the queue, creating its directory and database if missing.
+
+        Args:
+            queue_dir: Directory of the database and the job files
+            max_attempts: Runs of a job before it is given up after crashes
+            lease_seconds: Seconds a running job stays claimed without renewal
+        """
+        self.queue_dir = Path(queue_dir)
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.db_path = self.queue_dir / "jobs.sqlite3"
+        self.queue_dir.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            # Databases created before jobs had owners
+            if "owner" not in {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}:
+                conn.execute(f"ALTER TABLE jobs ADD COLUMN owner TEXT NOT NULL DEFAULT '{DEFAULT_USER}'")
+
+    @contextlib.contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # Autocommit connection - multi-statement updates use explicit transactions
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def input_path(self, job_id: str) -> Path:
+        """Path of the uploaded PDF of a job."""
+        return self.queue_dir / f"{job_id}.input.pdf"
+
+    def output_path(self, job_id: str, style: str) -> Path:
+        """Path of an output PDF of a job."""
+        return self.queue_dir / f"{job_id}.{style}.pdf"
+
+    def submit(self, pdf_bytes, filename: str, style: str, owner: str = DEFAULT_USER) -> str:
+        """
+        Store an uploaded PDF and queue it for processing.
+
+        Args:
+            pdf_bytes: PDF content (bytes or memoryview)
+            filename: Original file name
+            style: Output style
+            owner: User who submitted the job
+
+        Returns:
+            Job ID
+        """
+        job_id = secrets.token_hex(8)
+        input_path = self.input_path(job_id)
+        tmp_path = input_path.with_name(input_path.name + ".tmp")
+        tmp_path.write_bytes(pdf_bytes)
+        os.replace(tmp_path, input_path)
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, owner, filename, style, created_at) VALUES (?, 'queued', ?, ?, ?, ?)",
+                (job_id, owner, filename, style, time.time())
+            )
+        return job_id
+
+    def waiting_owners(self) -> List[str]:
+        """
+        Get the users with claimable jobs.
+
+        Returns:
+            Owners, in order of their oldest claimable job
+        """
+        with self._connect() as conn:
+            return [row[0] for row in conn.execute(
+                f"SELECT owner FROM jobs WHERE {CLAIMABLE} GROUP BY owner ORDER BY MIN(created_at)",
+                {"now": time.time()}
+            )]
+
+    def claim(self, owner: Optional[str] = None) -> Optional[Dict]:
+        """
+        Take the oldest queued job, or a running job whose lease has run out.
+
+        Args:
+            owner: Only take a job of this user (default: any user)
+
+        Returns:
+            Job dictionary (status 'running'), or None if no job is waiting
+        """
+        with self._connect() as conn:
+            while True:
+                now = time.time()
+                conn.execute("BEGIN IMMEDIATE")
+                row = conn.execute(
+                    f"SELECT * FROM jobs WHERE {CLAIMABLE} AND (:owner IS NULL OR owner = :owner) "
+                    "ORDER BY created_at LIMIT 1",
+                    {"now": now, "owner": owner}
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                if row["attempts"] >= self.max_attempts:
+                    # Its runner died every time - give up on it
+                    conn.execute(
+                        "UPDATE jobs SET status = 'failed', lease_until = NULL, finished_at = ?, error = ? "
+                        "WHERE id = ?",
+                        (now, f"Processing crashed {row['attempts']} times", row["id"])
+                    )
+                    conn.execute("COMMIT")
+                    continue
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, lease_until = ?, started_at = ? "
+                    "WHERE id = ?",
+                    (now + self.lease_seconds, now, row["id"])
+                )
+                conn.execute("COMMIT")
+                break
+        return self.get(row["id"])
+
+    def renew(self, job_id: str) -> None:
+        """Extend the lease of a running job."""
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET lease_until = ? WHERE id = ? AND status = 'running'",
+                         (time.time() + self.lease_seconds, job_id))
+
+    def release(self, job_id: str) -> None:
+        """Put a claimed job back into the queue without counting the attempt."""
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET status = 'queued', attempts = attempts - 1, lease_until = NULL "
+                         "WHERE id = ? AND status = 'running'", (job_id,))
+
+    def complete(self, job_id: str, metadata: Dict) -> None:
+        """
+        Mark a job as done.
+
+        Args:
+            job_id: Job ID
+            metadata: Result metadata from run_job
+        """
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'done', lease_until = NULL, finished_at = ?, error = NULL, "
+                "metadata = ?, styles = ? WHERE id = ?",
+                (time.time(), json.dumps(metadata), json.dumps(metadata.get('styles', [])), job_id)
+            )
+
+    def fail(self, job_id: str, error: str, retry: bool = False) -> None:
+        """
+        Record a failed run of a job.
+
+        Args:
+            job_id: Job ID
+            error: Error message
+            retry: Queue the job again if it has attempts left (worker crash)
+        """
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = CASE WHEN ? AND attempts < ? THEN 'queued' ELSE 'failed' END, "
+                "finished_at = CASE WHEN ? AND attempts < ? THEN NULL ELSE ? END, "
+                "lease_until = NULL, error = ? WHERE id = ?",
+                (retry, self.max_attempts, retry, self.max_attempts, time.time(), error, job_id)
+            )
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """
+        Get a job.
+
+        Args:
+            job_id: Job ID
+
+        Returns:
+            Job dictionary with decoded 'metadata' and 'styles', or None if unknown
+        """
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            job = dict(row)
+            if job["status"] == "queued":
+                job["queue_position"] = conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND created_at < ?",
+                    (job["created_at"],)
+                ).fetchone()[0]
+        job["metadata"] = json.loads(job["metadata"]) if job["metadata"] else None
+        job["styles"] = json.loads(job["styles"]) if job["styles"] else []
+        return job
+
+    def purge(self, max_age_seconds: float = JOB_RETENTION_HOURS * 3600) -> int:
+        """
+        Remove finished jobs and their files after the retention time.
+
+        Args:
+            max_age_seconds: Age of a finished job before it is removed
+
+        Returns:
+            Number of jobs removed
+        """
+        with self._connect() as conn:
+            ids = [row[0] for row in conn.execute(
+                "SELECT id FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+                (time.time() - max_age_seconds,)
+            )]
+            conn.executemany("DELETE FROM jobs WHERE id = ?", [(job_id,) for job_id in ids])
+        for job_id in ids:
+            for path in self.queue_dir.glob(f"{job_id}.*"):
+                path.unlink(missing_ok=True)
+        return len(ids)
+
+    def remove_orphans(self, min_age_seconds: float = JOB_ORPHAN_AGE) -> int:
+        """
+        Remove job files left behind by interrupted writes or removed jobs.
+
+        Younger files are kept, as another server process sharing the
+        directory may still be writing them.
+
+        Args:
+            min_age_seconds: Age of a file before it is removed
+
+        Returns:
+            Number of files removed
+        """
+        with self._connect() as conn:
+            ids = {row[0] for row in conn.execute("SELECT id FROM jobs")}
+        cutoff = time.time() - min_age_seconds
+        removed = 0
+        for path in [*self.queue_dir.glob("*.pdf"), *self.queue_dir.glob("*.pdf.tmp")]:
+            if path.suffix != ".tmp" and path.name.split(".", 1)[0] in ids:
+                continue
+            with contextlib.suppress(FileNotFoundError):
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+                    removed += 1
+        return removed
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Count jobs per status.
+
+        Returns:
+            Dictionary: status -> number of jobs
+        """
+        with self._connect() as conn:
+            return {row[0]: row[1] for row in conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")}
+
+
+class JobRunner:
+    """
+    Background task that takes jobs from a JobQueue and runs them in a ProcessingPool.
+
+    Keeps the bulk lane of the pool filled, taking jobs from the waiting
+    users in turn. While a job is in the pool its lease is renewed.
+    """
+
+    def __init__(self, queue: JobQueue, pool: ProcessingPool, poll_interval: float = JOB_POLL_INTERVAL):
+        """
+        Initialize the runner.
+
+        Args:
+            queue: Job queue
+            pool: Processing pool that runs the jobs
+            poll_interval: Seconds between checks for new jobs
+        """
+        self.queue = queue
+        self.pool = pool
+        self.poll_interval = poll_interval
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._active: Set[asyncio.Task] = set()
+        self._resume_at = 0.0
+        self._stopping = False
+        self._owner_rr = WeightedRoundRobin(USER_WEIGHTS)
+
+    def start(self) -> None:
+        """Start the runner in the running event loop."""
+        if self._task is None:
+            self._stopping = False
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop taking jobs and cancel the running ones (their leases run out)."""
+        # The flag ends the loop even if wait_for swallows the cancellation
+        self._stopping = True
+        self.notify()
+        tasks: List[asyncio.Task] = [t for t in [self._task, *self._active] if t is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+        self._active.clear()
+
+    def notify(self) -> None:
+        """Wake the runner after a job was submitted."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self) -> None:
+        next_purge = 0.0
+        while not self._stopping:
+            now = time.time()
+            if now >= next_purge:
+                next_purge = now + JOB_PURGE_INTERVAL
+                await asyncio.to_thread(self.queue.purge)
+            while now >= self._resume_at and len(self._active) < self.pool.workers + self.pool.bulk_queue:
+                owners = await asyncio.to_thread(self.queue.waiting_owners)
+                if not owners:
+                    break
+                job = await asyncio.to_thread(self.queue.claim, self._owner_rr.pick(owners))
+                if job is None:
+                    break
+                task = asyncio.get_running_loop().create_task(self._execute(job))
+                self._active.add(task)
+                task.add_done_callback(self._active.discard)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def _execute(self, job: Dict) -> None:
+        job_id = job["id"]
+        renewal = asyncio.get_running_loop().create_task(self._renew_lease(job_id))
+        try:
+            metadata, timings = await self.pool.run(
+                run_job, str(self.queue.input_path(job_id)), str(self.queue.queue_dir), job_id, job["style"],
+                user=job["owner"], lane=BULK
+            )
+            metadata["timings"] = timings
+            await asyncio.to_thread(self.queue.complete, job_id, metadata)
+            print(f"[SUCCESS] Job {job_id} done (attempt {job['attempts']})")
+        except PoolBusy as e:
+            # Bulk lane is full (e.g. shared with another runner) - try again later
+            await asyncio.to_thread(self.queue.release, job_id)
+            self._resume_at = time.time() + e.retry_after
+        except BrokenProcessPool as e:
+            print(f"[WARNING] Worker crashed on job {job_id} (attempt {job['attempts']}): {e}")
+            await asyncio.to_thread(self.queue.fail, job_id, f"Worker crashed: {e}", retry=True)
+        except Exception as e:
+            print(f"[WARNING] Job {job_id} failed: {e}")
+            await asyncio.to_thread(self.queue.fail, job_id, str(e))
+        finally:
+            renewal.cancel()
+            self.notify()
+
+    async def _renew_lease(self, job_id: str) -> None:
+        while True:
+            await asyncio.sleep(self.queue.lease_seconds / 3)
+            await asyncio.to_thread(self.queue.renew, job_id)
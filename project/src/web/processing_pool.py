@@ -0,0 +1,338 @@
+"""
+Bounded process pool for invoice processing
+
+Processing is CPU bound and synchronous; running it in the request handler
+blocks the event loop and every other request with it. Jobs run in worker
+processes instead. At most ``workers`` jobs run; the others wait in the
+pool's scheduler, and jobs beyond a lane's queue depth are rejected with a
+Retry-After estimate so the server degrades gracefully instead of piling
+up requests.
+
+The scheduler keeps one queue per user in two lanes: "interactive" for
+requests a person is waiting on (/api/process) and "bulk" for queued jobs.
+A free worker goes to a lane and then to a user by smooth weighted
+round-robin, so one user's batch of 500 invoices cannot starve a
+colleague's single upload.
+"""
+
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+
+def parse_weights(value: str) -> Dict[str, int]:
+    """
+    Parse weights given as "name:weight,name:weight".
+
+    Args:
+        value: Weight list, may be empty
+
+    Returns:
+        Dictionary: name -> weight (at least 1)
+    """
+    weights = {}
+    for item in value.split(","):
+        name, _, weight = item.strip().rpartition(":")
+        if name:
+            weights[name] = max(1, int(weight))
+    return weights
+
+
+# Scheduler lanes
+INTERACTIVE = "interactive"
+BULK = "bulk"
+LANES = (INTERACTIVE, BULK)
+
+# Pool size and queue depth per lane (override with environment variables)
+PROCESSING_WORKERS = int(os.getenv("PROCESSING_WORKERS", str(os.cpu_count() or 1)))
+PROCESSING_QUEUE_DEPTH = int(os.getenv("PROCESSING_QUEUE_DEPTH", "8"))
+PROCESSING_BULK_QUEUE_DEPTH = int(os.getenv("PROCESSING_BULK_QUEUE_DEPTH", str(PROCESSING_WORKERS)))
+
+# Share of free workers per lane and per user ("finance:2,admin:1"; unlisted users get 1)
+LANE_WEIGHTS = parse_weights(os.getenv("PROCESSING_LANE_WEIGHTS", f"{INTERACTIVE}:4,{BULK}:1"))
+USER_WEIGHTS = parse_weights(os.getenv("PROCESSING_USER_WEIGHTS", ""))
+
+# User of requests without a known user
+DEFAULT_USER = "anonymous"
+
+# Assumed run time of a job before the first one has finished (seconds)
+INITIAL_RUN_ESTIMATE = 2.0
+# Weight of the latest run time in the moving average
+RUN_ESTIMATE_WEIGHT = 0.2
+# Queue waits kept per lane for the percentiles
+WAIT_SAMPLES = 1000
+
+
+class PoolBusy(Exception):
+    """All workers are busy and the queue is full."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Processing queue is full, retry after {retry_after} s")
+        self.retry_after = retry_after
+
+
+def _timed_call(fn: Callable, args: Tuple) -> Tuple[Any, float, float]:
+    """Worker process: run a job and report when it started and finished."""
+    started = time.time()
+    result = fn(*args)
+    return result, started, time.time()
+
+
+def percentile(sorted_values: List[float], percent: float) -> Optional[float]:
+    """
+    Nearest-rank percentile.
+
+    Args:
+        sorted_values: Values in ascending order
+        percent: Percentile (0-100)
+
+    Returns:
+        Percentile value, or None without values
+    """
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(percent / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class WeightedRoundRobin:
+    """
+    Smooth weighted round-robin over a changing set of keys.
+
+    Each pick adds every candidate's weight to its credit, takes the
+    candidate with the most credit and charges it the total weight. A key
+    with weight 2 is picked twice as often as one with weight 1, and picks
+    are spread out rather than bunched. Keys that are no longer candidates
+    lose their credit.
+    """
+
+    def __init__(self, weights: Optional[Dict[str, int]] = None):
+        """
+        Initialize the round-robin.
+
+        Args:
+            weights: Weight per key (default 1)
+        """
+        self.weights = dict(weights or {})
+        self._credit: Dict[str, int] = {}
+
+    def pick(self, candidates: Iterable[str]) -> str:
+        """
+        Choose the next key.
+
+        Args:
+            candidates: Keys that have work waiting (at least one)
+
+        Returns:
+            The chosen key
+        """
+        candidates = list(candidates)
+        total = 0
+        best = None
+        for key in candidates:
+            weight = self.weights.get(key, 1)
+            self._credit[key] = self._credit.get(key, 0) + weight
+            total += weight
+            if best is None or self._credit[key] > self._credit[best]:
+                best = key
+        self._credit[best] -= total
+        for key in [k for k in self._credit if k not in candidates]:
+            del self._credit[key]
+        return best
+
+
+class ProcessingPool:
+    """
+    Process pool with a fair scheduler, bounded lanes and per-job wait and run times.
+
+    The executor is created on first use and recreated after a worker
+    process has crashed.
+    """
+
+    def __init__(self, workers: int = PROCESSING_WORKERS, max_queue: int = PROCESSING_QUEUE_DEPTH,
+                 bulk_queue: int = PROCESSING_BULK_QUEUE_DEPTH,
+                 lane_weights: Optional[Dict[str, int]] = None, user_weights: Optional[Dict[str, int]] = None):
+        """
+        Initialize the pool.
+
+        Args:
+            workers: Number of worker processes
+            max_queue: Interactive jobs allowed to wait while all workers are busy
+            bulk_queue: Bulk jobs allowed to wait while all workers are busy
+            lane_weights: Share of free workers per lane (default LANE_WEIGHTS)
+            user_weights: Share of free workers per user within a lane (default USER_WEIGHTS)
+        """
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self.bulk_queue = max(0, bulk_queue)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._running = 0                           # Jobs holding a worker
+        self._waiting: Dict[str, "OrderedDict[str, Deque[asyncio.Future]]"] = {lane: OrderedDict() for lane in LANES}
+        self._lane_rr = WeightedRoundRobin(LANE_WEIGHTS if lane_weights is None else lane_weights)
+        self._user_rr = {lane: WeightedRoundRobin(USER_WEIGHTS if user_weights is None else user_weights)
+                         for lane in LANES}
+        self._waits: Dict[str, Deque[float]] = {lane: deque(maxlen=WAIT_SAMPLES) for lane in LANES}
+        self._run_estimate = INITIAL_RUN_ESTIMATE   # Moving average of run times
+        self.completed = 0
+        self.rejected = 0
+
+    def lane_capacity(self, lane: str) -> int:
+        """Jobs allowed to wait in a lane."""
+        return self.max_queue if lane == INTERACTIVE else self.bulk_queue
+
+    def queued(self, lane: Optional[str] = None) -> int:
+        """Number of jobs waiting in a lane (default: all lanes)."""
+        lanes = LANES if lane is None else (lane,)
+        return sum(len(queue) for name in lanes for queue in self._waiting[name].values())
+
+    def retry_after(self, lane: str = INTERACTIVE) -> int:
+        """
+        Estimate when a slot in a lane becomes free.
+
+        Args:
+            lane: Lane of the rejected job
+
+        Returns:
+            Seconds until the lane is expected to have room (at least 1)
+        """
+        waiting = self.queued(lane) + 1
+        return max(1, math.ceil(self._run_estimate * waiting / self.workers))
+
+    async def run(self, fn: Callable, *args, user: str = DEFAULT_USER,
+                  lane: str = INTERACTIVE) -> Tuple[Any, Dict[str, float]]:
+        """
+        Run a job in a worker process without blocking the event loop.
+
+        Args:
+            fn: Picklable module-level function
+            *args: Picklable arguments of fn
+            user: User the job is scheduled for
+            lane: INTERACTIVE or BULK
+
+        Returns:
+            Tuple (result of fn, timings with 'wait_seconds' and 'run_seconds')
+
+        Raises:
+            PoolBusy: If all workers are busy and the lane is full
+        """
+        if lane not in LANES:
+            raise ValueError(f"Unknown lane: {lane}")
+        submitted = time.time()
+        await self._acquire(user, lane)
+
+        try:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            executor = self._executor
+            future = executor.submit(_timed_call, fn, args)
+        except BaseException:
+            self._release()
+            raise
+        # The worker stays busy until the job ends, even if the request awaiting it is
+        # cancelled (e.g. the client disconnected) - only then is the slot handed on
+        loop = asyncio.get_running_loop()
+        future.add_done_callback(lambda _: self._job_done(loop))
+
+        try:
+            result, started, finished = await asyncio.wrap_future(future)
+        except BrokenProcessPool:
+            # A worker died (e.g. out of memory) - start fresh processes for the next job
+            if self._executor is executor:
+                self._executor = None
+            executor.shutdown(wait=False)
+            raise
+
+        run_seconds = finished - started
+        wait_seconds = max(0.0, started - submitted)
+        self._run_estimate += RUN_ESTIMATE_WEIGHT * (run_seconds - self._run_estimate)
+        self._waits[lane].append(wait_seconds)
+        self.completed += 1
+        return result, {
+            "wait_seconds": round(wait_seconds, 3),
+            "run_seconds": round(run_seconds, 3),
+        }
+
+    async def _acquire(self, user: str, lane: str) -> None:
+        if self._running < self.workers and not self.queued():
+            self._running += 1
+            return
+        if self.queued(lane) >= self.lane_capacity(lane):
+            self.rejected += 1
+            raise PoolBusy(self.retry_after(lane))
+
+        waiter = asyncio.get_running_loop().create_future()
+        queue = self._waiting[lane].setdefault(user, deque())
+        queue.append(waiter)
+        try:
+            await waiter        # Resolved by _release when a worker is handed to this job
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._release()     # Worker handed over just before the request was cancelled
+            else:
+                queue.remove(waiter)
+                if not queue and self._waiting[lane].get(user) is queue:
+                    del self._waiting[lane][user]
+            raise
+
+    def _job_done(self, loop: asyncio.AbstractEventLoop) -> None:
+        # Executor thread: release the worker on the event loop
+        try:
+            loop.call_soon_threadsafe(self._release)
+        except RuntimeError:
+            self._release()     # Event loop already closed - nothing else runs on it
+
+    def _release(self) -> None:
+        self._running -= 1
+        while self._running < self.workers:
+            lanes = [lane for lane in LANES if self._waiting[lane]]
+            if not lanes:
+                return
+            lane = self._lane_rr.pick(lanes)
+            users = self._waiting[lane]
+            user = self._user_rr[lane].pick(users)
+            waiter = users[user].popleft()
+            if not users[user]:
+                del users[user]
+            if not waiter.done():
+                self._running += 1
+                waiter.set_result(None)
+
+    def stats(self) -> Dict:
+        """
+        Get pool usage.
+
+        Returns:
+            Dictionary with pool size, running and queued jobs, counters and
+            per lane the waiting jobs and users and the queue wait percentiles
+        """
+        lanes = {}
+        for lane in LANES:
+            waits = sorted(self._waits[lane])
+            lanes[lane] = {
+                "queued": self.queued(lane),
+                "users": len(self._waiting[lane]),
+                "samples": len(waits),
+                **{f"wait_p{p}_seconds": percentile(waits, p) for p in (50, 90, 99)},
+            }
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "bulk_queue": self.bulk_queue,
+            "running": self._running,
+            "queued": self.queued(),
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "run_estimate_seconds": round(self._run_estimate, 3),
+            "lanes": lanes,
+        }
+
+    def shutdown(self) -> None:
+        """Stop the worker processes."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,247 @@
+"""
+Result cache for processed invoices
+
+Two tiers: an in-memory LRU and a size-capped directory on disk, both
+evicting least recently used entries to stay within a byte budget. Entries
+are keyed by the SHA-256 of the uploaded PDF, the output style, the
+importer data version, the processing code version and the version of the
+learned layout templates, so a changed CSV, a code update or newly learned
+templates never serve stale results.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+# Cache location and byte budgets (override with environment variables;
+# DATA_DIR is the base directory of all server files, see job_queue.py)
+DATA_DIR = Path(os.getenv("DATA_DIR", tempfile.gettempdir()))
+RESULT_CACHE_DIR = Path(os.getenv("RESULT_CACHE_DIR", DATA_DIR / "pp_vat_result_cache"))
+RESULT_CACHE_MEMORY_BYTES = int(os.getenv("RESULT_CACHE_MEMORY_MB", "64")) * 1024 * 1024
+RESULT_CACHE_DISK_BYTES = int(os.getenv("RESULT_CACHE_DISK_MB", "512")) * 1024 * 1024
+
+# Cached result: (metadata dict, output PDF per style)
+CachedResult = Tuple[Dict, Dict[str, bytes]]
+
+
+def source_version(paths: Iterable[Path]) -> str:
+    """
+    Hash the source files of the processing code.
+
+    Args:
+        paths: Source files whose content determines the output
+
+    Returns:
+        Hex digest that changes whenever one of the files changes
+    """
+    digest = hashlib.sha256()
+    for path in sorted(Path(p) for p in paths):
+        digest.update(path.name.encode())
+        digest.update(path.read_bytes())
+    return digest.hexdigest()[:16]
+
+
+class ResultCache:
+    """
+    Two-tier LRU cache of processing results.
+
+    Hits in the disk tier are promoted to memory. Each tier evicts least
+    recently used entries once its byte budget is exceeded; entries larger
+    than a tier's budget are not stored in that tier.
+    """
+
+    def __init__(self, cache_dir: Path = RESULT_CACHE_DIR,
+                 memory_budget: int = RESULT_CACHE_MEMORY_BYTES,
+                 disk_budget: int = RESULT_CACHE_DISK_BYTES):
+        """
+        Initialize the cache and index the entries already on disk.
+
+        Args:
+            cache_dir: Directory of the disk tier (created if missing)
+            memory_budget: Maximum bytes of output PDFs held in memory
+            disk_budget: Maximum bytes of files in the disk tier
+        """
+        self.cache_dir = Path(cache_dir)
+        self.memory_budget = memory_budget
+        self.disk_budget = disk_budget
+        self._memory: "OrderedDict[str, Tuple[CachedResult, int]]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk: "OrderedDict[str, int]" = OrderedDict()  # key -> bytes on disk, oldest first
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = {"memory": 0, "disk": 0}
+        self.misses = 0
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        entries = []
+        for meta_path in self.cache_dir.glob("*.json"):
+            key = meta_path.stem
+            files = [meta_path, *self.cache_dir.glob(f"{key}.*.pdf")]
+            entries.append((meta_path.stat().st_mtime, key, sum(f.stat().st_size for f in files)))
+        # Leftovers of interrupted writes
+        keys = {key for _, key, _ in entries}
+        for path in [*self.cache_dir.glob("*.tmp"), *self.cache_dir.glob("*.pdf")]:
+            if path.suffix == ".tmp" or path.name.split(".", 1)[0] not in keys:
+                path.unlink(missing_ok=True)
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+        self._evict_disk()
+
+    @staticmethod
+    def make_key(pdf_bytes, output_style: str, data_version: str, code_version: str,
+                 template_version: str = "none") -> str:
+        """
+        Build the cache key of a processing request.
+
+        Hashes the whole upload - call it outside the event loop for large
+        uploads.
+
+        Args:
+            pdf_bytes: Uploaded PDF (bytes or memoryview)
+            output_style: Requested output style
+            data_version: Version of the importer reference data
+            code_version: Version of the processing code
+            template_version: Version of the learned layout templates
+
+        Returns:
+            Hex digest usable as a file name
+        """
+        digest = hashlib.sha256(pdf_bytes).hexdigest()
+        return hashlib.sha256(
+            f"{digest}|{output_style}|{data_version}|{code_version}|{template_version}".encode()
+        ).hexdigest()
+
+    def get(self, key: str) -> Optional[CachedResult]:
+        """
+        Look up a result, promoting disk hits to memory.
+
+        Args:
+            key: Key from make_key
+
+        Returns:
+            (metadata, output PDF per style), or None on a miss
+        """
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self.hits["memory"] += 1
+                return entry[0]
+
+            if key not in self._disk:
+                self.misses += 1
+                return None
+            try:
+                result = self._read_disk(key)
+            except (OSError, ValueError, KeyError):
+                # Incomplete or removed behind our back - forget it
+                self._remove_disk(key)
+                self.misses += 1
+                return None
+            self._disk.move_to_end(key)
+            os.utime(self._meta_path(key))
+            self.hits["disk"] += 1
+            self._put_memory(key, result)
+            return result
+
+    def put(self, key: str, metadata: Dict, outputs: Dict[str, bytes]) -> None:
+        """
+        Store a result in both tiers.
+
+        Args:
+            key: Key from make_key
+            metadata: JSON serializable result metadata
+            outputs: Output PDF per style
+        """
+        result = (dict(metadata), {style: bytes(pdf) for style, pdf in outputs.items()})
+        with self._lock:
+            self._put_memory(key, result)
+            self._put_disk(key, result)
+
+    def stats(self) -> Dict:
+        """
+        Get cache usage.
+
+        Returns:
+            Dictionary with entry counts, bytes per tier, hits and misses
+        """
+        with self._lock:
+            return {
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_bytes,
+                "hits": dict(self.hits),
+                "misses": self.misses,
+            }
+
+    # Memory tier
+
+    def _put_memory(self, key: str, result: CachedResult) -> None:
+        size = sum(len(pdf) for pdf in result[1].values())
+        if size > self.memory_budget:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= old[1]
+        self._memory[key] = (result, size)
+        self._memory_bytes += size
+        while self._memory_bytes > self.memory_budget:
+            _, (_, evicted_size) = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted_size
+
+    # Disk tier
+
+    def _meta_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+
+    def _pdf_path(self, key: str, style: str) -> Path:
+        return self.cache_dir / f"{key}.{style}.pdf"
+
+    def _read_disk(self, key: str) -> CachedResult:
+        entry = json.loads(self._meta_path(key).read_text(encoding="utf-8"))
+        outputs = {style: self._pdf_path(key, style).read_bytes() for style in entry["styles"]}
+        return entry["metadata"], outputs
+
+    def _put_disk(self, key: str, result: CachedResult) -> None:
+        metadata, outputs = result
+        meta = json.dumps({"metadata": metadata, "styles": list(outputs)}).encode("utf-8")
+        size = len(meta) + sum(len(pdf) for pdf in outputs.values())
+        if size > self.disk_budget:
+            return
+        self._remove_disk(key)
+        try:
+            # PDFs first, metadata last - an entry only counts once its .json exists
+            for style, pdf in outputs.items():
+                self._write_atomic(self._pdf_path(key, style), pdf)
+            self._write_atomic(self._meta_path(key), meta)
+        except OSError as e:
+            print(f"[WARNING] Could not write result cache entry: {e}")
+            self._remove_disk(key)
+            return
+        self._disk[key] = size
+        self._disk_bytes += size
+        self._evict_disk()
+
+    def _write_atomic(self, path: Path, data: bytes) -> None:
+        tmp_path = path.with_name(path.name + ".tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+
+    def _remove_disk(self, key: str) -> None:
+        self._disk_bytes -= self._disk.pop(key, 0)
+        for path in [self._meta_path(key), *self.cache_dir.glob(f"{key}.*.pdf")]:
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+    def _evict_disk(self) -> None:
+        while self._disk_bytes > self.disk_budget and self._disk:
+            self._remove_disk(next(iter(self._disk)))
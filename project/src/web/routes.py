@@ -3,14 +3,19 @@ API routes for PP_VAT web application
 """
 
 from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Form, Request
-from fastapi.responses import FileResponse, HTMLResponse, RedirectResponse, JSONResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, Response, FileResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from pathlib import Path
+from pathlib import Path, PurePosixPath
+import asyncio
+import os
 import sys
-import tempfile
 import secrets
+import tempfile
+import time
+import zipfile
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Iterator, List, Optional
+from urllib.parse import quote
 import hashlib
 
 # Add parent directories to path for imports
@@ -21,6 +26,9 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 from .auth import create_access_token, decode_access_token, verify_password
 from .database import get_user, create_user, list_users
 from .models import HealthResponse, UserInfo
+from .result_cache import ResultCache, source_version
+from .processing_pool import BULK, DEFAULT_USER, INTERACTIVE, PoolBusy, ProcessingPool
+from .job_queue import DATA_DIR, JobQueue, JobRunner
 
 # Initialize router
 router = APIRouter()
@@ -32,6 +40,46 @@ sessions = {}
 # Processed files storage with expiration
 processed_files = {}
 
+# Batch uploads: batch token -> download tokens of its files, with expiration
+processed_batches = {}
+
+# Processed batch files are kept on disk here instead of in memory
+PROCESSED_FILES_DIR = Path(os.getenv("PROCESSED_FILES_DIR", DATA_DIR / "pp_vat_downloads"))
+
+# Time a processed file stays downloadable
+DOWNLOAD_LIFETIME = timedelta(hours=1)
+
+# Uploads of at least this size are memory-mapped instead of read into memory
+# (the server spools uploads above 1 MB to disk)
+MAP_UPLOAD_MIN_BYTES = int(os.getenv("MAP_UPLOAD_MIN_MB", "1")) * 1024 * 1024
+
+# Bytes read at a time when streaming a download
+DOWNLOAD_CHUNK_BYTES = 1024 * 1024
+
+# Files accepted per batch upload, and largest PDF taken from a ZIP archive
+MAX_BATCH_FILES = int(os.getenv("MAX_BATCH_FILES", "500"))
+MAX_BATCH_MEMBER_BYTES = int(os.getenv("MAX_BATCH_MEMBER_MB", "100")) * 1024 * 1024
+
+# Results of earlier uploads, keyed by content hash (memory and disk tiers)
+result_cache = ResultCache()
+
+# Worker processes for invoice processing - keeps the event loop free
+processing_pool = ProcessingPool()
+
+# Durable queue of asynchronous jobs (/api/jobs), run in the same pool
+job_queue = JobQueue()
+job_runner = JobRunner(job_queue, processing_pool)
+
+# Layout templates learned by the workers are kept next to the job queue, so they
+# survive restarts and recreated worker processes (read by src/main.py on import)
+os.environ.setdefault("LAYOUT_TEMPLATES_FILE", str(job_queue.queue_dir / "layout_templates.json"))
+
+# Output styles accepted by the processing endpoints
+PROCESS_STYLES = ("review", "download", "both", "layered")
+
+# Version of the processing code, computed on first use
+_code_version = None
+
 
 def get_current_user(token: str = Depends(security)) -> str:
     """
@@ -53,6 +101,27 @@ def get_current_user(token: str = Depends(security)) -> str:
     return payload.get("sub")
 
 
+def request_user(request: Request) -> str:
+    """
+    Identify the user of a request for scheduling.
+    
+    Args:
+        request: Incoming request
+        
+    Returns:
+        str: Username from the session cookie or bearer token, else the client address
+    """
+    session = sessions.get(request.cookies.get("session_id"))
+    if session:
+        return session["username"]
+    authorization = request.headers.get("authorization", "")
+    if authorization.lower().startswith("bearer "):
+        payload = decode_access_token(authorization[7:])
+        if payload and payload.get("sub"):
+            return payload["sub"]
+    return request.client.host if request.client else DEFAULT_USER
+
+
 @router.get("/", response_class=HTMLResponse)
 async def index():
     """Serve the login page"""
@@ -189,96 +258,583 @@ async def get_current_user_info(request: Request) -> UserInfo:
 
 
 @router.post("/api/process")
-async def process_pdf(file: UploadFile = File(...), style: Optional[str] = Form("review")):
+async def process_pdf(request: Request, file: UploadFile = File(...), style: Optional[str] = Form("review")):
     """
     Process PDF invoice: detect VAT and remove from prices.
     
     Args:
         file: PDF file to process
-        style: Output style - "review" (yellow) or "download" (white)
+        style: Output style - "review" (yellow), "download" (white), "both", or
+            "layered" (one PDF with both highlight fills on switchable layers)
         
     Returns:
-        JSON response with metadata and download URL
+        JSON response with metadata and download URL. "downloads" holds the
+        token and URL of every rendered style; the top-level fields refer to
+        the first one.
     """
-    # Validate file type (case-insensitive)
-    if not file.filename or not file.filename.lower().endswith('.pdf'):
-        raise HTTPException(
-            status_code=400,
-            detail="Only PDF files are supported"
-        )
+    require_pdf_upload(file)
+    load_processing()
     
-    # Import processing logic
-    # Add project/src to path for imports
-    sys.path.insert(0, str(PROJECT_ROOT / "project" / "src"))
-    
-    try:
-        # Import process_invoice from main.py
-        from main import process_invoice
-    except ImportError as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Processing module not found: {str(e)}"
-        )
-    
-    # Create temporary input file
-    with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as tmp:
-        content = await file.read()
-        tmp.write(content)
-        input_path = Path(tmp.name)
+    # Uploads are processed in memory - no temporary files of our own
+    content = await read_upload(file)
     
     try:
         # Validate style parameter
-        if style not in ["review", "download"]:
+        if style not in PROCESS_STYLES:
             style = "review"
         
-        # Process PDF with specified style
-        result = process_invoice(input_path, "_corrected", style)
+        try:
+            result, timings, cached = await process_content(
+                content, file.filename, style, request_user(request), INTERACTIVE
+            )
+        except PoolBusy as e:
+            raise HTTPException(
+                status_code=503,
+                detail=str(e),
+                headers={"Retry-After": str(e.retry_after)}
+            )
         
-        if not result or not result.get('output_path') or not result['output_path'].exists():
+        if not result or not result.get('output_bytes'):
             raise HTTPException(
                 status_code=500,
                 detail="Failed to process PDF. VAT may not be detected."
             )
         
-        output_path = result['output_path']
-        
-        # Generate download token
-        file_hash = hashlib.md5(file.filename.encode()).hexdigest()[:8]
-        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        download_token = f"{file_hash}_{timestamp}"
+        # Drop expired results before storing new ones
+        purge_expired_files()
         
-        # Store file info for download
-        processed_files[download_token] = {
-            "path": output_path,
-            "original_filename": file.filename,
-            "expires_at": datetime.now() + timedelta(hours=1)
-        }
+        # Generate download token per rendered style
+        downloads = store_downloads(file.filename, result['output_bytes'], style)
+        first = next(iter(downloads.values()))
         
-        # Return metadata with download link
+        # Return metadata with download links
         return JSONResponse(content={
             "status": "success",
-            "detected_vat": result.get('detected_vat'),
-            "country_code": result.get('country_code'),
-            "country_name": result.get('country_name'),
-            "prior_total_value": result.get('prior_total'),
-            "corrected_total_value": result.get('corrected_total'),
-            "prices_updated": result.get('prices_count', 0),
-            "download_token": download_token,
-            "download_url": f"/api/download/{download_token}"
+            **result_summary(result),
+            "download_token": first["download_token"],
+            "download_url": first["download_url"],
+            "downloads": downloads,
+            "cached": cached,
+            "timings": timings
         })
     
     except HTTPException:
         raise
     except Exception as e:
-        # Cleanup on error
-        if input_path.exists():
-            input_path.unlink()
         raise HTTPException(
             status_code=500,
             detail=f"Processing error: {str(e)}"
         )
 
 
+@router.post("/api/process/batch")
+async def process_pdf_batch(request: Request, files: List[UploadFile] = File(...),
+                            style: Optional[str] = Form("review")):
+    """
+    Process many PDF invoices in one request.
+    
+    Accepts PDFs and ZIP archives of PDFs. The files are processed in
+    parallel in the bulk lane of the processing pool; a file that fails does
+    not fail the batch.
+    
+    Args:
+        files: PDF files and/or ZIP archives
+        style: Output style, as for /api/process
+        
+    Returns:
+        JSON response with per-file metadata and download links, and one
+        batch token to download all processed files at once
+    """
+    load_processing()
+    if style not in PROCESS_STYLES:
+        style = "review"
+    
+    items = collect_batch_items(files)
+    if not items:
+        raise HTTPException(status_code=400, detail="No PDF files in upload")
+    if len(items) > MAX_BATCH_FILES:
+        raise HTTPException(status_code=400, detail=f"Too many files: {len(items)} (at most {MAX_BATCH_FILES})")
+    
+    user = request_user(request)
+    # Files of this batch waiting or running in the pool
+    slots = asyncio.Semaphore(processing_pool.workers + processing_pool.bulk_queue)
+    
+    async def process_item(filename, load, error):
+        entry = {"filename": filename}
+        if error:
+            entry.update(status="error", error=error)
+            return entry
+        async with slots:
+            try:
+                content = await load()
+                while True:
+                    try:
+                        result, timings, cached = await process_content(content, filename, style, user, BULK)
+                        break
+                    except PoolBusy as e:
+                        # Other batches fill the lane - wait instead of failing the file
+                        await asyncio.sleep(e.retry_after)
+            except Exception as e:
+                entry.update(status="error", error=f"Processing error: {str(e)}")
+                return entry
+        if not result or not result.get('output_bytes'):
+            entry.update(status="error", error="Failed to process PDF. VAT may not be detected.")
+            return entry
+        entry.update(
+            status="success",
+            **result_summary(result),
+            downloads=store_downloads(filename, result['output_bytes'], style, on_disk=True),
+            cached=cached,
+            timings=timings
+        )
+        return entry
+    
+    # Drop expired results before storing new ones
+    purge_expired_files()
+    print(f"[INFO] Processing batch of {len(items)} files for {user} ({style})")
+    entries = await asyncio.gather(*(process_item(*item) for item in items))
+    
+    succeeded = [entry for entry in entries if entry["status"] == "success"]
+    content = {
+        "status": "success" if len(succeeded) == len(entries) else ("partial" if succeeded else "error"),
+        "processed": len(succeeded),
+        "failed": len(entries) - len(succeeded),
+        "files": entries,
+    }
+    if succeeded:
+        batch_token = f"batch_{datetime.now().strftime('%Y%m%d%H%M%S')}_{secrets.token_hex(8)}"
+        processed_batches[batch_token] = {
+            "download_tokens": [download["download_token"]
+                                for entry in succeeded for download in entry["downloads"].values()],
+            "expires_at": datetime.now() + DOWNLOAD_LIFETIME
+        }
+        content["batch_token"] = batch_token
+        content["batch_download_url"] = f"/api/download/batch/{batch_token}"
+    print(f"[SUCCESS] Batch done: {len(succeeded)} processed, {len(entries) - len(succeeded)} failed")
+    return JSONResponse(content=content)
+
+
+def collect_batch_items(files: List[UploadFile]) -> list:
+    """
+    List the PDFs of a batch upload, unpacking ZIP archives.
+    
+    Args:
+        files: Uploaded PDF files and ZIP archives
+        
+    Returns:
+        list: (filename, async loader of the PDF content, error message or None)
+    """
+    items = []
+    for file in files:
+        name = file.filename or ""
+        if name.lower().endswith('.pdf'):
+            items.append((name, lambda file=file: read_upload(file), None))
+        elif name.lower().endswith('.zip'):
+            try:
+                archive = zipfile.ZipFile(file.file)
+            except zipfile.BadZipFile:
+                items.append((name, None, "Not a valid ZIP archive"))
+                continue
+            for info in archive.infolist():
+                member_name = PurePosixPath(info.filename).name
+                if info.is_dir() or not member_name.lower().endswith('.pdf'):
+                    continue
+                if info.file_size > MAX_BATCH_MEMBER_BYTES:
+                    items.append((member_name, None, "File too large"))
+                    continue
+                
+                async def load(archive=archive, info=info):
+                    # Decompressing can take a while - keep it off the event loop
+                    return await asyncio.to_thread(archive.read, info)
+                items.append((member_name, load, None))
+        else:
+            items.append((name, None, "Only PDF and ZIP files are supported"))
+    return items
+
+
+def load_processing():
+    """
+    Import the invoice processing module (src/main.py).
+    
+    Returns:
+        module: The main module
+        
+    Raises:
+        HTTPException: 500 if it cannot be imported
+    """
+    # Add project/src to path for imports
+    sys.path.insert(0, str(PROJECT_ROOT / "project" / "src"))
+    
+    try:
+        import main
+    except ImportError as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Processing module not found: {str(e)}"
+        )
+    return main
+
+
+def write_temp_pdf(content) -> Path:
+    """
+    Write PDF content to a named temporary file.
+    
+    Args:
+        content: PDF content (bytes or memoryview)
+        
+    Returns:
+        Path: Temporary file, removed by the caller
+    """
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as temp_file:
+        temp_file.write(content)
+    return Path(temp_file.name)
+
+
+def result_cache_key(main, content, style: str) -> str:
+    """
+    Result cache key of an upload (hashes the whole upload and stats the data files).
+    
+    Args:
+        main: The main module
+        content: PDF content (bytes or memoryview)
+        style: Output style
+        
+    Returns:
+        str: Key from ResultCache.make_key
+    """
+    return result_cache.make_key(content, style, main.REFERENCE_DATA.version, get_code_version(),
+                                 main.LAYOUT_TEMPLATES.version)
+
+
+async def process_content(content, filename: str, style: str, user: str, lane: str):
+    """
+    Process an uploaded PDF in the processing pool, reusing cached results.
+    
+    Args:
+        content: PDF content (bytes or memoryview)
+        filename: Original file name (for log output)
+        style: Output style
+        user: User the job is scheduled for
+        lane: Scheduler lane (INTERACTIVE or BULK)
+        
+    Returns:
+        tuple: (result of process_invoice_bytes or None, timings, True if cached)
+        
+    Raises:
+        PoolBusy: If the lane of the processing pool is full
+    """
+    main = load_processing()
+    
+    # Same PDF, style, importer data, code and layout templates as before - reuse the result.
+    # Hashing the upload and the disk tier run in threads to keep the event loop free
+    cache_key = await asyncio.to_thread(result_cache_key, main, content, style)
+    cached = await asyncio.to_thread(result_cache.get, cache_key)
+    if cached is not None:
+        metadata, output_bytes = cached
+        print(f"[INFO] Result cache hit for {filename} ({style})")
+        return dict(metadata, output_bytes=output_bytes), {"wait_seconds": 0.0, "run_seconds": 0.0}, True
+    
+    # Process PDF with specified style - "both" renders both files from one analysis.
+    # Runs in a worker process: small uploads are passed as bytes, large (mapped) uploads
+    # are written to a file the worker maps, so they are never copied into the call
+    if isinstance(content, memoryview):
+        upload_path = await asyncio.to_thread(write_temp_pdf, content)
+        try:
+            result, timings = await processing_pool.run(
+                main.process_invoice_mapped, str(upload_path), style, user=user, lane=lane
+            )
+        finally:
+            upload_path.unlink(missing_ok=True)
+    else:
+        result, timings = await processing_pool.run(
+            main.process_invoice_bytes, content, style, user=user, lane=lane
+        )
+    print(f"[INFO] Processed {filename} (waited {timings['wait_seconds']:.2f} s, "
+          f"ran {timings['run_seconds']:.2f} s)")
+    
+    if result and result.get('output_bytes'):
+        metadata = {k: v for k, v in result.items() if k not in ('output_bytes', 'output_paths', 'output_path')}
+        await asyncio.to_thread(result_cache.put, cache_key, metadata, result['output_bytes'])
+    return result, timings, False
+
+
+def store_downloads(filename: str, outputs: dict, style: str, on_disk: bool = False) -> dict:
+    """
+    Store processed PDFs for download and create their tokens.
+    
+    Args:
+        filename: Original file name
+        outputs: Output PDF per rendered style
+        style: Requested output style
+        on_disk: Keep the PDFs in PROCESSED_FILES_DIR instead of in memory
+            (batches, which can be larger than the available memory)
+        
+    Returns:
+        dict: Rendered style -> {"download_token", "download_url"}
+    """
+    file_hash = hashlib.md5(filename.encode()).hexdigest()[:8]
+    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+    downloads = {}
+    for output_style, output_bytes in outputs.items():
+        download_token = f"{file_hash}_{timestamp}_{secrets.token_hex(4)}"
+        if style == "both":
+            download_token += f"_{output_style}"
+        
+        # Store file content for download
+        file_info = {
+            "original_filename": filename,
+            "style": output_style,
+            "styles": list(outputs),
+            "expires_at": datetime.now() + DOWNLOAD_LIFETIME
+        }
+        if on_disk:
+            PROCESSED_FILES_DIR.mkdir(parents=True, exist_ok=True)
+            path = PROCESSED_FILES_DIR / f"{download_token}.pdf"
+            path.write_bytes(output_bytes)
+            file_info["path"] = str(path)
+        else:
+            file_info["content"] = output_bytes
+        processed_files[download_token] = file_info
+        downloads[output_style] = {
+            "download_token": download_token,
+            "download_url": f"/api/download/{download_token}"
+        }
+    return downloads
+
+
+def require_pdf_upload(file: UploadFile):
+    """
+    Reject uploads that are not PDF files.
+    
+    Args:
+        file: Uploaded file
+        
+    Raises:
+        HTTPException: 400 if the file name does not end with .pdf (any case)
+    """
+    if not file.filename or not file.filename.lower().endswith('.pdf'):
+        raise HTTPException(
+            status_code=400,
+            detail="Only PDF files are supported"
+        )
+
+
+def result_summary(result: dict) -> dict:
+    """
+    Response fields describing a processing result.
+    
+    Args:
+        result: Result or result metadata of process_invoice_bytes
+        
+    Returns:
+        dict: VAT, country, totals and number of updated prices
+    """
+    return {
+        "detected_vat": result.get('detected_vat'),
+        "country_code": result.get('country_code'),
+        "country_name": result.get('country_name'),
+        "prior_total_value": result.get('prior_total'),
+        "corrected_total_value": result.get('corrected_total'),
+        "prices_updated": result.get('prices_count', 0),
+    }
+
+
+@router.post("/api/jobs", status_code=202)
+async def submit_job(request: Request, file: UploadFile = File(...), style: Optional[str] = Form("review")):
+    """
+    Queue a PDF invoice for processing and return at once.
+    
+    The job survives server restarts; poll its status URL until it is
+    "done" or "failed", then fetch the result.
+    
+    Args:
+        file: PDF file to process
+        style: Output style, as for /api/process
+        
+    Returns:
+        JSON response with job ID, status URL and result URL
+    """
+    require_pdf_upload(file)
+    if style not in PROCESS_STYLES:
+        style = "review"
+    
+    content = await read_upload(file)
+    job_id = await asyncio.to_thread(job_queue.submit, content, file.filename, style, owner=request_user(request))
+    job_runner.notify()
+    print(f"[INFO] Queued job {job_id} for {file.filename} ({style})")
+    return JSONResponse(status_code=202, content={
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": f"/api/jobs/{job_id}",
+        "result_url": f"/api/jobs/{job_id}/result"
+    })
+
+
+@router.get("/api/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    """
+    Get the status of a job and, once done, its result metadata.
+    
+    Args:
+        job_id: Job ID from /api/jobs
+        
+    Returns:
+        JSON with status ("queued", "running", "done" or "failed"), attempts,
+        timestamps and, for finished jobs, the result and download URLs
+    """
+    job = await asyncio.to_thread(job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    
+    def timestamp(value):
+        return datetime.fromtimestamp(value).isoformat() if value else None
+    
+    content = {
+        "job_id": job_id,
+        "status": job["status"],
+        "filename": job["filename"],
+        "style": job["style"],
+        "attempts": job["attempts"],
+        "created_at": timestamp(job["created_at"]),
+        "started_at": timestamp(job["started_at"]),
+        "finished_at": timestamp(job["finished_at"]),
+        "error": job["error"],
+    }
+    if job["status"] == "queued":
+        content["queue_position"] = job["queue_position"]
+    if job["status"] == "done":
+        content.update(result_summary(job["metadata"]))
+        content["timings"] = job["metadata"].get("timings")
+        content["downloads"] = {
+            output_style: {"download_url": f"/api/jobs/{job_id}/result?style={output_style}"}
+            for output_style in job["styles"]
+        }
+    return content
+
+
+@router.get("/api/jobs/{job_id}/result")
+async def get_job_result(job_id: str, style: Optional[str] = None):
+    """
+    Download the processed PDF of a finished job.
+    
+    Args:
+        job_id: Job ID from /api/jobs
+        style: Output style to download (default: the first rendered one)
+        
+    Returns:
+        Processed PDF
+    """
+    job = await asyncio.to_thread(job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    if job["status"] != "done":
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}" +
+                            (f": {job['error']}" if job["status"] == "failed" else ""))
+    
+    style = style or job["styles"][0]
+    path = job_queue.output_path(job_id, style)
+    if style not in job["styles"] or not path.exists():
+        raise HTTPException(status_code=404, detail=f"No {style} output for this job")
+    return FileResponse(
+        path,
+        media_type='application/pdf',
+        filename=corrected_filename(job['filename'], style if len(job['styles']) > 1 else None)
+    )
+
+
+@router.get("/api/stats")
+async def get_processing_stats():
+    """
+    Processing pool, result cache and job queue usage.
+    
+    Returns:
+        JSON with "processing_pool", "result_cache" and "jobs" statistics
+    """
+    return {
+        "processing_pool": processing_pool.stats(),
+        "result_cache": result_cache.stats(),
+        "jobs": await asyncio.to_thread(job_queue.stats),
+    }
+
+
+def get_code_version() -> str:
+    """
+    Version of the invoice processing code used in result cache keys.
+    
+    Returns:
+        Hash of src/main.py and the core modules in docs/core
+    """
+    global _code_version
+    if _code_version is None:
+        src_dir = PROJECT_ROOT / "project" / "src"
+        core_dir = PROJECT_ROOT / "project" / "docs" / "core"
+        _code_version = source_version([src_dir / "main.py", *core_dir.glob("*.py")])
+    return _code_version
+
+
+async def read_upload(file: UploadFile):
+    """
+    Get the content of an uploaded file without copying large uploads.
+    
+    Uploads of at least MAP_UPLOAD_MIN_BYTES are memory-mapped instead of
+    read into memory; the server has already spooled those to disk.
+    
+    Args:
+        file: Uploaded file
+        
+    Returns:
+        bytes, or a read-only memoryview of the spooled upload
+    """
+    size = file.size
+    if size is None:
+        size = file.file.seek(0, os.SEEK_END)
+        file.file.seek(0)
+    if size >= MAP_UPLOAD_MIN_BYTES:
+        try:
+            from main import PDFUtils
+            return PDFUtils.map_pdf(file.file)
+        except (OSError, ValueError, AttributeError):
+            pass  # Not backed by a file descriptor (or empty) - read instead
+    return await file.read()
+
+
+def purge_expired_files():
+    """Remove expired entries from processed_files and processed_batches."""
+    now = datetime.now()
+    for token in [t for t, info in processed_files.items() if now > info["expires_at"]]:
+        info = processed_files.pop(token)
+        if "path" in info:
+            Path(info["path"]).unlink(missing_ok=True)
+    for token in [t for t, info in processed_batches.items() if now > info["expires_at"]]:
+        del processed_batches[token]
+
+
+def remove_orphan_files() -> int:
+    """
+    Remove download and job files that nothing refers to any more.
+    
+    Download tokens live in memory, so after a restart the files of the
+    previous run can no longer be fetched. Only files older than their
+    lifetime are removed, in case another server shares the directory.
+    
+    Returns:
+        Number of files removed
+    """
+    cutoff = time.time() - DOWNLOAD_LIFETIME.total_seconds()
+    referenced = {info["path"] for info in processed_files.values() if "path" in info}
+    removed = 0
+    for path in PROCESSED_FILES_DIR.glob("*.pdf"):
+        if str(path) in referenced:
+            continue
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+                removed += 1
+        except FileNotFoundError:
+            pass
+    return removed + job_queue.remove_orphans()
+
+
 @router.get("/api/download/{token}")
 async def download_processed_pdf(token: str):
     """
@@ -288,7 +844,7 @@ async def download_processed_pdf(token: str):
         token: Download token
         
     Returns:
-        FileResponse with processed PDF
+        Response with processed PDF
     """
     if token not in processed_files:
         raise HTTPException(status_code=404, detail="File not found or expired")
@@ -300,10 +856,168 @@ async def download_processed_pdf(token: str):
         del processed_files[token]
         raise HTTPException(status_code=410, detail="Download link expired")
     
-    # Return file
-    return FileResponse(
-        path=str(file_info["path"]),
+    # Several styles of one upload must not overwrite each other on the user's disk
+    several_styles = len(file_info.get("styles", ())) > 1
+    filename = corrected_filename(file_info['original_filename'], file_info["style"] if several_styles else None)
+    if "path" in file_info:
+        return FileResponse(file_info["path"], media_type='application/pdf', filename=filename)
+    
+    # Return file content - filename encoded like FileResponse does
+    quoted_filename = quote(filename)
+    if quoted_filename != filename:
+        content_disposition = f"attachment; filename*=utf-8''{quoted_filename}"
+    else:
+        content_disposition = f'attachment; filename="{filename}"'
+    return Response(
+        content=file_info["content"],
         media_type='application/pdf',
-        filename=f"{Path(file_info['original_filename']).stem}_corrected.pdf"
+        headers={"Content-Disposition": content_disposition}
+    )
+
+
+
+@router.get("/api/download/batch/{token}")
+async def download_batch(token: str):
+    """
+    Download all processed PDFs of a batch as one ZIP archive.
+    
+    The archive is streamed: it is written while the files are read, one
+    chunk at a time, and never held in memory or in a temporary file.
+    
+    Args:
+        token: Batch token from /api/process/batch
+        
+    Returns:
+        StreamingResponse with the ZIP archive
+    """
+    batch = processed_batches.get(token)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Batch not found or expired")
+    if datetime.now() > batch["expires_at"]:
+        del processed_batches[token]
+        raise HTTPException(status_code=410, detail="Download link expired")
+    
+    files = [processed_files[t] for t in batch["download_tokens"]
+             if t in processed_files and ("path" not in processed_files[t] or Path(processed_files[t]["path"]).exists())]
+    if not files:
+        raise HTTPException(status_code=410, detail="Download link expired")
+    
+    return StreamingResponse(
+        stream_zip(list(zip(batch_archive_names(files), files))),
+        media_type='application/zip',
+        headers={"Content-Disposition": f'attachment; filename="{token}.zip"'}
     )
 
+
+class ZipStreamWriter:
+    """Write target of a ZipFile that collects the written bytes until they are taken."""
+    
+    def __init__(self):
+        self._chunks = []
+    
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+    
+    def flush(self):
+        pass
+    
+    def take(self) -> bytes:
+        """Return and forget the bytes written since the last call."""
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def iter_file_chunks(file_info: dict) -> Iterator[bytes]:
+    """
+    Read a processed file in chunks of DOWNLOAD_CHUNK_BYTES.
+    
+    Args:
+        file_info: processed_files entry (file on disk or content in memory)
+        
+    Yields:
+        bytes: Next chunk of the PDF
+    """
+    if "path" in file_info:
+        with open(file_info["path"], "rb") as f:
+            while True:
+                chunk = f.read(DOWNLOAD_CHUNK_BYTES)
+                if not chunk:
+                    return
+                yield chunk
+    else:
+        content = memoryview(file_info["content"])
+        for start in range(0, len(content), DOWNLOAD_CHUNK_BYTES):
+            yield content[start:start + DOWNLOAD_CHUNK_BYTES]
+
+
+def stream_zip(entries: list) -> Iterator[bytes]:
+    """
+    Write a ZIP archive piece by piece.
+    
+    The ZipFile writes to an unseekable stream, so sizes and checksums go
+    into data descriptors after each file and nothing has to be rewritten.
+    
+    Args:
+        entries: (archive name, processed_files entry) per file
+        
+    Yields:
+        bytes: Next part of the archive
+    """
+    stream = ZipStreamWriter()
+    # PDFs are compressed already - store them as they are
+    with zipfile.ZipFile(stream, "w", zipfile.ZIP_STORED) as archive:
+        for name, file_info in entries:
+            info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+            info.compress_type = zipfile.ZIP_STORED
+            if "path" in file_info:
+                info.file_size = os.path.getsize(file_info["path"])
+            else:
+                info.file_size = len(file_info["content"])
+            with archive.open(info, "w") as member:
+                for chunk in iter_file_chunks(file_info):
+                    member.write(chunk)
+                    yield stream.take()
+            yield stream.take()
+    yield stream.take()
+
+
+def corrected_filename(original_filename: str, style: Optional[str] = None) -> str:
+    """
+    File name of a processed PDF.
+    
+    Args:
+        original_filename: Name of the uploaded PDF
+        style: Output style to add to the name (for batches with more than one style)
+        
+    Returns:
+        str: "<name>_corrected.pdf" or "<name>_corrected_<style>.pdf"
+    """
+    suffix = f"_{style}" if style else ""
+    return f"{Path(original_filename).stem}_corrected{suffix}.pdf"
+
+
+def batch_archive_names(files: list) -> List[str]:
+    """
+    Unique names of the files of a batch in its ZIP archive.
+    
+    Args:
+        files: processed_files entries of the batch
+        
+    Returns:
+        list: Archive name per file, numbered if names repeat
+    """
+    several_styles = len({file_info.get("style") for file_info in files}) > 1
+    names = []
+    used = set()
+    for file_info in files:
+        name = corrected_filename(file_info["original_filename"],
+                                  file_info.get("style") if several_styles else None)
+        stem, number = name[:-len(".pdf")], 2
+        while name in used:
+            name = f"{stem}_{number}.pdf"
+            number += 1
+        used.add(name)
+        names.append(name)
+    return names
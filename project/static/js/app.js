@@ -152,16 +152,16 @@ async function handleFile(file) {
     // Store original file
     originalFile = file;
 
-    // Create FormData for REVIEW version (yellow highlights) - for preview
-    const formDataReview = new FormData();
-    formDataReview.append('file', file);
-    formDataReview.append('style', 'review');  // Yellow highlights for preview
+    // Create FormData for both versions - REVIEW (yellow) for preview, DOWNLOAD (white) for saving
+    const formData = new FormData();
+    formData.append('file', file);
+    formData.append('style', 'both');  // One upload and one analysis for both versions
 
     try {
-        // Upload and process REVIEW version (for preview)
+        // Upload and process both versions
         const response = await fetch('/api/process', {
             method: 'POST',
-            body: formDataReview
+            body: formData
         });
 
         if (!response.ok) {
@@ -218,7 +218,7 @@ async function handleFile(file) {
         }
 
         // Store REVIEW version (yellow highlights) for preview
-        const pdfResponse = await fetch(result.download_url);
+        const pdfResponse = await fetch(result.downloads.review.download_url);
         if (!pdfResponse.ok) {
             throw new Error('Failed to download processed PDF');
         }
@@ -226,16 +226,8 @@ async function handleFile(file) {
         reviewPdfBlob = await pdfResponse.blob();
         processedPdfName = file.name.replace('.pdf', '_corrected.pdf');
 
-        // Create DOWNLOAD version (white highlights) in background
-        const formDataDownload = new FormData();
-        formDataDownload.append('file', file);
-        formDataDownload.append('style', 'download');  // White highlights for download
-        
-        fetch('/api/process', {
-            method: 'POST',
-            body: formDataDownload
-        }).then(response => response.json())
-        .then(result => fetch(result.download_url))
+        // Fetch DOWNLOAD version (white highlights) in background
+        fetch(result.downloads.download.download_url)
         .then(pdfResponse => pdfResponse.blob())
         .then(blob => {
             downloadPdfBlob = blob;  // Store download version (white)